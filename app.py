@@ -5,19 +5,43 @@ Autor: UranoIA / Claudio Valdés Russu
 Versión: 1.0.0-beta
 """
 
+import time
+
+_BOOT_STARTED = time.perf_counter()
+
 import os
+import contextvars
+import csv
+import gzip
+import hashlib
+import io
+import itertools
 import json
 import re
 import logging
+import mimetypes
+import sqlite3
+import subprocess
+import sys
+import threading
+import uuid
 import requests
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from datetime import datetime
-from functools import wraps
+from functools import partial, wraps
 from typing import Optional
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-import google.generativeai as genai
+from werkzeug.security import safe_join
+
+try:
+    import fcntl  # POSIX only; limiter state stays per process without it
+except ImportError:
+    fcntl = None
 
 # ──────────────────────────────────────────────
 # CONFIG
@@ -28,16 +52,1746 @@ logging.basicConfig(
 )
 log = logging.getLogger("QSAR-LLM")
 
-app = Flask(__name__, static_folder=".", static_url_path="")
+# No implicit static folder: only the files routed under STATIC FILES are served
+app = Flask(__name__, static_folder=None)
 CORS(app, origins=["*"])  # Adjust for production
 
 # QSAR Toolbox REST API base URL (local installation)
 TOOLBOX_URL = os.environ.get("TOOLBOX_URL", "http://localhost:3000")
 
-# Google Gemini API key
+# PubChem PUG-REST base URL
+PUBCHEM_URL = os.environ.get("PUBCHEM_URL", "https://pubchem.ncbi.nlm.nih.gov/rest/pug")
+
+# Google Gemini API key (the SDK itself is imported on first use, see lazy_import)
 GEMINI_KEY = os.environ.get("GEMINI_API_KEY", "")
-if GEMINI_KEY:
-    genai.configure(api_key=GEMINI_KEY)
+
+# Gemini model used for reports, and the model tried when it fails
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.0-pro")
+GEMINI_FALLBACK_MODEL = os.environ.get("GEMINI_FALLBACK_MODEL", "gemini-pro")
+
+# Alternative Gemini API endpoint, reached over REST (e.g. the benchmark's stub LLM)
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT", "")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back on bad values."""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        log.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back on bad values."""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        log.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a true/false setting from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Per-upstream connection pool, timeout and retry policy
+UPSTREAM_CONFIG = {
+    "toolbox": {
+        "base_url": f"{TOOLBOX_URL}/api/v1",
+        "pool_size": _env_int("TOOLBOX_POOL_SIZE", 10),
+        "keepalive": _env_bool("TOOLBOX_KEEPALIVE", True),
+        "connect_timeout": _env_float("TOOLBOX_CONNECT_TIMEOUT", 5),
+        "get_timeout": _env_float("TOOLBOX_GET_TIMEOUT", 30),
+        "post_timeout": _env_float("TOOLBOX_POST_TIMEOUT", 60),
+        "retries": _env_int("TOOLBOX_RETRIES", 3),
+        "backoff": _env_float("TOOLBOX_BACKOFF", 1),
+        "rate": _env_float("TOOLBOX_RATE", 10),
+        "burst": _env_float("TOOLBOX_BURST", 10),
+        "max_concurrent": _env_int("TOOLBOX_MAX_CONCURRENT", 4),
+        "max_wait": _env_float("TOOLBOX_MAX_WAIT", 30),
+        "breaker_failures": _env_int("TOOLBOX_BREAKER_FAILURES", 3),
+        "breaker_reset": _env_float("TOOLBOX_BREAKER_RESET", 60),
+        "probe_path": "version",
+    },
+    "pubchem": {
+        "base_url": PUBCHEM_URL,
+        "pool_size": _env_int("PUBCHEM_POOL_SIZE", 10),
+        "keepalive": _env_bool("PUBCHEM_KEEPALIVE", True),
+        "connect_timeout": _env_float("PUBCHEM_CONNECT_TIMEOUT", 5),
+        "get_timeout": _env_float("PUBCHEM_GET_TIMEOUT", 10),
+        "post_timeout": _env_float("PUBCHEM_POST_TIMEOUT", 30),
+        "retries": _env_int("PUBCHEM_RETRIES", 2),
+        "backoff": _env_float("PUBCHEM_BACKOFF", 0.5),
+        "rate": _env_float("PUBCHEM_RATE", 5),
+        "burst": _env_float("PUBCHEM_BURST", 5),
+        "max_concurrent": _env_int("PUBCHEM_MAX_CONCURRENT", 10),
+        "max_wait": _env_float("PUBCHEM_MAX_WAIT", 15),
+        "breaker_failures": _env_int("PUBCHEM_BREAKER_FAILURES", 5),
+        "breaker_reset": _env_float("PUBCHEM_BREAKER_RESET", 60),
+        "probe_path": "compound/cid/962/property/MolecularFormula/TXT",
+    },
+}
+
+# ──────────────────────────────────────────────
+# LAZY IMPORTS & STARTUP REPORT
+# ──────────────────────────────────────────────
+# Heavy SDKs (google.generativeai pulls in grpc and protobuf) are imported on
+# first use so that workers serving only the UI, status and Toolbox proxies
+# boot without them.
+LAZY_IMPORTS: dict = {}   # module name -> seconds spent importing it
+_lazy_import_lock = threading.Lock()
+
+
+def lazy_import(name: str):
+    """Import `name` on first use and record how long it took."""
+    module = sys.modules.get(name)
+    if module is not None and name in LAZY_IMPORTS:
+        return module
+    with _lazy_import_lock:
+        if name not in LAZY_IMPORTS:
+            started = time.perf_counter()
+            __import__(name)
+            LAZY_IMPORTS[name] = time.perf_counter() - started
+            log.info(f"Lazy import {name}: {LAZY_IMPORTS[name] * 1000:.0f} ms")
+    return sys.modules[name]
+
+
+def import_time_report(module: str = "app", top: int = 25) -> dict:
+    """
+    Import `module` in a fresh interpreter with `-X importtime` and return
+    the slowest imports by cumulative time (microseconds), like the raw
+    `python -X importtime` output but sorted and trimmed. The child gets this
+    process's environment, so it boots exactly as a worker does.
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, timeout=120,
+    )
+    elapsed = time.perf_counter() - started
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            entries.append({
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip())) // 2,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+            })
+        except ValueError:
+            continue
+
+    entries.sort(key=lambda e: e["cumulative_us"], reverse=True)
+    return {
+        "module": module,
+        "returncode": proc.returncode,
+        "wall_seconds": round(elapsed, 3),
+        "total_us": next((e["cumulative_us"] for e in entries if e["module"] == module), None),
+        "imports": len(entries),
+        "top": entries[:top],
+    }
+
+
+def startup_report() -> dict:
+    return {
+        "boot_seconds": round(BOOT_SECONDS, 4) if BOOT_SECONDS is not None else None,
+        "lazy_imports": {name: round(seconds, 4) for name, seconds in LAZY_IMPORTS.items()},
+        "modules_loaded": len(sys.modules),
+    }
+
+
+BOOT_SECONDS: Optional[float] = None
+
+
+# ──────────────────────────────────────────────
+# METRICS & TIMING
+# ──────────────────────────────────────────────
+# Latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS: list = []
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """In-process Prometheus metric, one series per label combination."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: tuple = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in pairs) + "}"
+
+    def _render_series(self, key: tuple, value) -> list:
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key in sorted(self._series):
+                lines.extend(self._render_series(key, self._series[key]))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, key: tuple, value) -> list:
+        return [f"{self.name}{self._labels(key)} {value:g}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["sum"] += value
+
+    def _render_series(self, key: tuple, value) -> list:
+        lines = [
+            f"{self.name}_bucket{self._labels(key, [('le', f'{bound:g}')])} {count}"
+            for bound, count in zip(self.buckets, value["buckets"])
+        ]
+        lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {value['count']}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {value['sum']:.6f}")
+        lines.append(f"{self.name}_count{self._labels(key)} {value['count']}")
+        return lines
+
+
+HTTP_DURATION = Histogram(
+    "qsar_http_request_duration_seconds", "Time to build the response (streams: until headers are sent).",
+    ("route", "method", "status"),
+)
+STAGE_DURATION = Histogram(
+    "qsar_stage_duration_seconds", "Duration of analysis and chat stages.", ("stage",),
+)
+STAGE_RESULTS = Counter(
+    "qsar_stage_results_total", "Analysis stage outcomes (ok, empty, error, timeout, skipped, cached).",
+    ("stage", "status"),
+)
+UPSTREAM_DURATION = Histogram(
+    "qsar_upstream_request_duration_seconds", "Duration of Toolbox and PubChem HTTP calls.",
+    ("upstream", "method", "endpoint"),
+)
+UPSTREAM_RESPONSES = Counter(
+    "qsar_upstream_responses_total", "Upstream responses by HTTP status, or the error that replaced one.",
+    ("upstream", "status"),
+)
+ERRORS = Counter(
+    "qsar_errors_total", "Requests that ended in an error response.", ("route", "kind"),
+)
+RATE_LIMIT_WAIT = Histogram(
+    "qsar_upstream_rate_limit_wait_seconds", "Time calls waited for a rate-limit slot before running.",
+    ("upstream",),
+)
+
+_request_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """Timing spans of one request, reported in the Server-Timing header."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, desc: str = None) -> None:
+        with self._lock:
+            self.spans.append((name, seconds, desc))
+
+    def as_list(self) -> list:
+        with self._lock:
+            spans = list(self.spans)
+        return [
+            {"name": name, "ms": round(seconds * 1000, 1), **({"desc": desc} if desc else {})}
+            for name, seconds, desc in spans
+        ]
+
+    def server_timing(self) -> str:
+        parts = []
+        for span in self.as_list():
+            desc = span.get("desc", "").replace('"', "'")
+            parts.append(f'{span["name"]};desc="{desc}";dur={span["ms"]}' if desc else f'{span["name"]};dur={span["ms"]}')
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def start_request_timer() -> RequestTimer:
+    timer = RequestTimer()
+    _request_timer.set(timer)
+    return timer
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _request_timer.get()
+
+
+@contextmanager
+def span(name: str, desc: str = None):
+    """Time a stage: recorded in the request's Server-Timing and in qsar_stage_duration_seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timer = _request_timer.get()
+        if timer is not None:
+            timer.add(name, elapsed, desc)
+
+
+# Path segments followed by an identifier (PubChem namespaces, Toolbox resources)
+_IDENTIFIER_NAMESPACES = {"name", "cid", "sid", "smiles", "inchi", "inchikey", "formula", "substances"}
+
+
+def endpoint_label(path: str) -> str:
+    """Upstream path with identifiers replaced, to keep metric label cardinality bounded."""
+    path = path.split("?", 1)[0]
+    if path.startswith(("http://", "https://")):
+        path = path.split("/", 3)[-1]
+    segments = path.strip("/").split("/")
+    for i, segment in enumerate(segments):
+        after_namespace = i > 0 and segments[i - 1] in _IDENTIFIER_NAMESPACES and segment != "search"
+        if after_namespace or any(ch.isdigit() for ch in segment) or len(segment) > 40:
+            segments[i] = ":id"
+    return "/".join(segments[:4])
+
+
+def observe_upstream(upstream: str, method: str, path: str, seconds: float, status) -> None:
+    """Record one upstream call in the metrics and the current request's spans."""
+    endpoint = endpoint_label(path)
+    UPSTREAM_DURATION.observe(seconds, upstream=upstream, method=method.upper(), endpoint=endpoint)
+    UPSTREAM_RESPONSES.inc(upstream=upstream, status=status)
+    timer = _request_timer.get()
+    if timer is not None:
+        timer.add(upstream, seconds, f"{method.upper()} {endpoint} {status}")
+
+
+# ──────────────────────────────────────────────
+# RATE LIMITING
+# ──────────────────────────────────────────────
+# Directory for limiter state shared by gunicorn workers (empty = per process)
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR", os.path.join(".cache", "ratelimit"))
+
+
+class UpstreamBusy(Exception):
+    """Raised when a call could not get a rate-limit slot before its deadline."""
+
+
+class RateLimiter:
+    """
+    Token bucket plus concurrency cap for one upstream.
+
+    Callers queue in FIFO order within the process and give up with
+    UpstreamBusy after `max_wait` seconds. When RATE_LIMIT_DIR is set (and
+    fcntl is available) the bucket and the concurrency slots live in lock
+    files, so the limits hold across all gunicorn workers on the host.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrent: int,
+                 max_wait: float, shared_dir: str = ""):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.shared_dir = shared_dir if fcntl is not None else ""
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._active = 0
+        self._local = threading.local()
+        self.metrics = {
+            "acquired": 0, "timeouts": 0, "penalties": 0,
+            "queue_depth": 0, "max_queue_depth": 0,
+            "wait_total_s": 0.0, "wait_max_s": 0.0,
+        }
+
+    # — token bucket —
+
+    def _take_token(self) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        if self.shared_dir:
+            return self._take_shared_token()
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def _take_shared_token(self) -> float:
+        path = os.path.join(self.shared_dir, f"{self.name}.bucket")
+        with open(path, "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                fh.seek(0)
+                parts = fh.read().split()
+                now = time.time()
+                tokens, updated = (float(parts[0]), float(parts[1])) if len(parts) == 2 else (self.burst, now)
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                wait_s = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait_s = (1 - tokens) / self.rate
+                fh.seek(0)
+                fh.truncate()
+                fh.write(f"{tokens} {now}")
+                fh.flush()
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        return wait_s
+
+    def penalize(self, seconds: float) -> None:
+        """Empty the bucket for `seconds` after the upstream reported it is busy."""
+        if self.rate <= 0:
+            return
+        self.metrics["penalties"] += 1
+        debt = -seconds * self.rate
+        if self.shared_dir:
+            path = os.path.join(self.shared_dir, f"{self.name}.bucket")
+            with open(path, "a+") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    fh.seek(0)
+                    fh.truncate()
+                    fh.write(f"{debt} {time.time()}")
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+        else:
+            with self._cond:
+                self._tokens = debt
+                self._updated = time.monotonic()
+
+    # — concurrency slots —
+
+    def _try_slot(self) -> bool:
+        if self.max_concurrent <= 0:
+            return True
+        if not self.shared_dir:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return True
+            return False
+        for i in range(self.max_concurrent):
+            fh = open(os.path.join(self.shared_dir, f"{self.name}.slot{i}"), "a")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                continue
+            self._local.slot = fh
+            return True
+        return False
+
+    def _release_slot_locked(self) -> None:
+        """Give back a concurrency slot; the caller holds the condition lock."""
+        if self.max_concurrent <= 0:
+            return
+        if not self.shared_dir:
+            self._active -= 1
+            return
+        fh = getattr(self._local, "slot", None)
+        if fh is not None:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+            self._local.slot = None
+
+    # — public API —
+
+    @contextmanager
+    def slot(self):
+        """Hold one rate-limited, concurrency-capped slot for the duration of a call."""
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            self._record_queued(1)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if self._queue[0] is ticket:
+                        if self._try_slot():
+                            wait_s = self._take_token()
+                            if wait_s == 0:
+                                break
+                            self._release_slot_locked()
+                        else:
+                            wait_s = 0.05
+                    else:
+                        wait_s = remaining
+                    if remaining <= 0:
+                        self._record_timeout()
+                        raise UpstreamBusy(
+                            f"{self.name}: no rate-limit slot after {self.max_wait:.0f}s "
+                            f"({len(self._queue) - 1} callers ahead)"
+                        )
+                    self._cond.wait(min(wait_s, remaining))
+            finally:
+                self._queue.remove(ticket)
+                self._record_queued(-1)
+                self._cond.notify_all()
+
+            self._record_wait(time.monotonic() - started)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release_slot_locked()
+                self._cond.notify_all()
+
+    def take_token(self) -> float:
+        """Non-blocking token take for async callers; returns seconds to wait (0 = taken)."""
+        with self._cond:
+            return self._take_token()
+
+    def record_wait(self, waited: float) -> None:
+        with self._cond:
+            self._record_wait(waited)
+
+    def record_queued(self, delta: int) -> None:
+        """Count async callers (which do not use slot()) in and out of the queue depth."""
+        with self._cond:
+            self._record_queued(delta)
+
+    def _record_queued(self, delta: int) -> None:
+        self.metrics["queue_depth"] += delta
+        self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self.metrics["queue_depth"])
+
+    def record_timeout(self) -> None:
+        with self._cond:
+            self._record_timeout()
+
+    def _record_wait(self, waited: float) -> None:
+        RATE_LIMIT_WAIT.observe(waited, upstream=self.name)
+        self.metrics["acquired"] += 1
+        self.metrics["wait_total_s"] += waited
+        self.metrics["wait_max_s"] = max(self.metrics["wait_max_s"], waited)
+
+    def _record_timeout(self) -> None:
+        self.metrics["timeouts"] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            metrics = dict(self.metrics)
+        acquired = metrics["acquired"] or 1
+        metrics["wait_avg_s"] = round(metrics["wait_total_s"] / acquired, 4)
+        metrics["wait_total_s"] = round(metrics["wait_total_s"], 3)
+        metrics["wait_max_s"] = round(metrics["wait_max_s"], 3)
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "max_concurrent": self.max_concurrent,
+            "max_wait_s": self.max_wait,
+            "shared": bool(self.shared_dir),
+            **metrics,
+        }
+
+
+# ──────────────────────────────────────────────
+# CIRCUIT BREAKER
+# ──────────────────────────────────────────────
+BREAKER_PROBE_INTERVAL = _env_float("BREAKER_PROBE_INTERVAL", 10)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without touching the network while an upstream's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one upstream.
+
+    After `failure_threshold` consecutive connection failures, timeouts or 5xx
+    responses the circuit opens and calls fail fast. A background thread probes
+    the upstream every BREAKER_PROBE_INTERVAL seconds; a successful probe (or
+    `reset_timeout` elapsing) moves it to half-open, where a single trial call
+    decides whether it closes again or reopens; other callers keep failing
+    fast until that trial resolves (or is abandoned for `reset_timeout`).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.counters = {"opened": 0, "fast_failures": 0, "probes": 0, "probe_failures": 0}
+        self._lock = threading.Lock()
+        self._prober = None
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls should be skipped (open, or half-open with its trial call in flight)."""
+        with self._lock:
+            self._maybe_half_open()
+            return self.state == self.OPEN or self._trial_in_flight()
+
+    def _maybe_half_open(self) -> None:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.trial_started = 0.0
+
+    def _trial_in_flight(self) -> bool:
+        return (self.state == self.HALF_OPEN and self.trial_started > 0
+                and time.monotonic() - self.trial_started < self.reset_timeout)
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == self.OPEN or self._trial_in_flight():
+                self.counters["fast_failures"] += 1
+                return False
+            if self.state == self.HALF_OPEN:
+                self.trial_started = time.monotonic()
+            return True
+
+    def release(self) -> None:
+        """End a call that produced no verdict (throttled, limiter timeout...); a half-open trial is freed."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_started = 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info(f"Circuit {self.name}: closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_started = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_started = 0.0
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        if self.state != self.OPEN:
+            log.warning(f"Circuit {self.name}: open after {self.failures} failures, failing fast")
+            self.counters["opened"] += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        if self.probe and BREAKER_PROBE_INTERVAL > 0 and not (self._prober and self._prober.is_alive()):
+            self._prober = threading.Thread(target=self._probe_loop, name=f"probe-{self.name}", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self) -> None:
+        """Probe the upstream until it answers, then let traffic through again."""
+        while True:
+            time.sleep(BREAKER_PROBE_INTERVAL)
+            with self._lock:
+                if self.state != self.OPEN:
+                    return
+                self.counters["probes"] += 1
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy and self.state == self.OPEN:
+                    log.info(f"Circuit {self.name}: probe succeeded, half-open")
+                    self.state = self.HALF_OPEN
+                    self.trial_started = 0.0
+                    return
+                if not healthy:
+                    self.counters["probe_failures"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self.state,
+                "trial_in_flight": self._trial_in_flight(),
+                "consecutive_failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout,
+                **self.counters,
+            }
+
+# ──────────────────────────────────────────────
+# UPSTREAM HTTP CLIENTS
+# ──────────────────────────────────────────────
+
+def _create_session_with_retries(pool_size: int = 10, retries: int = 3,
+                                 backoff: float = 1, keepalive: bool = True,
+                                 status_forcelist: list = None) -> requests.Session:
+    """Create a requests session with automatic retries and a sized connection pool."""
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=status_forcelist or [429, 500, 502, 503, 504],
+        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry_strategy,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keepalive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+class UpstreamClient:
+    """
+    Long-lived, pooled HTTP client for one upstream (Toolbox or PubChem).
+
+    The underlying session is created lazily and once per worker process, so
+    gunicorn workers forked after import never share sockets. Pool hits are
+    requests served over an already open connection; misses are requests that
+    had to open a new one.
+    """
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.config = config
+        self.base_url = config["base_url"].rstrip("/")
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.limiter = RateLimiter(
+            name,
+            rate=config["rate"],
+            burst=config["burst"],
+            max_concurrent=config["max_concurrent"],
+            max_wait=config["max_wait"],
+            shared_dir=RATE_LIMIT_DIR,
+        )
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=config["breaker_failures"],
+            reset_timeout=config["breaker_reset"],
+            probe=self.probe,
+        )
+
+    @property
+    def session(self) -> requests.Session:
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = _create_session_with_retries(
+                        pool_size=self.config["pool_size"],
+                        retries=self.config["retries"],
+                        backoff=self.config["backoff"],
+                        keepalive=self.config["keepalive"],
+                        # 429/503 are retried through the rate limiter instead
+                        status_forcelist=[500, 502, 504],
+                    )
+                    self._pid = pid
+        return self._session
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def timeout(self, method: str) -> tuple:
+        read = self.config["post_timeout"] if method.upper() == "POST" else self.config["get_timeout"]
+        return (self.config["connect_timeout"], read)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"{self.name} circuit open, skipping {path}")
+        try:
+            return self._request(method, path, **kwargs)
+        finally:
+            # A half-open trial that ended without a verdict must not block the next one
+            self.breaker.release()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        timeout = kwargs.pop("timeout", None)
+        if timeout is None:
+            timeout = self.timeout(method)
+        for attempt in range(self.config["retries"] + 1):
+            try:
+                with self.limiter.slot():
+                    started = time.perf_counter()
+                    r = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                observe_upstream(self.name, method, path, time.perf_counter() - started, type(e).__name__)
+                self.breaker.record_failure()
+                raise
+            observe_upstream(self.name, method, path, time.perf_counter() - started, r.status_code)
+            if r.status_code in (500, 502, 504):
+                self.breaker.record_failure()
+            elif r.status_code not in (429, 503):
+                self.breaker.record_success()
+            if r.status_code not in (429, 503) or attempt == self.config["retries"]:
+                return r
+            # Upstream is throttling: hold back every caller, not just this one
+            try:
+                pause = float(r.headers.get("Retry-After", ""))
+            except ValueError:
+                pause = self.config["backoff"] * (2 ** attempt)
+            log.warning(f"{self.name} busy (HTTP {r.status_code}), pausing for {pause:.1f}s")
+            r.close()
+            self.limiter.penalize(pause)
+        return r
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def probe(self) -> bool:
+        """Cheap health check used by the circuit breaker; bypasses breaker, limiter and retries."""
+        r = requests.get(self.url(self.config["probe_path"]), timeout=(self.config["connect_timeout"], 5))
+        return r.status_code < 500
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def stats(self) -> dict:
+        """Connection pool hit/miss and rate limiter counters for this worker."""
+        connections = 0
+        requests_made = 0
+        session = self._session if self._pid == os.getpid() else None
+        if session is not None:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_made += pool.num_requests
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.config["pool_size"],
+            "keepalive": self.config["keepalive"],
+            "requests": requests_made,
+            "pool_hits": max(requests_made - connections, 0),
+            "pool_misses": connections,
+            "rate_limit": self.limiter.stats(),
+            "circuit": self.breaker.stats(),
+        }
+
+
+toolbox_client = UpstreamClient("toolbox", UPSTREAM_CONFIG["toolbox"])
+pubchem_client = UpstreamClient("pubchem", UPSTREAM_CONFIG["pubchem"])
+
+
+def upstream_stats() -> dict:
+    """Pool statistics for every upstream client of this worker."""
+    return {c.name: c.stats() for c in (toolbox_client, pubchem_client)}
+
+# ──────────────────────────────────────────────
+# LOOKUP CACHE (memory LRU + SQLite)
+# ──────────────────────────────────────────────
+LOOKUP_CACHE_ENABLED = _env_bool("LOOKUP_CACHE_ENABLED", True)
+LOOKUP_CACHE_PATH = os.environ.get("LOOKUP_CACHE_PATH", os.path.join(".cache", "lookup_cache.sqlite3"))
+LOOKUP_CACHE_MEMORY_ENTRIES = _env_int("LOOKUP_CACHE_MEMORY_ENTRIES", 512)
+# Larger values (e.g. data matrices) are only kept in SQLite, not in every worker's memory
+LOOKUP_CACHE_MEMORY_ITEM_KB = _env_float("LOOKUP_CACHE_MEMORY_ITEM_KB", 256)
+LOOKUP_CACHE_DISK_MB = _env_float("LOOKUP_CACHE_DISK_MB", 256)
+TOOLBOX_VERSION_CHECK_INTERVAL = _env_float("TOOLBOX_VERSION_CHECK_INTERVAL", 300)
+
+# Time-to-live per cached source, in seconds
+LOOKUP_TTL = {
+    "pubchem": _env_float("LOOKUP_TTL_PUBCHEM", 7 * 24 * 3600),
+    "pubchem_cid": _env_float("LOOKUP_TTL_PUBCHEM_CID", 30 * 24 * 3600),
+    "toolbox_search": _env_float("LOOKUP_TTL_TOOLBOX_SEARCH", 24 * 3600),
+    "profiling": _env_float("LOOKUP_TTL_PROFILING", 24 * 3600),
+    "category": _env_float("LOOKUP_TTL_CATEGORY", 24 * 3600),
+    "datamatrix": _env_float("LOOKUP_TTL_DATAMATRIX", 3600),
+}
+
+# Sources whose results depend on the Toolbox version and its databases
+TOOLBOX_SOURCES = ("toolbox_search", "profiling", "category", "datamatrix")
+
+
+# Warm-up bookkeeping of the current context (see LookupCache.recording): (keys, refresh) or None
+_lookup_recording = contextvars.ContextVar("lookup_recording", default=None)
+
+
+def normalize_identifier(identifier: str) -> str:
+    """Normalize a CAS number or chemical name for use in cache keys."""
+    return " ".join(str(identifier).strip().lower().split())
+
+
+class LookupCache:
+    """
+    Two-tier cache for upstream lookups.
+
+    An in-process LRU sits in front of a SQLite file shared by all gunicorn
+    workers and kept across restarts. Entries expire after the TTL of their
+    source, the disk tier is trimmed by least recent access once it grows past
+    its size limit, and Toolbox-derived entries are dropped when the Toolbox
+    version changes. Values whose JSON is larger than `memory_item_bytes`
+    skip the in-process tier, so the LRU's footprint stays bounded.
+    """
+
+    def __init__(self, path: str, memory_entries: int, disk_bytes: int, ttl: dict,
+                 enabled: bool = True, memory_item_bytes: int = None):
+        self.enabled = enabled
+        self.path = path
+        self.memory_entries = memory_entries
+        self.memory_item_bytes = memory_item_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._toolbox_version = None
+        self._version_checked = 0.0
+        self.counters = {
+            source: {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+            for source in ttl
+        }
+
+    # — storage —
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, source TEXT, value TEXT, size INTEGER,"
+                " expires REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(source: str, identifier: str, payload: dict = None) -> str:
+        key = f"{source}:{normalize_identifier(identifier)}"
+        if payload:
+            key += ":" + json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return key
+
+    def get(self, source: str, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters[source]["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        try:
+            db = self._db()
+            row = db.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                db.commit()
+                value = json.loads(row[0])
+                self._remember(key, value, row[1], len(row[0]))
+                with self._lock:
+                    self.counters[source]["disk_hits"] += 1
+                return value
+        except sqlite3.Error as e:
+            log.warning(f"Lookup cache read failed: {e}")
+
+        with self._lock:
+            self.counters[source]["misses"] += 1
+        return None
+
+    def set(self, source: str, key: str, value) -> None:
+        now = time.time()
+        expires = now + self.ttl[source]
+        try:
+            blob = json.dumps(value, ensure_ascii=False)
+            self._remember(key, value, expires, len(blob))
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, source, value, size, expires, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, source, blob, len(blob), expires, now),
+            )
+            db.commit()
+            self._writes += 1
+            if self._writes % 50 == 0:
+                self._evict(db)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            log.warning(f"Lookup cache write failed: {e}")
+
+    def _remember(self, key: str, value, expires: float, size: int) -> None:
+        if self.memory_item_bytes is not None and size > self.memory_item_bytes:
+            return
+        with self._lock:
+            self._memory[key] = (expires, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        """Drop expired rows, then least recently used rows over the size limit."""
+        db.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.disk_bytes:
+            excess = total - self.disk_bytes
+            freed = 0
+            victims = []
+            for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            db.executemany("DELETE FROM entries WHERE key = ?", victims)
+        db.commit()
+
+    # — helpers —
+
+    def lookup(self, source: str, identifier: str, payload: dict = None):
+        """Return the cached value for an identifier, or None."""
+        if not self.enabled:
+            return None
+        recording = _lookup_recording.get()
+        if recording is not None and recording[1]:
+            return None
+        if source in TOOLBOX_SOURCES:
+            self.refresh_toolbox_version()
+        key = self.make_key(source, identifier, payload)
+        value = self.get(source, key)
+        if value is not None and recording is not None:
+            recording[0].append(key)
+        return value
+
+    def store(self, source: str, identifier: str, value, payload: dict = None) -> None:
+        """Cache a non-empty value for an identifier."""
+        if self.enabled and value:
+            key = self.make_key(source, identifier, payload)
+            self.set(source, key, value)
+            recording = _lookup_recording.get()
+            if recording is not None:
+                recording[0].append(key)
+
+    @property
+    def refreshing(self) -> bool:
+        """True inside a `recording(refresh=True)` block."""
+        recording = _lookup_recording.get()
+        return recording is not None and recording[1]
+
+    @contextmanager
+    def recording(self, refresh: bool = False):
+        """
+        Collect the keys this context reads from or writes to the cache.
+
+        Yields the list the keys are appended to; stage threads started with
+        a copy of the context add to it too. With `refresh`, lookups miss,
+        so every value is fetched again and stored with a new expiry.
+        """
+        keys = []
+        token = _lookup_recording.set((keys, refresh))
+        try:
+            yield keys
+        finally:
+            _lookup_recording.reset(token)
+
+    def expiries(self, keys) -> dict:
+        """Expiry time of each of `keys` still stored and unexpired on disk."""
+        keys = list(keys)
+        found = {}
+        try:
+            db = self._db()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                found.update(db.execute(
+                    f"SELECT key, expires FROM entries WHERE key IN ({','.join('?' * len(chunk))}) AND expires > ?",
+                    (*chunk, time.time()),
+                ))
+        except sqlite3.Error as e:
+            log.warning(f"Lookup cache read failed: {e}")
+        return found
+
+    def get_or_compute(self, source: str, identifier: str, fn, payload: dict = None):
+        """Return the cached value or call `fn` and cache a non-empty result."""
+        value = self.lookup(source, identifier, payload)
+        if value is not None:
+            return value
+        value = fn()
+        self.store(source, identifier, value, payload)
+        return value
+
+    def set_toolbox_version(self, version: Optional[str]) -> None:
+        """Invalidate Toolbox-derived entries when the reported version changes."""
+        if not version:
+            return
+        self._version_checked = time.time()
+        if version == self._toolbox_version:
+            return
+        try:
+            db = self._db()
+            row = db.execute("SELECT value FROM meta WHERE name = 'toolbox_version'").fetchone()
+            previous = row[0] if row else None
+            if previous and previous != version:
+                log.info(f"Toolbox version changed ({previous} → {version}), invalidating cached Toolbox results")
+                placeholders = ",".join("?" * len(TOOLBOX_SOURCES))
+                db.execute(f"DELETE FROM entries WHERE source IN ({placeholders})", TOOLBOX_SOURCES)
+                with self._lock:
+                    prefixes = tuple(f"{s}:" for s in TOOLBOX_SOURCES)
+                    for key in [k for k in self._memory if k.startswith(prefixes)]:
+                        del self._memory[key]
+            db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('toolbox_version', ?)", (version,))
+            db.commit()
+        except sqlite3.Error as e:
+            log.warning(f"Lookup cache version check failed: {e}")
+        self._toolbox_version = version
+
+    def refresh_toolbox_version(self) -> None:
+        """Ask the Toolbox for its version at most every TOOLBOX_VERSION_CHECK_INTERVAL seconds."""
+        if time.time() - self._version_checked < TOOLBOX_VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked = time.time()
+        try:
+            r = toolbox_client.get("version", timeout=4)
+            if r.ok:
+                self.set_toolbox_version(r.json().get("version"))
+        except Exception:
+            pass
+
+    @property
+    def toolbox_version(self) -> Optional[str]:
+        """Current Toolbox version (re-checked at most every TOOLBOX_VERSION_CHECK_INTERVAL)."""
+        self.refresh_toolbox_version()
+        return self._toolbox_version
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {source: dict(c) for source, c in self.counters.items()}
+            memory_entries = len(self._memory)
+        return {
+            "enabled": self.enabled,
+            "toolbox_version": self._toolbox_version,
+            "memory_entries": memory_entries,
+            "sources": counters,
+        }
+
+
+lookup_cache = LookupCache(
+    LOOKUP_CACHE_PATH,
+    memory_entries=LOOKUP_CACHE_MEMORY_ENTRIES,
+    disk_bytes=int(LOOKUP_CACHE_DISK_MB * 1024 * 1024),
+    ttl=LOOKUP_TTL,
+    enabled=LOOKUP_CACHE_ENABLED,
+    memory_item_bytes=int(LOOKUP_CACHE_MEMORY_ITEM_KB * 1024),
+)
+
+# Generated reports, keyed by query, language, model and analysis context
+LLM_CACHE_ENABLED = _env_bool("LLM_CACHE_ENABLED", True)
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL = _env_float("LLM_CACHE_TTL", 24 * 3600)
+LLM_CACHE_MEMORY_ENTRIES = _env_int("LLM_CACHE_MEMORY_ENTRIES", 128)
+LLM_CACHE_DISK_MB = _env_float("LLM_CACHE_DISK_MB", 64)
+
+llm_cache = LookupCache(
+    LLM_CACHE_PATH,
+    memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+    disk_bytes=int(LLM_CACHE_DISK_MB * 1024 * 1024),
+    ttl={"llm": LLM_CACHE_TTL},
+    enabled=LLM_CACHE_ENABLED,
+)
+
+# ──────────────────────────────────────────────
+# IDENTIFIERS (CAS validation and normalization)
+# ──────────────────────────────────────────────
+# Canonical CAS Registry Number: 2-7 digits, 2 digits, check digit
+CAS_PATTERN = re.compile(r"\b(\d{2,7}-\d{2}-\d)\b")
+
+# CAS-like tokens as typed by users: any dash variant, optional spaces around it (same
+# first-segment length as CAS_PATTERN, so anything longer is not reported as a CAS at all)
+_CAS_CANDIDATE = re.compile(r"(?<![\d-])(\d{2,7})\s*[-‐‑‒–—−]\s*(\d{2})\s*[-‐‑‒–—−]\s*(\d)(?![\d-])")
+
+
+def cas_check_digit_ok(cas: str) -> bool:
+    """True when the last digit of a CAS number matches its checksum."""
+    digits = cas.replace("-", "")
+    if not digits.isdigit() or len(digits) < 5:
+        return False
+    body, check = digits[:-1], int(digits[-1])
+    return sum(int(d) * i for i, d in enumerate(reversed(body), start=1)) % 10 == check
+
+
+def _cas_from_parts(first: str, second: str, check: str) -> str:
+    first = first.lstrip("0") or "0"
+    return f"{first}-{second}-{check}"
+
+
+def normalize_cas(value: str) -> Optional[str]:
+    """
+    Canonical form of a CAS number typed as a whole identifier, or None.
+
+    Accepts dash variants, spaces around the dashes, leading zeros and the
+    undashed form ("50000" → "50-00-0"). Returns None when the value is not
+    CAS-shaped or its check digit is wrong.
+    """
+    text = str(value).strip()
+    match = _CAS_CANDIDATE.fullmatch(text)
+    if match:
+        cas = _cas_from_parts(*match.groups())
+    elif text.isdigit() and 5 <= len(text) <= 10:
+        cas = _cas_from_parts(text[:-3], text[-3:-1], text[-1])
+    else:
+        return None
+    if not CAS_PATTERN.fullmatch(cas) or not cas_check_digit_ok(cas):
+        return None
+    return cas
+
+
+def looks_like_cas(value: str) -> bool:
+    """True for CAS-shaped input (dashed), whether or not its check digit is valid."""
+    return bool(_CAS_CANDIDATE.fullmatch(str(value).strip()))
+
+
+def extract_identifiers(query: str) -> dict:
+    """
+    Every CAS number mentioned in a query, normalized and checked.
+
+    Returns {"cas": [valid, in order, unique], "invalid_cas": [as typed]}.
+    """
+    valid, invalid = [], []
+    for match in _CAS_CANDIDATE.finditer(query):
+        cas = _cas_from_parts(*match.groups())
+        if CAS_PATTERN.fullmatch(cas) and cas_check_digit_ok(cas):
+            if cas not in valid:
+                valid.append(cas)
+        else:
+            invalid.append(match.group(0))
+    return {"cas": valid, "invalid_cas": invalid}
+
+
+def checked_cas(value) -> str:
+    """Normalized CAS from a request field; raises ValueError with the client message."""
+    if not value:
+        raise ValueError("CAS requerido")
+    cas = normalize_cas(value)
+    if cas is None:
+        raise ValueError(f"CAS inválido: {value} (formato o dígito de control incorrecto)")
+    return cas
+
+
+def checked_identifier(value) -> str:
+    """CAS (normalized) or name from a request field; CAS-shaped input must have a valid check digit."""
+    text = " ".join(str(value or "").split())
+    if looks_like_cas(text):
+        return checked_cas(text)
+    return text
+
+
+# ──────────────────────────────────────────────
+# SUBSTANCE IDENTITY INDEX
+# ──────────────────────────────────────────────
+IDENTITY_INDEX_ENABLED = _env_bool("IDENTITY_INDEX_ENABLED", True)
+IDENTITY_INDEX_PATH = os.environ.get("IDENTITY_INDEX_PATH", os.path.join(".cache", "identity_index.sqlite3"))
+IDENTITY_INDEX_MMAP_MB = _env_int("IDENTITY_INDEX_MMAP_MB", 256)
+
+# Seconds /api/status reuses the identity index row counts before counting again
+IDENTITY_STATS_TTL = 30
+
+
+# Longest run of words tried when looking for a known name inside a query
+IDENTITY_MAX_NAME_WORDS = 5
+IDENTITY_MAX_QUERY_WORDS = 100
+# Shortest name matched inside a query (also needs a letter: bare numbers never match)
+IDENTITY_MIN_NAME_LENGTH = 4
+
+# Curated names and synonyms that are also everyday or query words, never matched inside a query
+IDENTITY_STOP_WORDS = frozenset("""
+    agua water sal salt sales salts aceite oil azúcar azucar sugar alcohol ácido acido acid base bases
+    oro gold plata silver hierro iron plomo lead cobre copper zinc estaño tin aire air oxígeno oxigeno oxygen
+    sustancia sustancias substance substances compuesto compound producto product mezcla mixture
+    metabolito metabolite metabolitos metabolites solvente solvent control blanco blank ensayo test
+    perfil profile toxicidad toxicity datos data informe report análisis analisis analysis
+    compara compare evalúa evalua evaluate para como with from that this
+""".split())
+
+# Alias kinds: curated names and synonyms come from imported dumps; "query" aliases are whatever
+# text a user searched for, and only ever resolve that exact text
+IDENTITY_TEXT_KINDS = ("name", "synonym")
+
+
+class IdentityIndex:
+    """
+    Local substance identity index: CAS numbers, names and synonyms mapped to
+    PubChem CID, formula, MW, XLogP and SMILES.
+
+    Stored in a SQLite file read through memory-mapped I/O (one connection per
+    thread, shared by all workers), so a resolution is an indexed lookup in
+    mapped pages with no network round trip. Every successful PubChem lookup
+    adds its identifiers; dumps are loaded with import_csv / import_sdf.
+    Substances learnt from PubChem stop resolving `max_age` seconds after
+    they were last fetched (the PubChem lookup TTL), so the next lookup asks
+    PubChem again and replaces them; imported substances never expire.
+    Aliases are stored normalized (see normalize_identifier) with their kind
+    (name, synonym, cas, smiles or query); only curated names and synonyms
+    are looked for inside free text.
+    """
+
+    def __init__(self, path: str, mmap_bytes: int, enabled: bool = True, max_age: float = None):
+        self.enabled = enabled
+        self.path = path
+        self.mmap_bytes = mmap_bytes
+        self.max_age = max_age
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sizes = (0.0, None)
+        self.counters = {"hits": 0, "misses": 0, "added": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS substances ("
+                " id INTEGER PRIMARY KEY, cid INTEGER UNIQUE, cas TEXT, name TEXT, formula TEXT,"
+                " mw TEXT, xlogp TEXT, smiles TEXT, iupac TEXT, source TEXT, updated REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " alias TEXT PRIMARY KEY, substance_id INTEGER NOT NULL,"
+                " kind TEXT NOT NULL DEFAULT 'query') WITHOUT ROWID"
+            )
+            if "kind" not in {row[1] for row in conn.execute("PRAGMA table_info(aliases)")}:
+                # Indexes from before alias kinds: nothing there is known to be curated
+                try:
+                    conn.execute("ALTER TABLE aliases ADD COLUMN kind TEXT NOT NULL DEFAULT 'query'")
+                except sqlite3.OperationalError:
+                    pass   # another worker added it first
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _record(row) -> dict:
+        _, cid, cas, name, formula, mw, xlogp, smiles, iupac = row
+        record = _pubchem_record({
+            "CID": cid, "MolecularFormula": formula, "MolecularWeight": mw if mw else "N/D",
+            "XLogP": xlogp if xlogp not in (None, "") else "N/D", "IsomericSMILES": smiles, "IUPACName": iupac,
+        })
+        record["cas"] = cas
+        record["name"] = name
+        return record
+
+    def resolve(self, identifier: str) -> Optional[dict]:
+        """Identity record for a CAS number, name, synonym or SMILES, or None."""
+        if not self.enabled or not identifier:
+            return None
+        fetched_after = time.time() - self.max_age if self.max_age is not None else 0
+        try:
+            row = self._db().execute(
+                "SELECT s.id, s.cid, s.cas, s.name, s.formula, s.mw, s.xlogp, s.smiles, s.iupac"
+                " FROM aliases a JOIN substances s ON s.id = a.substance_id"
+                " WHERE a.alias = ? AND (s.source IS NOT 'pubchem' OR s.updated > ?)",
+                (normalize_identifier(identifier), fetched_after),
+            ).fetchone()
+        except sqlite3.Error as e:
+            log.warning(f"Identity index read failed: {e}")
+            return None
+        with self._lock:
+            self.counters["hits" if row else "misses"] += 1
+        return self._record(row) if row else None
+
+    def _phrases(self, text: str) -> dict:
+        """
+        Every run of up to IDENTITY_MAX_NAME_WORDS words specific enough to be
+        a name, as {phrase: [(start word, size)]}.
+        """
+        words = [w.strip(".,;:!?¿¡\"'()") for w in text.split()]
+        words = [w for w in words if w][:IDENTITY_MAX_QUERY_WORDS]
+        phrases = {}
+        for size in range(min(IDENTITY_MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                phrase = normalize_identifier(" ".join(words[start:start + size]))
+                if (len(phrase) < IDENTITY_MIN_NAME_LENGTH or not any(c.isalpha() for c in phrase)
+                        or all(w in IDENTITY_STOP_WORDS for w in phrase.split())):
+                    continue
+                phrases.setdefault(phrase, []).append((start, size))
+        return phrases
+
+    def _known_aliases(self, phrases) -> list:
+        """The phrases that are curated names or synonyms."""
+        if not phrases:
+            return []
+        try:
+            rows = self._db().execute(
+                f"SELECT alias FROM aliases WHERE alias IN ({','.join('?' * len(phrases))})"
+                f" AND kind IN ({','.join('?' * len(IDENTITY_TEXT_KINDS))})",
+                [*phrases, *IDENTITY_TEXT_KINDS],
+            ).fetchall()
+        except sqlite3.Error as e:
+            log.warning(f"Identity index read failed: {e}")
+            return []
+        return [r[0] for r in rows]
+
+    def find_in_text(self, text: str) -> Optional[tuple]:
+        """
+        Longest curated name mentioned in free text, as (alias, record).
+
+        Tries every run of up to IDENTITY_MAX_NAME_WORDS words in one query;
+        stop words, very short phrases and aliases that only come from earlier
+        lookups never match.
+        """
+        if not self.enabled:
+            return None
+        phrases = self._phrases(text)
+        aliases = self._known_aliases(phrases)
+        if not aliases:
+            return None
+        alias = max(aliases, key=lambda a: (phrases[a][0][1], len(a)))
+        record = self.resolve(alias)
+        return (alias, record) if record else None
+
+    def find_all_in_text(self, text: str) -> list:
+        """
+        Every curated name mentioned in free text, as [(alias, record)] in text order.
+
+        Overlapping mentions keep the longest name; each substance appears once.
+        """
+        if not self.enabled:
+            return []
+        phrases = self._phrases(text)
+        mentions = sorted(
+            (start, -size, alias)
+            for alias in self._known_aliases(phrases)
+            for start, size in phrases[alias]
+        )
+        found, taken, seen = [], set(), set()
+        for start, neg_size, alias in mentions:
+            words = set(range(start, start - neg_size))
+            if words & taken:
+                continue
+            taken |= words
+            record = self.resolve(alias)
+            key = record and (record.get("cid") or record.get("cas") or alias)
+            if record and key not in seen:
+                seen.add(key)
+                found.append((alias, record))
+        return found
+
+    def add(self, record: dict, aliases=(), cas: str = None, source: str = "pubchem", db=None,
+            curated: bool = False) -> None:
+        """
+        Add or update a substance and point `aliases` (plus its CAS and SMILES) at it.
+
+        `aliases` are stored as synonyms when `curated` (imported dumps) and as
+        query aliases otherwise; a query alias never replaces a curated one.
+        """
+        if not self.enabled or not record:
+            return
+        cas = cas or record.get("cas")
+        mw = str(record.get("mw") or "").replace(" g/mol", "")
+        values = {
+            "cid": record.get("cid"),
+            "cas": cas,
+            "name": record.get("name") or next(
+                (a for a in aliases if a and not CAS_PATTERN.fullmatch(str(a).strip())), None
+            ),
+            "formula": record.get("formula"),
+            "mw": None if mw in ("", "N/D") else mw,
+            "xlogp": None if record.get("logKow") in (None, "", "N/D") else str(record.get("logKow")),
+            "smiles": record.get("smiles"),
+            "iupac": record.get("iupac"),
+        }
+        keys = {}   # alias -> kind, the later kinds taking precedence
+        for kind, names in (("synonym" if curated else "query", aliases), ("smiles", [record.get("smiles")]),
+                            ("cas", [cas]), ("name", [record.get("name")])):
+            keys.update((normalize_identifier(a), kind) for a in names if a)
+        commit = db is None
+        try:
+            db = db or self._db()
+            row = None
+            if values["cid"]:
+                row = db.execute("SELECT id, source FROM substances WHERE cid = ?", (values["cid"],)).fetchone()
+            if row is None and cas:
+                row = db.execute("SELECT id, source FROM substances WHERE cas = ?", (cas,)).fetchone()
+            if row is None:
+                substance_id = db.execute(
+                    "INSERT INTO substances (cid, cas, name, formula, mw, xlogp, smiles, iupac, source, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*values.values(), source, time.time()),
+                ).lastrowid
+            else:
+                substance_id, known_source = row
+                # A fresh PubChem answer replaces what PubChem said before; otherwise
+                # keep what is already known and fill in what was missing
+                merge = "COALESCE(?, {0})" if source == known_source == "pubchem" else "COALESCE({0}, ?)"
+                db.execute(
+                    "UPDATE substances SET " + ", ".join(f"{k} = " + merge.format(k) for k in values)
+                    + ", source = ?, updated = ? WHERE id = ?",
+                    # Imported data makes the substance curated (it no longer expires)
+                    (*values.values(), known_source if source == "pubchem" else source, time.time(), substance_id),
+                )
+            db.executemany(
+                "INSERT INTO aliases (alias, substance_id, kind) VALUES (?, ?, ?)"
+                " ON CONFLICT(alias) DO UPDATE SET substance_id = excluded.substance_id, kind = excluded.kind"
+                " WHERE excluded.kind != 'query' OR aliases.kind = 'query'",
+                [(alias, substance_id, kind) for alias, kind in keys.items()],
+            )
+            if commit:
+                db.commit()
+            with self._lock:
+                self.counters["added"] += 1
+        except sqlite3.Error as e:
+            log.warning(f"Identity index write failed: {e}")
+
+    def import_rows(self, rows, source: str) -> int:
+        """Bulk add curated (record, aliases, cas) tuples in one transaction; returns the count."""
+        db = self._db()
+        count = 0
+        for record, aliases, cas in rows:
+            self.add(record, aliases, cas=cas, source=source, db=db, curated=True)
+            count += 1
+        db.commit()
+        return count
+
+    def import_csv(self, path: str) -> int:
+        """
+        Import a CSV with a header row. Recognized columns (case-insensitive):
+        cas, name, synonyms (separated by | or ;), cid, formula, mw, xlogp,
+        smiles, iupac.
+        """
+        def rows():
+            with open(path, newline="", encoding="utf-8") as f:
+                for raw in csv.DictReader(f):
+                    row = {k.strip().lower(): (v or "").strip() for k, v in raw.items() if isinstance(k, str)}
+                    synonyms = [s.strip() for s in re.split(r"[|;]", row.get("synonyms", "")) if s.strip()]
+                    yield _identity_record(row), [row.get("name"), *synonyms], row.get("cas") or None
+
+        return self.import_rows(rows(), source=f"csv:{os.path.basename(path)}")
+
+    def import_sdf(self, path: str) -> int:
+        """Import an SDF dump (PubChem field names, plus CAS / SYNONYMS / NAME fields if present)."""
+        def rows():
+            with open(path, encoding="utf-8", errors="replace") as f:
+                block = []
+                for line in f:
+                    if line.startswith("$$$$"):
+                        yield _sdf_entry(block)
+                        block = []
+                    else:
+                        block.append(line.rstrip("\n"))
+
+        return self.import_rows(rows(), source=f"sdf:{os.path.basename(path)}")
+
+    def sizes(self) -> tuple:
+        """(substances, aliases) row counts, recounted at most every IDENTITY_STATS_TTL seconds."""
+        counted, sizes = self._sizes
+        if sizes is None or time.monotonic() - counted > IDENTITY_STATS_TTL:
+            try:
+                db = self._db()
+                sizes = (db.execute("SELECT COUNT(*) FROM substances").fetchone()[0],
+                         db.execute("SELECT COUNT(*) FROM aliases").fetchone()[0])
+            except sqlite3.Error:
+                return None, None
+            self._sizes = (time.monotonic(), sizes)
+        return sizes
+
+    def stats(self) -> dict:
+        substances, aliases = self.sizes()
+        with self._lock:
+            counters = dict(self.counters)
+        return {"enabled": self.enabled, "substances": substances, "aliases": aliases, **counters}
+
+
+def _identity_record(row: dict) -> dict:
+    """Identity record (same shape as _pubchem_record) from an import row with lowercase keys."""
+    cid = row.get("cid") or row.get("pubchem_compound_cid")
+    return {
+        "cid": int(cid) if str(cid or "").isdigit() else None,
+        "name": row.get("name") or None,
+        "formula": row.get("formula") or row.get("pubchem_molecular_formula") or None,
+        "mw": row.get("mw") or row.get("pubchem_molecular_weight") or None,
+        "logKow": row.get("xlogp") or row.get("pubchem_xlogp3") or row.get("pubchem_xlogp3_aa") or None,
+        "smiles": (row.get("smiles") or row.get("pubchem_openeye_iso_smiles")
+                   or row.get("pubchem_smiles") or row.get("pubchem_openeye_can_smiles") or None),
+        "iupac": row.get("iupac") or row.get("pubchem_iupac_name") or None,
+    }
+
+
+def _sdf_entry(lines: list) -> tuple:
+    """(record, aliases, cas) from the lines of one SDF record."""
+    fields = {}
+    name = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith(">"):
+            match = re.search(r"<([^>]+)>", line)
+            values = []
+            i += 1
+            while i < len(lines) and lines[i].strip():
+                values.append(lines[i].strip())
+                i += 1
+            if match:
+                fields[match.group(1).strip().lower()] = values
+        elif i == 0 and line.strip() and not line.strip().isdigit():
+            # PubChem dumps put the CID in the title line; other tools put the name
+            name = line.strip()
+        i += 1
+
+    row = {k: v[0] if v else "" for k, v in fields.items()}
+    synonyms = fields.get("synonyms") or fields.get("pubchem_synonyms") or []
+    row.setdefault("name", name or (synonyms[0] if synonyms else ""))
+    cas = row.get("cas") or row.get("cas_rn") or next((s for s in synonyms if CAS_PATTERN.fullmatch(s)), None)
+    return _identity_record(row), [row.get("name"), *synonyms], cas
+
+
+identity_index = IdentityIndex(
+    IDENTITY_INDEX_PATH, IDENTITY_INDEX_MMAP_MB * 1024 * 1024, IDENTITY_INDEX_ENABLED, max_age=LOOKUP_TTL["pubchem"],
+)
+
+# ──────────────────────────────────────────────
+# REQUEST COALESCING (single-flight)
+# ──────────────────────────────────────────────
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse identical concurrent upstream calls into one in-flight request.
+
+    The first caller for a key runs the call; callers arriving while it is in
+    flight wait for it and share its result (or its exception). Coalescing is
+    per worker process; across workers the lookup cache absorbs repeats.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.counters = {}
+
+    @staticmethod
+    def make_key(upstream: str, method: str, endpoint: str, payload=None) -> str:
+        canonical = json.dumps(payload or {}, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{upstream}:{method}:{endpoint}:{canonical}"
+
+    def _counters(self, upstream: str) -> dict:
+        return self.counters.setdefault(upstream, {"calls": 0, "deduplicated": 0, "in_flight": 0})
+
+    def record(self, upstream: str, deduplicated: bool) -> None:
+        """Count a call coalesced elsewhere (the ASGI mode keeps its own flights)."""
+        with self._lock:
+            counters = self._counters(upstream)
+            counters["calls"] += 1
+            counters["deduplicated"] += int(deduplicated)
+
+    def do(self, upstream: str, key: str, fn):
+        with self._lock:
+            counters = self._counters(upstream)
+            counters["calls"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                counters["in_flight"] += 1
+            else:
+                counters["deduplicated"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                counters["in_flight"] -= 1
+            flight.event.set()
+        return flight.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {upstream: dict(c) for upstream, c in self.counters.items()}
+
+
+single_flight = SingleFlight()
 
 # ──────────────────────────────────────────────
 # AUTH MIDDLEWARE (disabled for beta)
@@ -49,119 +1803,490 @@ def require_key(f):
         return f(*args, **kwargs)
     return decorated
 
+# ──────────────────────────────────────────────
+# REQUEST BODIES
+# ──────────────────────────────────────────────
+class InvalidJSON(Exception):
+    """Request body that is not a JSON object (answered with 400 by invalid_json)."""
+
+
+def read_json() -> dict:
+    """Parse the body as a JSON object regardless of Content-Type; an empty body reads as {}."""
+    raw = request.get_data(cache=True)
+    if not raw.strip():
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise InvalidJSON()
+    if not isinstance(body, dict):
+        raise InvalidJSON()
+    return body
+
+
+@app.errorhandler(InvalidJSON)
+def invalid_json(error):
+    return jsonify({"error": "JSON inválido"}), 400
+
 # ──────────────────────────────────────────────
 # STATIC FILES
 # ──────────────────────────────────────────────
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.environ.get("STATIC_DIR", os.path.join(APP_DIR, "static"))
+STATIC_MAX_AGE = _env_int("STATIC_MAX_AGE", 365 * 24 * 3600)
+STATIC_GZIP_LEVEL = _env_int("STATIC_GZIP_LEVEL", 9)
+STATIC_BROTLI_QUALITY = _env_int("STATIC_BROTLI_QUALITY", 11)
+STATIC_COMPRESS_MIN_BYTES = 512
+
+# Preferred first when the client accepts several
+STATIC_ENCODINGS = ("br", "gzip")
+
+
+def _brotli():
+    """The optional `brotli` package, or None when it is not installed."""
+    try:
+        return lazy_import("brotli")
+    except ImportError:
+        return None
+
+
+class StaticAsset:
+    """
+    One static file held in memory with its precompressed variants.
+
+    The file is read, hashed and compressed (gzip, plus brotli when the
+    package is installed) once per worker and again only when its size or
+    mtime changes. Each variant gets a strong ETag derived from the content
+    hash, so conditional requests are answered without touching the disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.version = None
+        self.variants = {}   # content coding -> bytes
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            with open(self.path, "rb") as f:
+                data = f.read()
+            variants = {"identity": data}
+            compressible = self.mimetype.startswith("text/") or self.mimetype in (
+                "application/javascript", "application/json", "image/svg+xml",
+            )
+            if compressible and len(data) >= STATIC_COMPRESS_MIN_BYTES:
+                brotli = _brotli()
+                if brotli is not None:
+                    variants["br"] = brotli.compress(data, quality=STATIC_BROTLI_QUALITY)
+                variants["gzip"] = gzip.compress(data, compresslevel=STATIC_GZIP_LEVEL, mtime=0)
+            self.variants = {k: v for k, v in variants.items() if k == "identity" or len(v) < len(data)}
+            self.version = hashlib.sha256(data).hexdigest()[:16]
+            self._stamp = stamp
+            log.info(
+                f"Static {os.path.basename(self.path)}: {len(data)} bytes, "
+                + ", ".join(f"{k} {len(v)}" for k, v in self.variants.items() if k != "identity")
+            )
+
+    def etag(self, coding: str) -> str:
+        return self.version if coding == "identity" else f"{self.version}-{coding}"
+
+    def response(self, version: Optional[str] = None) -> Response:
+        """
+        Serve the best variant for this request, or 304 when the client copy
+        is current. A `version` equal to the content hash marks a versioned URL.
+        """
+        self.refresh()
+        immutable = bool(version) and version == self.version
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        coding = next((c for c in STATIC_ENCODINGS if c in self.variants and c in accepted), "identity")
+
+        response = Response(mimetype=self.mimetype)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.set_etag(self.etag(coding))
+        # Versioned URLs never change content; everything else is revalidated with the ETag
+        response.headers["Cache-Control"] = (
+            f"public, max-age={STATIC_MAX_AGE}, immutable" if immutable else "no-cache"
+        )
+
+        if any(request.if_none_match.contains_weak(self.etag(c)) for c in self.variants):
+            response.status_code = 304
+            return response
+
+        response.set_data(self.variants[coding])
+        if coding != "identity":
+            response.headers["Content-Encoding"] = coding
+        return response
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q > 0)."""
+    accepted = set()
+    for item in header.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding == "*":
+            accepted.update(STATIC_ENCODINGS)
+        elif coding:
+            accepted.add(coding)
+    return accepted
+
+
+_static_assets: dict = {}   # absolute path -> StaticAsset
+
+
+def serve_static(path: str) -> Response:
+    """Serve a file through the in-memory asset cache (`?v=<hash>` marks a versioned URL)."""
+    if not os.path.isfile(path):
+        return jsonify({"error": "No encontrado"}), 404
+    asset = _static_assets.get(path)
+    if asset is None:
+        asset = _static_assets.setdefault(path, StaticAsset(path))
+    return asset.response(version=request.args.get("v"))
+
+
 @app.route("/")
 def index():
-    return send_from_directory(".", "index.html")
+    return serve_static(os.path.join(APP_DIR, "index.html"))
+
+
+@app.route("/static/<path:filename>")
+def static_file(filename):
+    """Assets under STATIC_DIR only; anything outside it is never served."""
+    path = safe_join(STATIC_DIR, filename)
+    if path is None:
+        return jsonify({"error": "No encontrado"}), 404
+    return serve_static(path)
+
+# ──────────────────────────────────────────────
+# REQUEST TIMING & METRICS ENDPOINT
+# ──────────────────────────────────────────────
+@app.before_request
+def _start_timer():
+    start_request_timer()
+
+
+@app.after_request
+def _record_timing(response):
+    timer = current_timer()
+    if timer is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if timer.spans:
+        response.headers["Server-Timing"] = timer.server_timing()
+    HTTP_DURATION.observe(
+        time.perf_counter() - timer.started,
+        route=route, method=request.method, status=response.status_code,
+    )
+    if response.status_code >= 500:
+        ERRORS.inc(route=route, kind=f"http_{response.status_code}")
+    return response
+
+
+def _collected(name: str, kind: str, help_text: str, samples: list) -> list:
+    """Render values read from the component stats at scrape time."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        rendered = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{rendered}}} {value:g}")
+    return lines
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    upstreams = upstream_stats()
+    circuit_states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    lines.extend(_collected(
+        "qsar_upstream_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+        [({"upstream": name}, circuit_states.get(s["circuit"]["state"], 0)) for name, s in upstreams.items()],
+    ))
+    lines.extend(_collected(
+        "qsar_upstream_rate_limit_queue_depth", "gauge", "Calls of this worker waiting for a rate-limit slot.",
+        [({"upstream": name}, s["rate_limit"].get("queue_depth", 0)) for name, s in upstreams.items()],
+    ))
+    lines.extend(_collected(
+        "qsar_upstream_rate_limit_timeouts_total", "counter", "Calls rejected after waiting max_wait for a rate-limit slot.",
+        [({"upstream": name}, s["rate_limit"].get("timeouts", 0)) for name, s in upstreams.items()],
+    ))
+    cache_samples = []
+    for cache_name, cache in (("lookup", lookup_cache), ("llm", llm_cache)):
+        for source, counters in cache.stats()["sources"].items():
+            for outcome, value in counters.items():
+                cache_samples.append(({"cache": cache_name, "source": source, "outcome": outcome}, value))
+    lines.extend(_collected("qsar_cache_lookups_total", "counter", "Cache lookups by outcome.", cache_samples))
+
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
 
 # ──────────────────────────────────────────────
-# STATUS ENDPOINT
+# STATUS ENDPOINT (background health prober)
 # ──────────────────────────────────────────────
+HEALTH_PROBE_INTERVAL = _env_float("HEALTH_PROBE_INTERVAL", 15)
+HEALTH_PROBE_TIMEOUT = _env_float("HEALTH_PROBE_TIMEOUT", 5)
+HEALTH_HISTORY = _env_int("HEALTH_HISTORY", 60)
+
+# name -> (endpoint, params, error message prefix)
+HEALTH_CHECKS = {
+    "version": ("version", None, "Versión check falló"),
+    "profilers": ("profiling/available", None, "Profilers endpoint no disponible"),
+    "substances": ("substances/search", {"query": "test"}, "Substances endpoint no disponible"),
+}
+
+
+class HealthProber:
+    """
+    Toolbox health snapshot refreshed off the request path.
+
+    A daemon thread (started lazily, once per worker process) runs the
+    HEALTH_CHECKS concurrently every `interval` seconds and keeps the latest
+    result plus a bounded latency history. Status endpoints read the snapshot
+    without touching the network; `probe()` forces a new round, and callers
+    that arrive while one is running share its result. Checks use their own
+    bare session (no retries, circuit breaker or rate limiter), so a probe
+    measures the Toolbox as it is and never trips or throttles user traffic.
+    """
+
+    def __init__(self, checks: dict, interval: float, timeout: float, history: int):
+        self.checks = checks
+        self.interval = interval
+        self.timeout = timeout
+        self.history = deque(maxlen=max(history, 1))
+        self.counters = {"probes": 0, "forced": 0, "failed_checks": 0}
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._session = None
+
+    def _ensure_started(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=len(self.checks), thread_name_prefix="health")
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=len(self.checks), max_retries=0)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            if self.interval > 0:
+                threading.Thread(target=self._loop, name="health-prober", daemon=True).start()
+            self._pid = pid
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.probe()
+            except Exception as e:
+                log.warning(f"Health probe failed: {e}")
+
+    def _check(self, name: str) -> dict:
+        endpoint, params, label = self.checks[name]
+        started = time.perf_counter()
+        result = {"ok": False, "status": None, "error": None}
+        try:
+            r = self._session.get(
+                toolbox_client.url(endpoint), params=params,
+                timeout=(min(toolbox_client.config["connect_timeout"], self.timeout), self.timeout),
+            )
+            result["status"] = r.status_code
+            result["ok"] = r.ok
+            if not r.ok:
+                result["error"] = f"{label}: HTTP {r.status_code}"
+            elif name == "version":
+                result["version"] = r.json().get("version")
+        except requests.exceptions.ConnectionError:
+            result["error"] = f"{label}: no se puede conectar a QSAR Toolbox en {TOOLBOX_URL}"
+        except requests.exceptions.Timeout:
+            result["error"] = f"{label}: timeout conectando a {TOOLBOX_URL}"
+        except Exception as e:
+            result["error"] = f"{label}: {e}"
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def probe(self, forced: bool = False) -> dict:
+        """Run every check concurrently and publish the new snapshot."""
+        self._ensure_started()
+        requested = time.time()
+        with self._probe_lock:
+            snapshot = self._snapshot
+            if snapshot and snapshot["started"] >= requested:
+                return snapshot   # a probe that began after our request just finished
+            started = time.time()
+            futures = {name: self._executor.submit(self._check, name) for name in self.checks}
+            checks = {name: future.result() for name, future in futures.items()}
+            version = checks.get("version", {}).get("version")
+            if version:
+                lookup_cache.set_toolbox_version(version)
+            snapshot = {
+                "started": started,
+                "checked_at": datetime.utcfromtimestamp(started).isoformat(),
+                "duration_ms": round((time.time() - started) * 1000, 1),
+                "checks": checks,
+            }
+            with self._lock:
+                self._snapshot = snapshot
+                self.history.append({
+                    "checked_at": snapshot["checked_at"],
+                    "latency_ms": {name: c["latency_ms"] for name, c in checks.items()},
+                    "ok": {name: c["ok"] for name, c in checks.items()},
+                })
+                self.counters["probes"] += 1
+                self.counters["forced"] += int(forced)
+                self.counters["failed_checks"] += sum(not c["ok"] for c in checks.values())
+            return snapshot
+
+    def snapshot(self, fresh: bool = False) -> dict:
+        """Latest snapshot; probes synchronously on first use or when `fresh`."""
+        self._ensure_started()
+        snapshot = self._snapshot
+        if fresh or snapshot is None:
+            snapshot = self.probe(forced=fresh)
+        return {**snapshot, "age_s": round(time.time() - snapshot["started"], 1)}
+
+    def recent(self) -> list:
+        """Latency history, oldest first."""
+        with self._lock:
+            return list(self.history)
+
+    def stats(self) -> dict:
+        history = self.recent()
+        latency = {}
+        for name in self.checks:
+            samples = sorted(h["latency_ms"][name] for h in history)
+            if samples:
+                latency[name] = {
+                    "last_ms": history[-1]["latency_ms"][name],
+                    "p50_ms": samples[len(samples) // 2],
+                    "max_ms": samples[-1],
+                }
+        return {
+            "interval_s": self.interval,
+            "timeout_s": self.timeout,
+            "latency": latency,
+            **self.counters,
+        }
+
+
+health = HealthProber(HEALTH_CHECKS, HEALTH_PROBE_INTERVAL, HEALTH_PROBE_TIMEOUT, HEALTH_HISTORY)
+
+
+def wants_fresh() -> bool:
+    return request.args.get("fresh") in ("1", "true")
+
+
 @app.route("/api/status")
 def status():
-    """Check connectivity with QSAR Toolbox and report version."""
-    toolbox_ok = False
-    toolbox_version = "4.8"
-    toolbox_error = None
-
-    try:
-        r = requests.get(f"{TOOLBOX_URL}/api/v1/version", timeout=4)
-        if r.ok:
-            toolbox_ok = True
-            data = r.json()
-            toolbox_version = data.get("version", "4.8")
-    except requests.exceptions.ConnectionError:
-        toolbox_error = f"No se puede conectar a QSAR Toolbox en {TOOLBOX_URL}"
-    except requests.exceptions.Timeout:
-        toolbox_error = f"Timeout conectando a {TOOLBOX_URL}"
-    except Exception as e:
-        toolbox_error = str(e)
+    """Report Toolbox connectivity and version from the health snapshot (`?fresh=1` probes now)."""
+    snapshot = health.snapshot(fresh=wants_fresh())
+    version_check = snapshot["checks"]["version"]
 
     return jsonify({
         "status": "online",
-        "version": toolbox_version,
-        "toolbox_connected": toolbox_ok,
+        "version": version_check.get("version") or "4.8",
+        "toolbox_connected": version_check["ok"],
         "toolbox_url": TOOLBOX_URL,
-        "toolbox_error": toolbox_error,
+        "toolbox_error": version_check["error"],
+        "checked_at": snapshot["checked_at"],
+        "age_s": snapshot["age_s"],
         "gemini_configured": bool(GEMINI_KEY),
+        "gemini_model": get_gemini_model().model_name if GEMINI_KEY else None,
+        "upstreams": upstream_stats(),
+        "health": health.stats(),
+        "lookup_cache": lookup_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "coalescing": single_flight.stats(),
+        "jobs": jobs.stats(),
+        "identity_index": identity_index.stats(),
+        "watchlist": watchlist.summary(),
         "timestamp": datetime.utcnow().isoformat(),
     })
 
 
 @app.route("/api/toolbox/health")
 def toolbox_health():
-    """Detailed health check for QSAR Toolbox."""
+    """Detailed health check for QSAR Toolbox, served from the prober snapshot (`?fresh=1` probes now)."""
+    snapshot = health.snapshot(fresh=wants_fresh())
+    checks = snapshot["checks"]
+
     health_info = {
         "toolbox_url": TOOLBOX_URL,
         "checks": {
-            "connectivity": False,
-            "version": None,
-            "profilers": False,
-            "substances": False
+            "connectivity": checks["version"]["ok"],
+            "version": checks["version"].get("version"),
+            "profilers": checks["profilers"]["ok"],
+            "substances": checks["substances"]["ok"],
         },
-        "errors": []
+        "errors": [c["error"] for c in checks.values() if c["error"]],
+        "latency_ms": {name: c["latency_ms"] for name, c in checks.items()},
+        "checked_at": snapshot["checked_at"],
+        "age_s": snapshot["age_s"],
+        "history": health.recent(),
     }
 
-    # Check basic connectivity
-    try:
-        r = requests.get(f"{TOOLBOX_URL}/api/v1/version", timeout=5)
-        if r.ok:
-            health_info["checks"]["connectivity"] = True
-            data = r.json()
-            health_info["checks"]["version"] = data.get("version")
-    except Exception as e:
-        health_info["errors"].append(f"Versión check falló: {str(e)}")
+    health_status = "healthy" if health_info["checks"]["connectivity"] else "unhealthy"
+    return jsonify({"status": health_status, **health_info})
 
-    # Check profilers endpoint
-    try:
-        r = requests.get(f"{TOOLBOX_URL}/api/v1/profiling/available", timeout=5)
-        if r.ok:
-            health_info["checks"]["profilers"] = True
-    except Exception as e:
-        health_info["errors"].append(f"Profilers endpoint no disponible: {str(e)}")
 
-    # Check substances search
-    try:
-        r = requests.get(f"{TOOLBOX_URL}/api/v1/substances/search?query=test", timeout=5)
-        if r.ok:
-            health_info["checks"]["substances"] = True
-    except Exception as e:
-        health_info["errors"].append(f"Substances endpoint no disponible: {str(e)}")
+_import_time_cache: dict = {}
+_import_time_lock = threading.Lock()   # one measurement at a time, without holding up lazy imports
 
-    health_status = "healthy" if health_info["checks"]["connectivity"] else "unhealthy"
-    return jsonify({"status": health_status, **health_info})
+
+@app.route("/api/admin/startup")
+@require_key
+def admin_startup():
+    """
+    Worker boot time and lazily imported modules. With `?importtime=1` also
+    returns an `-X importtime` breakdown of `import app`, measured once per
+    worker in a fresh interpreter.
+    """
+    report = startup_report()
+    if request.args.get("importtime") in ("1", "true"):
+        with _import_time_lock:
+            if "app" not in _import_time_cache:
+                _import_time_cache["app"] = import_time_report("app")
+        report["importtime"] = _import_time_cache["app"]
+    return jsonify(report)
 
 # ──────────────────────────────────────────────
 # QSAR TOOLBOX HELPERS
 # ──────────────────────────────────────────────
 
-def _create_session_with_retries() -> requests.Session:
-    """Create a requests session with automatic retries."""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
-
-
 def toolbox_get(endpoint: str, params: dict = None) -> Optional[dict]:
     """Generic GET request to QSAR Toolbox REST API with retry logic."""
+    key = single_flight.make_key("toolbox", "GET", endpoint, params)
+    return single_flight.do("toolbox", key, lambda: _toolbox_get(endpoint, params))
+
+
+def _toolbox_get(endpoint: str, params: dict = None) -> Optional[dict]:
     try:
-        url = f"{TOOLBOX_URL}/api/v1/{endpoint}"
-        session = _create_session_with_retries()
-        r = session.get(url, params=params or {}, timeout=30)
+        r = toolbox_client.get(endpoint, params=params or {})
         r.raise_for_status()
         return r.json()
+    except UpstreamUnavailable:
+        return None
     except requests.exceptions.Timeout:
-        log.warning(f"Toolbox GET {endpoint} timed out after 30s")
+        log.warning(f"Toolbox GET {endpoint} timed out after {UPSTREAM_CONFIG['toolbox']['get_timeout']}s")
         return None
     except requests.exceptions.ConnectionError:
         log.warning(f"Toolbox GET {endpoint} connection error — is QSAR Toolbox running on {TOOLBOX_URL}?")
@@ -173,14 +2298,19 @@ def toolbox_get(endpoint: str, params: dict = None) -> Optional[dict]:
 
 def toolbox_post(endpoint: str, payload: dict) -> Optional[dict]:
     """Generic POST request to QSAR Toolbox REST API with retry logic."""
+    key = single_flight.make_key("toolbox", "POST", endpoint, payload)
+    return single_flight.do("toolbox", key, lambda: _toolbox_post(endpoint, payload))
+
+
+def _toolbox_post(endpoint: str, payload: dict) -> Optional[dict]:
     try:
-        url = f"{TOOLBOX_URL}/api/v1/{endpoint}"
-        session = _create_session_with_retries()
-        r = session.post(url, json=payload, timeout=60)
+        r = toolbox_client.post(endpoint, json=payload)
         r.raise_for_status()
         return r.json()
+    except UpstreamUnavailable:
+        return None
     except requests.exceptions.Timeout:
-        log.warning(f"Toolbox POST {endpoint} timed out after 60s")
+        log.warning(f"Toolbox POST {endpoint} timed out after {UPSTREAM_CONFIG['toolbox']['post_timeout']}s")
         return None
     except requests.exceptions.ConnectionError:
         log.warning(f"Toolbox POST {endpoint} connection error — is QSAR Toolbox running on {TOOLBOX_URL}?")
@@ -191,10 +2321,17 @@ def toolbox_post(endpoint: str, payload: dict) -> Optional[dict]:
 
 
 def resolve_cas_from_name(name: str) -> Optional[str]:
-    """Attempt to resolve a chemical name to CAS using PubChem."""
+    """Attempt to resolve a chemical name to CAS using the identity index, then PubChem."""
+    known = identity_index.resolve(name)
+    if known and known.get("cas"):
+        return known["cas"]
+    key = single_flight.make_key("pubchem", "GET", "resolve", normalize_identifier(name))
+    return single_flight.do("pubchem", key, lambda: _resolve_cas_from_name(name))
+
+
+def _resolve_cas_from_name(name: str) -> Optional[str]:
     try:
-        url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{requests.utils.quote(name)}/property/IUPACName,MolecularFormula,MolecularWeight,XLogP/JSON"
-        r = requests.get(url, timeout=10)
+        r = pubchem_client.get(f"compound/name/{requests.utils.quote(name)}/property/IUPACName,MolecularFormula,MolecularWeight,XLogP/JSON")
         if r.ok:
             props = r.json()["PropertyTable"]["Properties"][0]
             return props
@@ -203,80 +2340,610 @@ def resolve_cas_from_name(name: str) -> Optional[str]:
     return None
 
 
+PUBCHEM_PROPERTIES = "IUPACName,MolecularFormula,MolecularWeight,XLogP,IsomericSMILES"
+PUBCHEM_BATCH_SIZE = _env_int("PUBCHEM_BATCH_SIZE", 100)
+PUBCHEM_FALLBACK_WORKERS = _env_int("PUBCHEM_FALLBACK_WORKERS", 4)
+
+
+def _pubchem_record(props: dict) -> dict:
+    """Map a PubChem property row to the compound data used by the app."""
+    return {
+        "cid": props.get("CID"),
+        "formula": props.get("MolecularFormula"),
+        "mw": f"{props.get('MolecularWeight', 'N/D')} g/mol",
+        "logKow": str(props.get("XLogP", "N/D")),
+        "smiles": props.get("IsomericSMILES"),
+        "iupac": props.get("IUPACName"),
+    }
+
+
 def get_pubchem_data(cas_or_name: str) -> Optional[dict]:
-    """Fetch basic compound data from PubChem as fallback."""
+    """
+    Fetch basic compound data from PubChem as fallback (cached).
+
+    Substances in the identity index are answered locally; PubChem results
+    are added to it.
+    """
+    if looks_like_cas(cas_or_name):
+        cas_or_name = normalize_cas(cas_or_name)
+        if cas_or_name is None:
+            return None
+
+    known = None if lookup_cache.refreshing else identity_index.resolve(cas_or_name)
+    if known:
+        return known
+
+    key = single_flight.make_key("pubchem", "GET", "properties", normalize_identifier(cas_or_name))
+
+    def fetch():
+        data = single_flight.do("pubchem", key, lambda: _fetch_pubchem_data(cas_or_name))
+        if data and data.get("cid"):
+            lookup_cache.store("pubchem_cid", cas_or_name, data["cid"])
+            identity_index.add(data, [cas_or_name], cas=extract_cas(cas_or_name))
+        return data
+
+    return lookup_cache.get_or_compute("pubchem", cas_or_name, fetch)
+
+
+def _pubchem_cid(identifier: str) -> tuple:
+    """
+    Resolve a name or CAS number to its PubChem CID with a lightweight `cids` lookup.
+
+    Returns (cid, found): found is False when PubChem does not know the
+    identifier and None when it could not be asked.
+    """
+    try:
+        r = pubchem_client.get(f"compound/name/{requests.utils.quote(identifier)}/cids/JSON")
+        if r.status_code == 404:
+            return None, False
+        r.raise_for_status()
+        cids = r.json().get("IdentifierList", {}).get("CID") or []
+    except Exception as e:
+        log.warning(f"PubChem CID lookup of {identifier} failed: {e}")
+        return None, None
+    if not cids:
+        return None, False
+    lookup_cache.store("pubchem_cid", identifier, cids[0])
+    return str(cids[0]), True
+
+
+def get_pubchem_data_batch(identifiers: list) -> dict:
+    """
+    Fetch PubChem data for many identifiers with as few requests as possible.
+
+    PUG-REST only accepts lists in the CID namespace, so identifiers are first
+    mapped to CIDs: numeric input, CIDs remembered from earlier lookups, and
+    otherwise lightweight `cids` lookups pipelined PUBCHEM_FALLBACK_WORKERS at
+    a time (remembered for LOOKUP_TTL["pubchem_cid"], so repeated batches
+    skip them). Properties are then fetched with one POST per
+    PUBCHEM_BATCH_SIZE CIDs. Identifiers whose CID could not be resolved
+    because of an error, or whose CID returned nothing, fall back to
+    individual lookups. Returns {identifier: data or None}.
+    """
+    results = {}
+    by_cid = {}
+    unresolved = []
+    for identifier in dict.fromkeys(identifiers):
+        if looks_like_cas(identifier) and normalize_cas(identifier) is None:
+            results[identifier] = None
+            continue
+        known = identity_index.resolve(identifier)
+        if known:
+            results[identifier] = known
+            continue
+        cached = lookup_cache.lookup("pubchem", identifier)
+        if cached is not None:
+            results[identifier] = cached
+            continue
+        cid = identifier.strip() if identifier.strip().isdigit() else lookup_cache.lookup("pubchem_cid", identifier)
+        if cid:
+            by_cid.setdefault(str(cid), []).append(identifier)
+        else:
+            unresolved.append(identifier)
+
+    fallback = []
+    if unresolved:
+        with ThreadPoolExecutor(max_workers=min(PUBCHEM_FALLBACK_WORKERS, len(unresolved))) as executor:
+            for identifier, (cid, found) in zip(unresolved, executor.map(_pubchem_cid, unresolved)):
+                if cid:
+                    by_cid.setdefault(cid, []).append(identifier)
+                elif found is None:
+                    fallback.append(identifier)
+                else:
+                    results[identifier] = None
+
+    cids = list(by_cid)
+    for i in range(0, len(cids), PUBCHEM_BATCH_SIZE):
+        chunk = cids[i:i + PUBCHEM_BATCH_SIZE]
+        try:
+            r = pubchem_client.post(
+                f"compound/cid/property/{PUBCHEM_PROPERTIES}/JSON",
+                data={"cid": ",".join(chunk)},
+            )
+            r.raise_for_status()
+            rows = r.json()["PropertyTable"]["Properties"]
+        except Exception as e:
+            log.warning(f"PubChem batch lookup of {len(chunk)} CIDs failed: {e}")
+            rows = []
+        for props in rows:
+            record = _pubchem_record(props)
+            for identifier in by_cid.pop(str(props.get("CID")), []):
+                results[identifier] = record
+                lookup_cache.store("pubchem", identifier, record)
+                identity_index.add(record, [identifier], cas=extract_cas(identifier))
+
+    # CIDs that came back empty are retried by name below
+    for identifiers_left in by_cid.values():
+        fallback.extend(identifiers_left)
+
+    if fallback:
+        with ThreadPoolExecutor(max_workers=min(PUBCHEM_FALLBACK_WORKERS, len(fallback))) as executor:
+            for identifier, data in zip(fallback, executor.map(get_pubchem_data, fallback)):
+                results[identifier] = data
+
+    log.info(f"PubChem batch: {len(results)} identifiers, {len(unresolved)} CID lookups, "
+             f"{len(cids)} via CID batches, {len(fallback)} individual lookups")
+    return results
+
+
+def _fetch_pubchem_data(cas_or_name: str) -> Optional[dict]:
+    """Query PubChem for basic compound data."""
     try:
         # Try by CAS first
-        if re.match(r'\d{2,7}-\d{2}-\d', cas_or_name):
-            url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{cas_or_name}/property/IUPACName,MolecularFormula,MolecularWeight,XLogP,IsomericSMILES/JSON"
+        if CAS_PATTERN.fullmatch(cas_or_name):
+            path = f"compound/name/{cas_or_name}/property/{PUBCHEM_PROPERTIES}/JSON"
         else:
-            url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{requests.utils.quote(cas_or_name)}/property/IUPACName,MolecularFormula,MolecularWeight,XLogP,IsomericSMILES/JSON"
+            path = f"compound/name/{requests.utils.quote(cas_or_name)}/property/{PUBCHEM_PROPERTIES}/JSON"
 
-        r = requests.get(url, timeout=10)
+        r = pubchem_client.get(path)
         if r.ok:
             data = r.json()
-            props = data["PropertyTable"]["Properties"][0]
-            return {
-                "cid": props.get("CID"),
-                "formula": props.get("MolecularFormula"),
-                "mw": f"{props.get('MolecularWeight', 'N/D')} g/mol",
-                "logKow": str(props.get("XLogP", "N/D")),
-                "smiles": props.get("IsomericSMILES"),
-                "iupac": props.get("IUPACName"),
-            }
+            return _pubchem_record(data["PropertyTable"]["Properties"][0])
     except Exception as e:
         log.warning(f"PubChem lookup failed: {e}")
     return None
 
 
-def run_toolbox_analysis(query: str, options: dict) -> dict:
+# Profilers run by the chat analysis and by /api/toolbox/profile by default
+DEFAULT_PROFILERS = ["mutagenicity", "aquatic_toxicity", "skin_sensitization"]
+
+# Returned by /api/toolbox/profilers when the Toolbox cannot be reached
+FALLBACK_PROFILERS = DEFAULT_PROFILERS + ["biodegradation", "ecotoxicity", "reproductive_toxicity"]
+
+
+def checked_profilers(value) -> list:
+    """Profilers from a request field (known names, deduplicated); raises ValueError with the client message."""
+    if value is None:
+        return list(DEFAULT_PROFILERS)
+    if not isinstance(value, list) or not value or not all(isinstance(p, str) for p in value):
+        raise ValueError("'profilers' debe ser una lista no vacía de nombres de perfiladores")
+    unknown = [p for p in value if p not in FALLBACK_PROFILERS]
+    if unknown:
+        raise ValueError(
+            f"Perfiladores desconocidos: {', '.join(unknown)} (disponibles: {', '.join(FALLBACK_PROFILERS)})"
+        )
+    return list(dict.fromkeys(value))
+
+# Bounded pool shared by every request for the analysis fan-out, sized for
+# ANALYSIS_CONCURRENT_REQUESTS requests running ANALYSIS_WORKERS stages each
+ANALYSIS_WORKERS = _env_int("ANALYSIS_WORKERS", 8)
+ANALYSIS_CONCURRENT_REQUESTS = _env_int("ANALYSIS_CONCURRENT_REQUESTS", 4)
+ANALYSIS_DEADLINE = _env_float("ANALYSIS_DEADLINE", 65)
+_analysis_executor = ThreadPoolExecutor(
+    max_workers=max(ANALYSIS_WORKERS * ANALYSIS_CONCURRENT_REQUESTS, 1), thread_name_prefix="analysis",
+)
+
+
+# Profilers run as one Toolbox call each (cached per CAS and profiler) instead of
+# a single combined profiling/run; at most PROFILING_CONCURRENCY per worker
+PROFILING_SPLIT = _env_bool("PROFILING_SPLIT", True)
+PROFILING_CONCURRENCY = _env_int("PROFILING_CONCURRENCY", 4)
+
+# Seconds kept back from the analysis stage deadline to merge and return the
+# profilers that did finish before the stage itself times out
+PROFILING_MERGE_MARGIN = 0.5
+_profiling_executor = ThreadPoolExecutor(max_workers=max(PROFILING_CONCURRENCY, 1), thread_name_prefix="profiler")
+
+
+def profiler_payload(profiler: str) -> dict:
+    """Lookup-cache payload under which one profiler's result is stored."""
+    return {"profiler": profiler}
+
+
+def cached_profiling(cas: str, profilers: list) -> tuple:
+    """Per-profiler cache hits for a CAS: ({profiler: result}, [profilers still missing])."""
+    values, missing = {}, []
+    for profiler in dict.fromkeys(profilers):
+        value = lookup_cache.lookup("profiling", cas, profiler_payload(profiler))
+        if value:
+            values[profiler] = value
+        else:
+            missing.append(profiler)
+    return values, missing
+
+
+def merge_profiling(cas: str, profilers: list, values: dict) -> Optional[dict]:
     """
-    Orchestrate QSAR Toolbox analysis:
-    1. Resolve molecule identity
-    2. Run profiling modules
-    3. Build category and data matrix
-    4. Return structured results
+    Combine per-profiler results into one profiling payload.
+
+    Alerts of every profiler are concatenated; results without an `alerts`
+    list are kept as they came under `results`. Returns None when no
+    profiler produced a result. How each profiler fared is reported
+    separately (see profiling_report), so the payload only depends on the data.
+    """
+    profilers = list(dict.fromkeys(profilers))
+    if not any(values.get(p) for p in profilers):
+        return None
+    alerts, other = [], {}
+    for profiler in profilers:
+        value = values.get(profiler)
+        if isinstance(value, dict) and isinstance(value.get("alerts"), list):
+            alerts.extend(value["alerts"])
+        elif value:
+            other[profiler] = value
+    return {
+        "cas": cas,
+        "profilers": profilers,
+        "alerts": alerts,
+        "results": other,
+    }
+
+
+def profiling_report(profilers: list, status: dict, timings: dict) -> dict:
+    """
+    Outcome of a profiling run: `status` per profiler ("ok", "cached",
+    "error", "timeout" or "skipped"), `timings_ms` of the calls made and
+    `partial` when any profiler is missing.
+    """
+    profilers = list(dict.fromkeys(profilers))
+    return {
+        "status": {p: status[p] for p in profilers},
+        "timings_ms": {p: timings[p] for p in profilers if p in timings},
+        "partial": any(status[p] not in ("ok", "cached") for p in profilers),
+    }
+
+
+def _run_profiler(cas: str, profiler: str) -> tuple:
+    started = time.perf_counter()
+    value = toolbox_post("profiling/run", {"cas": cas, "profilers": [profiler]})
+    lookup_cache.store("profiling", cas, value, profiler_payload(profiler))
+    return value, round((time.perf_counter() - started) * 1000, 1)
+
+
+def run_profiling(cas: str, profilers: list, timeout: float = ANALYSIS_DEADLINE,
+                  report: dict = None) -> Optional[dict]:
+    """
+    Run each profiler as its own Toolbox call, concurrently, and merge the results.
+
+    Profilers already cached for this CAS are not recomputed, so asking later
+    for one extra profiler costs a single call. Profilers still running after
+    `timeout` seconds are left out and the others returned. A failed or slow
+    profiler does not fail the whole request: it is reported in `report`
+    (filled with profiling_report()) when the caller passes one.
+    """
+    profilers = list(dict.fromkeys(profilers))
+    values, missing = cached_profiling(cas, profilers)
+    status = {p: "cached" for p in values}
+    timings = {}
+
+    futures = {
+        p: _profiling_executor.submit(contextvars.copy_context().run, _run_profiler, cas, p)
+        for p in missing
+    }
+    wait(futures.values(), timeout=timeout)
+    for profiler, future in futures.items():
+        if not future.done():
+            future.cancel()
+            status[profiler] = "timeout"
+            log.warning(f"Profiler {profiler} for {cas} did not finish within {timeout}s")
+            continue
+        try:
+            value, timings[profiler] = future.result()
+        except Exception as e:
+            log.warning(f"Profiler {profiler} for {cas} failed: {e}")
+            status[profiler] = "error"
+            continue
+        status[profiler] = "ok" if value else "error"
+        if value:
+            values[profiler] = value
+
+    if report is not None:
+        report.update(profiling_report(profilers, status, timings))
+    return merge_profiling(cas, profilers, values)
+
+
+def stage_name(key) -> str:
+    """Stage keys are names, or (substance index, name) pairs in a multi-substance analysis."""
+    return key[1] if isinstance(key, tuple) else key
+
+
+def _timed_stage(key, fn):
+    with span(stage_name(key)):
+        return fn()
+
+
+def run_stages(stages: dict, deadline: float, executor: ThreadPoolExecutor = None) -> tuple:
+    """
+    Run independent analysis stages concurrently with an overall deadline.
+
+    `stages` maps a result key to a zero-argument callable; they run on
+    `executor` (the shared analysis pool by default), at most
+    ANALYSIS_WORKERS at a time so a multi-substance analysis cannot fill the
+    pool by itself. Every stage must finish within `deadline` seconds of the
+    call, queued time included; a stage not started by then is dropped.
+    Worker threads cannot be interrupted: a stage that times out keeps
+    running until its upstream call returns (bounded by the client
+    timeouts), and still counts against ANALYSIS_WORKERS until it does; only
+    its result is discarded. Returns the values of the stages that finished
+    in time and a status per stage: "ok", "empty" (returned nothing),
+    "error" or "timeout".
+    """
+    executor = executor or _analysis_executor
+    cutoff = time.monotonic() + deadline
+    waiting, futures, lingering = deque(stages.items()), {}, set()
+
+    values, status = {}, {}
+    while waiting or futures:
+        lingering = {future for future in lingering if not future.done()}
+        while waiting and len(futures) + len(lingering) < ANALYSIS_WORKERS and time.monotonic() < cutoff:
+            key, fn = waiting.popleft()
+            # Each stage runs in a copy of the caller's context so its spans reach the request timer
+            futures[executor.submit(contextvars.copy_context().run, _timed_stage, key, fn)] = key
+        if not futures:
+            break
+
+        done, _ = wait(futures, timeout=max(cutoff - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        expired = time.monotonic() >= cutoff
+        for future in list(futures):
+            key = futures[future]
+            if future not in done:
+                if not expired:
+                    continue
+                del futures[future]
+                if not future.cancel():
+                    lingering.add(future)
+                status[key] = "timeout"
+                log.warning(f"Analysis stage {key} did not finish within {deadline}s")
+                continue
+            del futures[future]
+            try:
+                value = future.result()
+            except Exception as e:
+                log.warning(f"Analysis stage {key} failed: {e}")
+                status[key] = "error"
+                continue
+            values[key] = value
+            status[key] = "ok" if value else "empty"
+
+    for key, _ in waiting:
+        status[key] = "timeout"
+        log.warning(f"Analysis stage {key} did not start within {deadline}s")
+    return values, status
+
+
+def extract_cas(query: str) -> Optional[str]:
+    """Return the first valid CAS number mentioned in a query, if any (see extract_identifiers)."""
+    found = extract_identifiers(query)["cas"]
+    return found[0] if found else None
+
+
+# Substances analysed (and compared) in one chat request
+CHAT_MAX_SUBSTANCES = _env_int("CHAT_MAX_SUBSTANCES", 5)
+
+
+def find_substances(query: str, found: dict) -> list:
+    """
+    Every substance a query mentions, as [(identifier, cas, name)].
+
+    Valid CAS numbers come first, then names known to the identity index
+    whose CAS was not already mentioned; at most CHAT_MAX_SUBSTANCES.
+    """
+    substances = [(cas, cas, None) for cas in found["cas"]]
+    mentioned = set(found["cas"])
+    for alias, record in identity_index.find_all_in_text(query):
+        cas = record.get("cas")
+        if CAS_PATTERN.fullmatch(alias) or (cas and cas in mentioned):
+            continue   # CAS mentions are already covered by extract_identifiers
+        mentioned.add(cas or alias)
+        substances.append((alias, cas, alias))
+    if len(substances) > CHAT_MAX_SUBSTANCES:
+        log.warning(f"Query mentions {len(substances)} substances; analysing the first {CHAT_MAX_SUBSTANCES}")
+    return substances[:CHAT_MAX_SUBSTANCES]
+
+
+def plan_substance(query: str, identifier: Optional[str], cas: Optional[str], name: Optional[str],
+                   options: dict) -> tuple:
     """
-    # Extract CAS or molecule name
-    cas_match = re.search(r'\b(\d{2,7}-\d{2}-\d)\b', query)
-    cas = cas_match.group(1) if cas_match else None
+    List the upstream calls the analysis of one substance needs.
 
+    Returns the empty `results` skeleton, the identifier used for PubChem and
+    the Toolbox calls as {result key: (cache source, cache payload, method,
+    endpoint, body)}.
+    """
     results = {
         "query": query,
         "cas": cas,
+        "name": name,
         "toolbox_data": None,
         "pubchem_data": None,
         "profiling": None,
         "category": None,
         "endpoints": [],
+        "stages": {},
+        "degraded": False,
     }
 
-    # Step 1: Molecule identification via QSAR Toolbox
-    if cas:
-        tb_mol = toolbox_get("substances/search", {"cas": cas})
-        if tb_mol:
-            results["toolbox_data"] = tb_mol
+    toolbox_calls = {}
 
-    # Step 2: PubChem enrichment (fallback or complement)
-    identifier = cas or query
-    pc_data = get_pubchem_data(identifier)
-    if pc_data:
-        results["pubchem_data"] = pc_data
+    # Molecule identification via QSAR Toolbox
+    if cas:
+        toolbox_calls["toolbox_data"] = (
+            "toolbox_search", {"cas": cas}, "GET", "substances/search", {"cas": cas},
+        )
 
-    # Step 3: Profiling (if enabled)
+    # Profiling (if enabled)
     if options.get("profiling") and cas:
-        profiling = toolbox_post("profiling/run", {
-            "cas": cas,
-            "profilers": ["mutagenicity", "aquatic_toxicity", "skin_sensitization"]
-        })
-        results["profiling"] = profiling
+        toolbox_calls["profiling"] = (
+            "profiling", {"profilers": DEFAULT_PROFILERS}, "POST", "profiling/run",
+            {"cas": cas, "profilers": DEFAULT_PROFILERS},
+        )
 
-    # Step 4: Category and read-across (if enabled)
+    # Category and read-across (if enabled)
     if options.get("readAcross") and cas:
-        category = toolbox_post("category/build", {"cas": cas})
-        results["category"] = category
+        toolbox_calls["category"] = (
+            "category", None, "POST", "category/build", {"cas": cas},
+        )
+
+    # PubChem enrichment (fallback or complement)
+    return results, cas or identifier, toolbox_calls
+
+
+def plan_toolbox_analysis(query: str, options: dict) -> tuple:
+    """
+    Resolve the query and plan one analysis per substance it mentions.
+
+    Returns the identifiers found (see extract_identifiers) and a list of
+    plan_substance() plans. A query without a recognisable substance yields a
+    single plan that looks the whole query up in PubChem, or no lookup at all
+    when it only names invalid CAS numbers. Shared by the sync and the ASGI
+    orchestrators.
+    """
+    # CAS numbers with a wrong check digit are reported, never sent upstream
+    found = extract_identifiers(query)
+    substances = find_substances(query, found)
+    if not substances:
+        substances = [(None if found["invalid_cas"] else query, None, None)]
+    plans = [plan_substance(query, identifier, cas, name, options) for identifier, cas, name in substances]
+    return found, plans
+
+
+def serve_cached_if_circuit_open(results: dict, toolbox_calls: dict) -> Optional[dict]:
+    """
+    With the Toolbox circuit open, fill `results` from the lookup cache only.
+
+    Returns the stage status of every Toolbox call ("cached" or "skipped"), or
+    None when the circuit is closed and the calls should run.
+    """
+    if not toolbox_calls or not toolbox_client.breaker.is_open:
+        return None
+    results["degraded"] = True
+    skipped = {}
+    for key, (source, payload, _, _, body) in toolbox_calls.items():
+        if key == "profiling" and PROFILING_SPLIT:
+            values, _ = cached_profiling(results["cas"], body["profilers"])
+            cached = merge_profiling(results["cas"], body["profilers"], values)
+        else:
+            cached = lookup_cache.lookup(source, results["cas"], payload)
+        if cached:
+            results[key] = cached
+        skipped[key] = "cached" if cached else "skipped"
+    return skipped
 
-    return results
+
+def substance_label(results: dict) -> str:
+    """Short name of an analysed substance: "name (CAS)", the CAS or the query."""
+    cas, name = results.get("cas"), results.get("name")
+    if cas and name:
+        return f"{name} ({cas})"
+    return cas or name or results.get("query", "")
+
+
+def analysis_parts(toolbox_results: dict) -> list:
+    """Per-substance results of an analysis (a single-substance analysis is its own part)."""
+    return toolbox_results.get("substances") or [toolbox_results]
+
+
+def finish_analysis(found: dict, plans: list, values: dict, status: dict, skipped: list) -> dict:
+    """
+    Merge stage outcomes into the planned results.
+
+    `values` and `status` are keyed by (plan index, stage); `skipped` holds
+    the circuit-open statuses of each plan. One substance returns its results
+    as before; several return {"substances": [...]} with the first CAS, the
+    stage statuses keyed "stage:CAS" (or "stage:name" for a substance
+    without CAS) and the combined degraded flag.
+    """
+    parts = []
+    for i, (results, _, _) in enumerate(plans):
+        for (index, key), value in values.items():
+            if index == i and value:
+                results[key] = value
+        results["stages"] = {key: s for (index, key), s in status.items() if index == i}
+        results["stages"].update(skipped[i])
+        if results.get("profiling_report", {}).get("partial") and results["stages"].get("profiling") == "ok":
+            results["stages"]["profiling"] = "partial"
+        record_stage_results(results["stages"])
+        parts.append(results)
+
+    if len(parts) == 1:
+        combined = parts[0]
+    else:
+        combined = {
+            "query": parts[0]["query"],
+            "cas": parts[0]["cas"],
+            "substances": parts,
+            "stages": {
+                f"{key}:{part['cas'] or substance_label(part)}": s
+                for part in parts for key, s in part["stages"].items()
+            },
+            "degraded": any(part["degraded"] for part in parts),
+        }
+    combined["cas_candidates"] = found["cas"]
+    combined["invalid_cas"] = found["invalid_cas"]
+    return combined
+
+
+def run_toolbox_analysis(query: str, options: dict, executor: ThreadPoolExecutor = None) -> dict:
+    """
+    Orchestrate QSAR Toolbox analysis:
+    1. Resolve molecule identity
+    2. Run profiling modules
+    3. Build category and data matrix
+    4. Return structured results
+
+    The Toolbox search, PubChem enrichment, profiling and category build do not
+    depend on each other and run concurrently; `stages` records the outcome of
+    each one, including those cut off by ANALYSIS_DEADLINE. While the Toolbox
+    circuit is open its stages are skipped (or served from cache) and the
+    result is flagged as `degraded`. When the query mentions several
+    substances the stages of all of them run in the same concurrent batch.
+    Background callers pass their own `executor` so they never compete with
+    interactive requests for the shared analysis pool.
+    """
+    found, plans = plan_toolbox_analysis(query, options)
+
+    stages, skipped = {}, []
+    for i, (results, identifier, toolbox_calls) in enumerate(plans):
+        cas = results["cas"]
+        if identifier:
+            stages[(i, "pubchem_data")] = partial(get_pubchem_data, identifier)
+
+        plan_skipped = serve_cached_if_circuit_open(results, toolbox_calls)
+        if plan_skipped is None:
+            plan_skipped = {}
+            for key, (source, payload, method, endpoint, body) in toolbox_calls.items():
+                if key == "profiling" and PROFILING_SPLIT:
+                    results["profiling_report"] = {}
+                    stages[(i, key)] = partial(
+                        run_profiling, cas, body["profilers"],
+                        timeout=ANALYSIS_DEADLINE - PROFILING_MERGE_MARGIN,
+                        report=results["profiling_report"],
+                    )
+                    continue
+                if method == "GET":
+                    fetch = partial(toolbox_get, endpoint, body)
+                else:
+                    fetch = partial(toolbox_post, endpoint, body)
+                stages[(i, key)] = partial(lookup_cache.get_or_compute, source, cas, fetch, payload=payload)
+        skipped.append(plan_skipped)
+
+    values, status = run_stages(stages, ANALYSIS_DEADLINE, executor)
+    return finish_analysis(found, plans, values, status, skipped)
+
+
+def record_stage_results(stages: dict) -> None:
+    for stage, status in stages.items():
+        STAGE_RESULTS.inc(stage=stage, status=status)
 
 
 # ──────────────────────────────────────────────
@@ -312,57 +2979,548 @@ Las predicciones in silico son herramientas de apoyo, no reemplazan ensayos expe
 """
 
 
+# Prompt size limits (tokens are estimated as characters / PROMPT_CHARS_PER_TOKEN)
+PROMPT_TOKEN_BUDGET = _env_int("PROMPT_TOKEN_BUDGET", 6000)
+PROMPT_CHARS_PER_TOKEN = _env_float("PROMPT_CHARS_PER_TOKEN", 4)
+PROMPT_MAX_LIST_ITEMS = _env_int("PROMPT_MAX_LIST_ITEMS", 12)
+PROMPT_MAX_STRING = _env_int("PROMPT_MAX_STRING", 300)
+
+# Toolbox payload fields worth showing the model: identity, alerts, endpoints, analogs
+PROMPT_FIELDS = {
+    "name", "names", "cas", "casrn", "smiles", "id", "substance_id", "category_id",
+    "alerts", "alert", "profiler", "profilers", "result", "results", "risk", "level",
+    "category", "endpoint", "endpoints", "value", "unit", "prediction", "confidence",
+    "analogs", "members", "similarity", "description", "mechanism",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / PROMPT_CHARS_PER_TOKEN) + 1
+
+
+def project_payload(value, max_items: int = PROMPT_MAX_LIST_ITEMS):
+    """
+    Reduce a Toolbox payload to the fields that matter for the report.
+
+    Dicts keep only PROMPT_FIELDS (or their scalar fields when none match),
+    lists keep their first `max_items` entries and long strings are clipped.
+    Empty values are dropped.
+    """
+    if isinstance(value, dict):
+        kept = {k: v for k, v in value.items() if k in PROMPT_FIELDS}
+        if not kept:
+            kept = {k: v for k, v in value.items() if isinstance(v, (str, int, float, bool))}
+        projected = {k: project_payload(v, max_items) for k, v in kept.items()}
+        return {k: v for k, v in projected.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        items = [project_payload(v, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"… (+{len(value) - max_items})")
+        return items
+    if isinstance(value, str) and len(value) > PROMPT_MAX_STRING:
+        return value[:PROMPT_MAX_STRING] + "…"
+    return value
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
 def build_llm_prompt(query: str, toolbox_results: dict, language: str) -> str:
-    """Construct the full prompt for Claude with context."""
+    """
+    Construct the full prompt for Claude with context.
+
+    Toolbox payloads are projected to their relevant fields and serialized
+    compactly. Optional sections are admitted by priority (PubChem, profiling
+    alerts, Toolbox identity, category analogs) while they fit in
+    PROMPT_TOKEN_BUDGET; a section that does not fit is re-projected with
+    shorter lists before being dropped.
+    """
     lang_instruction = {
         "es": "Responde en español.",
         "en": "Respond in English.",
         "pt": "Responda em português.",
     }.get(language, "Responde en español.")
 
-    context_parts = [f"**Consulta del usuario:** {query}\n"]
+    parts = analysis_parts(toolbox_results)
+    multi = len(parts) > 1
+
+    head = [f"**Consulta del usuario:** {query}\n"]
+    if multi:
+        head.append("**Sustancias identificadas (análisis comparativo):** "
+                    + "; ".join(substance_label(part) for part in parts))
+    elif toolbox_results.get("cas"):
+        head.append(f"**Número CAS identificado:** {toolbox_results['cas']}")
+    if toolbox_results.get("invalid_cas"):
+        head.append(
+            "**CAS con dígito de control inválido (no consultados):** "
+            + ", ".join(toolbox_results["invalid_cas"])
+        )
+    tail = [
+        f"\n{lang_instruction}",
+        "Compara las sustancias entre sí y señala sus diferencias relevantes." if multi else "",
+        "Proporciona un análisis regulatorio completo, técnico y bien estructurado.",
+    ]
+    tail = [line for line in tail if line]
+
+    # (order in prompt, priority, label, payload); lower priority value = kept first.
+    # Sections of several substances interleave by priority, so every substance
+    # keeps its PubChem identity before anyone's category analogs are admitted.
+    optional = []
+    seen = {}   # serialized payload -> substance that already carries it
+    for i, part in enumerate(parts):
+        suffix = f" — {substance_label(part)}" if multi else ""
+        if part.get("pubchem_data"):
+            pc = part["pubchem_data"]
+            optional.append(((i, 0), (0, i), None,
+                f"**Datos PubChem{suffix}:**\n"
+                f"- Fórmula: {pc.get('formula', 'N/D')}\n"
+                f"- Peso molecular: {pc.get('mw', 'N/D')}\n"
+                f"- log Kow (XLogP): {pc.get('logKow', 'N/D')}\n"
+                f"- IUPAC: {pc.get('iupac', 'N/D')}\n"
+                f"- SMILES: {pc.get('smiles', 'N/D')}"
+            ))
+        for order, priority, key, title in (
+            (1, 2, "toolbox_data", "Datos QSAR Toolbox"),
+            (2, 1, "profiling", "Resultados de perfilado"),
+            (3, 3, "category", "Categoría / análogos (read-across)"),
+        ):
+            if not part.get(key):
+                continue
+            label = f"**{title}{suffix}:**"
+            fingerprint = compact_json(project_payload(part[key]))
+            if fingerprint in seen:
+                # Shared category or identical profiling: state it once
+                optional.append(((i, order), (priority, i), None, f"{label} idéntico a {seen[fingerprint]}"))
+                continue
+            seen[fingerprint] = substance_label(part)
+            optional.append(((i, order), (priority, i), label, part[key]))
+
+    used = estimate_tokens("\n\n".join(head + tail))
+    admitted = []
+    omitted = []
+    for order, _, label, payload in sorted(optional, key=lambda s: s[1]):
+        if label is None:
+            candidates = [payload]
+        else:
+            candidates = []
+            max_items = PROMPT_MAX_LIST_ITEMS
+            while max_items >= 1:
+                candidates.append(f"{label} {compact_json(project_payload(payload, max_items))}")
+                max_items //= 2
+        for text in candidates:
+            cost = estimate_tokens(text)
+            if used + cost <= PROMPT_TOKEN_BUDGET:
+                admitted.append((order, text))
+                used += cost
+                break
+        else:
+            omitted.append(label or payload.split("\n", 1)[0])
+
+    body = [text for _, text in sorted(admitted)]
+    if omitted:
+        body.append(f"_(Omitido por límite de contexto: {', '.join(omitted)})_")
+    prompt = "\n\n".join(head + body + tail)
+
+    verbose = sum(
+        len(json.dumps(part.get(k), ensure_ascii=False, indent=2))
+        for part in parts for k in ("toolbox_data", "profiling", "category") if part.get(k)
+    )
+    log.info(
+        f"Prompt: ~{estimate_tokens(prompt)} tokens (raw Toolbox payloads ~{int(verbose / PROMPT_CHARS_PER_TOKEN)} tokens, "
+        f"budget {PROMPT_TOKEN_BUDGET}{', omitted ' + str(len(omitted)) if omitted else ''})"
+    )
+    return prompt
+
+
+# ──────────────────────────────────────────────
+# GEMINI CLIENT
+# ──────────────────────────────────────────────
+# Off by default: the SDK import is the cost lazy loading exists to avoid
+GEMINI_PREWARM = _env_bool("GEMINI_PREWARM", False)
+
+_gemini_lock = threading.Lock()
+_gemini_clients: dict = {}   # (model name, system prompt) -> genai.GenerativeModel
+_gemini_models: dict = {}    # system prompt -> GeminiModel
+
+
+def genai():
+    """google.generativeai, imported (and configured) on first use."""
+    module = lazy_import("google.generativeai")
+    if GEMINI_KEY and not getattr(module, "_qsar_configured", False):
+        if GEMINI_API_ENDPOINT:
+            module.configure(
+                api_key=GEMINI_KEY, transport="rest",
+                client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+            )
+        else:
+            module.configure(api_key=GEMINI_KEY)
+        module._qsar_configured = True
+    return module
+
+
+def is_model_unavailable(error: Exception) -> bool:
+    """True for errors meaning the model itself is unusable (not a transient failure)."""
+    exceptions = lazy_import("google.api_core.exceptions")
+    return isinstance(error, (
+        exceptions.NotFound,
+        exceptions.PermissionDenied,
+        exceptions.FailedPrecondition,
+    ))
+
+
+def _gemini_client(model_name: str, system_prompt: str):
+    key = (model_name, system_prompt)
+    client = _gemini_clients.get(key)
+    if client is not None:
+        return client
+    module = genai()   # the slow first import runs outside _gemini_lock
+    with _gemini_lock:
+        client = _gemini_clients.get(key)
+        if client is None:
+            client = module.GenerativeModel(model_name=model_name, system_instruction=system_prompt)
+            _gemini_clients[key] = client
+        return client
+
+
+def _first_chunk_read(chunks):
+    """Iterate a streamed response, reading its first chunk now so errors surface here."""
+    chunks = iter(chunks)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter(())
+    return itertools.chain((first,), chunks)
+
+
+async def _first_chunk_read_async(chunks):
+    """Async version of _first_chunk_read."""
+    chunks = chunks.__aiter__()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def rest():
+        if first is None:
+            return
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return rest()
+
+
+async def _chunks_in_thread(chunks):
+    """Async iteration over a blocking streamed response, each chunk read in a worker thread."""
+    import asyncio
+
+    chunks = iter(chunks)
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+class GeminiModel:
+    """
+    Gemini client with a configured fallback model.
+
+    Calls go to the active model. Only when it reports itself unavailable
+    (not found, no access) is the call retried on the other model, which
+    then becomes the active model for the rest of the process if it answers;
+    transient errors (timeouts, quota, 5xx) are raised as they are. Streamed
+    calls read their first chunk before returning, so an unavailable model
+    also falls back when the error only surfaces once iteration starts. The
+    first call of the process runs `check()`, which makes the same choice
+    up front with a metadata lookup.
+    """
+
+    def __init__(self, primary: str, fallback: str, system_prompt: str):
+        self.primary = primary
+        self.fallback = fallback if fallback and fallback != primary else None
+        self.system_prompt = system_prompt
+        self.active = primary
+        self._checked = False
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return self.active
+
+    def _candidates(self) -> list:
+        with self._lock:
+            names = [self.active]
+        other = self.fallback if self.active == self.primary else self.primary
+        if other:
+            names.append(other)
+        return names
+
+    def _select(self, name: str, reason: Exception):
+        with self._lock:
+            if self.active != name:
+                log.warning(f"Gemini: {self.active} no disponible ({reason}); usando {name}")
+                self.active = name
+
+    def _ensure_checked(self) -> None:
+        with self._lock:
+            if self._checked:
+                return
+            self._checked = True
+        self.check()
+
+    def generate(self, prompt, stream: bool = False, **kwargs) -> tuple:
+        """Generate with the active model (falling back if unavailable): (response, model that answered)."""
+        self._ensure_checked()
+        first_error = None
+        for name in self._candidates():
+            try:
+                response = _gemini_client(name, self.system_prompt).generate_content(prompt, stream=stream, **kwargs)
+                if stream:
+                    response = _first_chunk_read(response)
+            except Exception as e:
+                if not is_model_unavailable(e):
+                    raise
+                log.warning(f"Gemini {name} call failed: {e}")
+                first_error = first_error or e
+                continue
+            if first_error is not None:
+                self._select(name, first_error)
+            return response, name
+        raise first_error
+
+    async def generate_async(self, prompt, stream: bool = False, **kwargs) -> tuple:
+        """Async version of generate()."""
+        import asyncio   # only the ASGI mode calls this, and it has asyncio loaded already
+        if GEMINI_API_ENDPOINT:
+            # The REST transport has no async client: run the blocking call in a thread instead
+            response, name = await asyncio.to_thread(self.generate, prompt, stream, **kwargs)
+            return (_chunks_in_thread(response) if stream else response), name
+        await asyncio.to_thread(self._ensure_checked)
+        first_error = None
+        for name in self._candidates():
+            try:
+                client = _gemini_client(name, self.system_prompt)
+                response = await client.generate_content_async(prompt, stream=stream, **kwargs)
+                if stream:
+                    response = await _first_chunk_read_async(response)
+            except Exception as e:
+                if not is_model_unavailable(e):
+                    raise
+                log.warning(f"Gemini {name} call failed: {e}")
+                first_error = first_error or e
+                continue
+            if first_error is not None:
+                self._select(name, first_error)
+            return response, name
+        raise first_error
+
+    def generate_content(self, prompt, **kwargs):
+        return self.generate(prompt, **kwargs)[0]
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return (await self.generate_async(prompt, **kwargs))[0]
+
+    def check(self) -> Optional[str]:
+        """Pick the first model the API knows about (one metadata lookup per candidate)."""
+        first_error = None
+        for name in self._candidates():
+            try:
+                genai().get_model(f"models/{name}")
+            except Exception as e:
+                log.warning(f"Gemini {name} check failed: {e}")
+                if not is_model_unavailable(e):
+                    return None   # transient: keep the configured model
+                first_error = first_error or e
+                continue
+            if first_error is not None:
+                self._select(name, first_error)
+            log.info(f"Gemini: modelo activo {name}")
+            return name
+        return None
+
+
+def warm_gemini():
+    """Import the SDK and create the chat model clients (no network calls)."""
+    try:
+        model = get_gemini_model()
+        for name in model._candidates():
+            _gemini_client(name, model.system_prompt)
+    except Exception as e:
+        log.warning(f"Gemini warm-up failed: {e}")
+
+
+if GEMINI_KEY and GEMINI_PREWARM:
+    threading.Thread(target=warm_gemini, name="gemini-warmup", daemon=True).start()
+
+
+# ──────────────────────────────────────────────
+# MAIN CHAT ENDPOINT
+# ──────────────────────────────────────────────
+def get_gemini_model(system_prompt: str = SYSTEM_PROMPT) -> "GeminiModel":
+    """Return the shared Gemini client for `system_prompt` (one per worker)."""
+    with _gemini_lock:
+        model = _gemini_models.get(system_prompt)
+        if model is None:
+            model = GeminiModel(GEMINI_MODEL, GEMINI_FALLBACK_MODEL, system_prompt)
+            _gemini_models[system_prompt] = model
+        return model
+
+
+def build_card_data(toolbox_results: dict, body: dict):
+    """
+    Build structured card data for the frontend (if molecule found).
+
+    A multi-substance analysis returns a list with one card per substance
+    that was found.
+    """
+    if toolbox_results.get("substances"):
+        cards = [
+            build_card_data(part, {"moleculeName": part.get("name") or part.get("cas")})
+            for part in toolbox_results["substances"]
+        ]
+        return [card for card in cards if card] or None
+
+    if not (toolbox_results.get("cas") and toolbox_results.get("pubchem_data")):
+        return None
+
+    pc = toolbox_results["pubchem_data"]
+    cas = toolbox_results["cas"]
+
+    card_data = {
+        "molecule": {
+            "cas": cas,
+            "name": body.get("moleculeName", cas),
+            "formula": pc.get("formula"),
+            "mw": pc.get("mw"),
+            "logKow": pc.get("logKow"),
+            "smiles": pc.get("smiles"),
+        },
+        "endpoints": [],
+        "alerts": [],
+    }
+
+    # Parse profiling alerts if available
+    if toolbox_results.get("profiling"):
+        prof = toolbox_results["profiling"]
+        if isinstance(prof, dict):
+            alerts = prof.get("alerts", [])
+            for alert in alerts[:6]:
+                card_data["alerts"].append({
+                    "text": alert.get("name", "Alerta"),
+                    "level": "amber" if alert.get("risk") == "low" else "red"
+                })
+
+    return card_data
+
+
+def chat_metadata(toolbox_results: dict) -> dict:
+    """Response fields shared by the JSON and streaming chat endpoints."""
+    parts = analysis_parts(toolbox_results)
+    metadata = {
+        "toolbox_connected": any(part.get("toolbox_data") is not None for part in parts),
+        "pubchem_enriched": any(part.get("pubchem_data") is not None for part in parts),
+        "cas": toolbox_results.get("cas"),
+        "invalid_cas": toolbox_results.get("invalid_cas", []),
+        "stages": toolbox_results.get("stages"),
+        "degraded": toolbox_results.get("degraded", False),
+    }
+    if toolbox_results.get("substances"):
+        metadata["substances"] = [
+            {"cas": part.get("cas"), "name": part.get("name")} for part in parts
+        ]
+    return metadata
+
+
+class ReportCache:
+    """
+    LLM cache lookups for one chat request.
+
+    `lookup()` runs before the analysis with a key built from the request
+    alone (normalized query, options, language, active model, system prompt
+    and Toolbox version), so a repeated question skips the Toolbox and
+    PubChem lookups as well as the model call. `lookup_prompt()` runs once
+    the prompt is built and catches differently worded requests that lead
+    to the same analysis. `store()` saves the report under both keys, for
+    the model that actually answered. Entries are dicts with the message,
+    the card data and the response metadata.
+    """
+
+    def __init__(self, body: dict, query: str, options: dict, language: str):
+        self.bypass = body.get("cache") == "bypass"
+        self.status = "BYPASS" if self.bypass else "MISS"
+        self.request = {
+            "query": normalize_identifier(query),
+            "options": options,
+            "language": language,
+            "molecule": body.get("moleculeName"),
+        }
+        self.prompt = None
+
+    @staticmethod
+    def _digest(fields: dict) -> str:
+        blob = json.dumps({**fields, "system": SYSTEM_PROMPT}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def request_key(self, model_name: str) -> str:
+        return "request:" + self._digest({
+            **self.request, "model": model_name, "toolbox_version": lookup_cache.toolbox_version,
+        })
+
+    def prompt_key(self, model_name: str) -> str:
+        return "prompt:" + self._digest({"prompt": self.prompt, "model": model_name})
 
-    if toolbox_results.get("cas"):
-        context_parts.append(f"**Número CAS identificado:** {toolbox_results['cas']}")
+    def _get(self, key: str) -> Optional[dict]:
+        if self.bypass:
+            return None
+        entry = llm_cache.lookup("llm", key)
+        if not isinstance(entry, dict) or not entry.get("message"):
+            return None   # miss, or bare text stored by older versions
+        self.status = "HIT"
+        return entry
 
-    if toolbox_results.get("pubchem_data"):
-        pc = toolbox_results["pubchem_data"]
-        context_parts.append(
-            f"**Datos PubChem:**\n"
-            f"- Fórmula: {pc.get('formula', 'N/D')}\n"
-            f"- Peso molecular: {pc.get('mw', 'N/D')}\n"
-            f"- log Kow (XLogP): {pc.get('logKow', 'N/D')}\n"
-            f"- IUPAC: {pc.get('iupac', 'N/D')}\n"
-            f"- SMILES: {pc.get('smiles', 'N/D')}"
-        )
+    def lookup(self, model_name: str) -> Optional[dict]:
+        """Cached report for this request, before running the analysis."""
+        return self._get(self.request_key(model_name))
 
-    if toolbox_results.get("toolbox_data"):
-        context_parts.append(
-            f"**Datos QSAR Toolbox:** {json.dumps(toolbox_results['toolbox_data'], ensure_ascii=False, indent=2)}"
-        )
+    def lookup_prompt(self, prompt: str, model_name: str) -> Optional[dict]:
+        """Cached report for the built prompt."""
+        self.prompt = prompt
+        return self._get(self.prompt_key(model_name))
 
-    if toolbox_results.get("profiling"):
-        context_parts.append(
-            f"**Resultados de perfilado:** {json.dumps(toolbox_results['profiling'], ensure_ascii=False, indent=2)}"
-        )
+    def store(self, message: str, model_name: str, toolbox_results: dict, card_data, metadata: dict) -> None:
+        """Save a report generated by `model_name` from a complete analysis."""
+        if not message or not llm_cacheable(toolbox_results):
+            return
+        entry = {"message": message, "data": card_data, "metadata": metadata}
+        llm_cache.store("llm", self.request_key(model_name), entry)
+        if self.prompt is not None:
+            llm_cache.store("llm", self.prompt_key(model_name), entry)
 
-    context_parts.append(f"\n{lang_instruction}")
-    context_parts.append(
-        "Proporciona un análisis regulatorio completo, técnico y bien estructurado."
-    )
 
-    return "\n\n".join(context_parts)
+def llm_cacheable(toolbox_results: dict) -> bool:
+    """Only reports built from a complete analysis are worth reusing."""
+    if toolbox_results.get("degraded"):
+        return False
+    return not any(s in ("timeout", "error", "partial") for s in (toolbox_results.get("stages") or {}).values())
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
-# ──────────────────────────────────────────────
-# MAIN CHAT ENDPOINT
-# ──────────────────────────────────────────────
 @app.route("/api/chat", methods=["POST"])
 @require_key
 def chat():
     """Main chat endpoint: orchestrates Toolbox + Gemini."""
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return chat_stream()
+
+    body = read_json()
     try:
-        body = request.get_json(force=True)
         query = body.get("query", "").strip()
         options = body.get("options", {})
         language = body.get("language", "es")
@@ -370,76 +3528,135 @@ def chat():
         if not query:
             return jsonify({"error": "Query vacío"}), 400
 
-        log.info(f"Chat query: {query[:80]}…")
-
-        # Step 1: Run QSAR Toolbox analysis
-        toolbox_results = run_toolbox_analysis(query, options)
-
-        # Step 2: Build prompt
-        user_prompt = build_llm_prompt(query, toolbox_results, language)
-
-        # Step 3: Call Gemini
         if not GEMINI_KEY:
             return jsonify({"error": "GEMINI_API_KEY no configurado"}), 503
 
-        try:
-            gemini_model = genai.GenerativeModel(
-                model_name="gemini-1.0-pro",
-                system_instruction=SYSTEM_PROMPT
-            )
-        except Exception:
-            # Fallback to gemini-pro
-            gemini_model = genai.GenerativeModel(
-                model_name="gemini-pro",
-                system_instruction=SYSTEM_PROMPT
-            )
-        response = gemini_model.generate_content(user_prompt)
-        response_text = response.text
+        log.info(f"Chat query: {query[:80]}…")
 
-        # Step 4: Build structured card data (if molecule found)
-        card_data = None
-        if toolbox_results.get("cas") and toolbox_results.get("pubchem_data"):
-            pc = toolbox_results["pubchem_data"]
-            cas = toolbox_results["cas"]
+        # Step 1: Reuse an earlier report for the same request
+        gemini_model = get_gemini_model()
+        report_cache = ReportCache(body, query, options, language)
+        report = report_cache.lookup(gemini_model.model_name)
 
-            card_data = {
-                "molecule": {
-                    "cas": cas,
-                    "name": body.get("moleculeName", cas),
-                    "formula": pc.get("formula"),
-                    "mw": pc.get("mw"),
-                    "logKow": pc.get("logKow"),
-                    "smiles": pc.get("smiles"),
-                },
-                "endpoints": [],
-                "alerts": [],
-            }
+        if report is None:
+            # Step 2: Run QSAR Toolbox analysis
+            with span("analysis"):
+                toolbox_results = run_toolbox_analysis(query, options)
+
+            # Step 3: Build prompt and structured card data (if molecule found)
+            with span("prompt"):
+                user_prompt = build_llm_prompt(query, toolbox_results, language)
+            card_data = build_card_data(toolbox_results, body)
+            metadata = chat_metadata(toolbox_results)
 
-            # Parse profiling alerts if available
-            if toolbox_results.get("profiling"):
-                prof = toolbox_results["profiling"]
-                if isinstance(prof, dict):
-                    alerts = prof.get("alerts", [])
-                    for alert in alerts[:6]:
-                        card_data["alerts"].append({
-                            "text": alert.get("name", "Alerta"),
-                            "level": "amber" if alert.get("risk") == "low" else "red"
-                        })
-
-        return jsonify({
-            "message": response_text,
-            "data": card_data,
-            "toolbox_connected": toolbox_results.get("toolbox_data") is not None,
-            "pubchem_enriched": toolbox_results.get("pubchem_data") is not None,
-            "cas": toolbox_results.get("cas"),
+            # Step 4: Call Gemini (or reuse a report for the same prompt)
+            cached = report_cache.lookup_prompt(user_prompt, gemini_model.model_name)
+            if cached is not None:
+                response_text, model_name = cached["message"], gemini_model.model_name
+            else:
+                with span("llm", gemini_model.model_name):
+                    response, model_name = gemini_model.generate(user_prompt)
+                    response_text = response.text
+            report_cache.store(response_text, model_name, toolbox_results, card_data, metadata)
+            report = {"message": response_text, "data": card_data, "metadata": metadata}
+
+        response = jsonify({
+            "message": report["message"],
+            "data": report["data"],
+            **report["metadata"],
             "timestamp": datetime.utcnow().isoformat(),
         })
+        response.headers["X-Cache"] = report_cache.status
+        return response
 
     except Exception as e:
         log.error(f"API error: {e}", exc_info=True)
         return jsonify({"error": f"Error de API: {str(e)}"}), 502
 
 
+@app.route("/api/chat/stream", methods=["POST"])
+@require_key
+def chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    Events, in order: `context` with the card data as soon as the Toolbox and
+    PubChem lookups finish, one `token` per chunk of generated text, and
+    `done` with the response metadata. Failures mid-stream are sent as an
+    `error` event.
+    """
+    body = read_json()
+    query = body.get("query", "").strip()
+    options = body.get("options", {})
+    language = body.get("language", "es")
+
+    if not query:
+        return jsonify({"error": "Query vacío"}), 400
+    if not GEMINI_KEY:
+        return jsonify({"error": "GEMINI_API_KEY no configurado"}), 503
+
+    log.info(f"Chat stream query: {query[:80]}…")
+
+    def generate():
+        # Flush headers right away so the client sees the connection open
+        yield ": stream open\n\n"
+
+        timer = start_request_timer()
+        try:
+            gemini_model = get_gemini_model()
+            report_cache = ReportCache(body, query, options, language)
+            report = report_cache.lookup(gemini_model.model_name)
+            if report is not None:
+                yield sse_event("context", {"data": report["data"], **report["metadata"]})
+                yield sse_event("token", {"text": report["message"]})
+                metadata = report["metadata"]
+            else:
+                with span("analysis"):
+                    toolbox_results = run_toolbox_analysis(query, options)
+                card_data = build_card_data(toolbox_results, body)
+                metadata = chat_metadata(toolbox_results)
+                yield sse_event("context", {"data": card_data, **metadata})
+
+                with span("prompt"):
+                    user_prompt = build_llm_prompt(query, toolbox_results, language)
+                cached = report_cache.lookup_prompt(user_prompt, gemini_model.model_name)
+                if cached is not None:
+                    parts, model_name = [cached["message"]], gemini_model.model_name
+                    yield sse_event("token", {"text": cached["message"]})
+                else:
+                    parts = []
+                    with span("llm", gemini_model.model_name):
+                        response, model_name = gemini_model.generate(user_prompt, stream=True)
+                        for chunk in response:
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                # Chunk without text parts (e.g. safety metadata only)
+                                continue
+                            if text:
+                                parts.append(text)
+                                yield sse_event("token", {"text": text})
+                report_cache.store("".join(parts), model_name, toolbox_results, card_data, metadata)
+
+            yield sse_event("done", {
+                **metadata,
+                "cache": report_cache.status,
+                # Headers are already sent, so the Server-Timing spans travel here
+                "timings": timer.as_list(),
+                "timestamp": datetime.utcnow().isoformat(),
+            })
+        except Exception as e:
+            log.error(f"Stream error: {e}", exc_info=True)
+            ERRORS.inc(route="/api/chat/stream", kind=type(e).__name__)
+            yield sse_event("error", {"error": f"Error de API: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ──────────────────────────────────────────────
 # DIRECT TOOLBOX ENDPOINTS (proxy)
 # ──────────────────────────────────────────────
@@ -450,8 +3667,16 @@ def toolbox_search():
     identifier = request.args.get("q", "")
     if not identifier:
         return jsonify({"error": "Parámetro 'q' requerido"}), 400
+    try:
+        identifier = checked_identifier(identifier)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    data = toolbox_get("substances/search", {"query": identifier})
+    data = lookup_cache.get_or_compute(
+        "toolbox_search", identifier,
+        lambda: toolbox_get("substances/search", {"query": identifier}),
+        payload={"query": identifier},
+    )
     if data is None:
         return jsonify({"error": "Toolbox no disponible", "fallback": True}), 503
 
@@ -472,22 +3697,27 @@ def toolbox_substance_details(substance_id):
 @require_key
 def toolbox_profile():
     """Run profiling for a CAS number."""
-    body = request.get_json(force=True)
-    cas = body.get("cas")
-    if not cas:
-        return jsonify({"error": "CAS requerido"}), 400
-
-    profilers = body.get("profilers", ["mutagenicity", "aquatic_toxicity", "skin_sensitization"])
+    body = read_json()
+    try:
+        cas = checked_cas(body.get("cas"))
+        profilers = checked_profilers(body.get("profilers"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    data = toolbox_post("profiling/run", {
-        "cas": cas,
-        "profilers": profilers
-    })
+    report = {}
+    if PROFILING_SPLIT:
+        data = run_profiling(cas, profilers, report=report)
+    else:
+        data = lookup_cache.get_or_compute(
+            "profiling", cas,
+            lambda: toolbox_post("profiling/run", {"cas": cas, "profilers": profilers}),
+            payload={"profilers": profilers},
+        )
 
     if data is None:
         return jsonify({"error": "Toolbox no disponible"}), 503
 
-    return jsonify(data)
+    return jsonify({**data, **report})
 
 
 @app.route("/api/toolbox/profilers")
@@ -496,16 +3726,7 @@ def toolbox_profilers():
     """Get list of available profilers."""
     data = toolbox_get("profiling/available")
     if data is None:
-        return jsonify({
-            "profilers": [
-                "mutagenicity",
-                "aquatic_toxicity",
-                "skin_sensitization",
-                "biodegradation",
-                "ecotoxicity",
-                "reproductive_toxicity"
-            ]
-        }), 200
+        return jsonify({"profilers": FALLBACK_PROFILERS}), 200
     return jsonify(data)
 
 
@@ -513,61 +3734,237 @@ def toolbox_profilers():
 @require_key
 def toolbox_category():
     """Build chemical category for a CAS number."""
-    body = request.get_json(force=True)
-    cas = body.get("cas")
-    if not cas:
-        return jsonify({"error": "CAS requerido"}), 400
+    body = read_json()
+    try:
+        cas = checked_cas(body.get("cas"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    data = toolbox_post("category/build", {"cas": cas})
+    data = lookup_cache.get_or_compute(
+        "category", cas, lambda: toolbox_post("category/build", {"cas": cas})
+    )
     if data is None:
         return jsonify({"error": "Toolbox no disponible"}), 503
 
     return jsonify(data)
 
 
-@app.route("/api/toolbox/datamatrix", methods=["POST"])
-@require_key
-def toolbox_datamatrix():
-    """Build data matrix for a category."""
-    body = request.get_json(force=True)
-    category_id = body.get("category_id")
-    endpoints = body.get("endpoints", [])
+def toolbox_job_request(kind: str, body: dict) -> tuple:
+    """
+    Validate a data-matrix or read-across request and return the Toolbox
+    (endpoint, payload) it maps to. Raises ValueError with the client message.
+    """
+    if kind == "datamatrix":
+        if not body.get("category_id"):
+            raise ValueError("category_id requerido")
+        return "category/datamatrix", {
+            "category_id": body["category_id"],
+            "endpoints": body.get("endpoints", []),
+        }
+    if kind == "readacross":
+        if not body.get("cas") or not body.get("endpoint"):
+            raise ValueError("CAS y endpoint son requeridos")
+        return "readacross/predict", {
+            "cas": checked_cas(body["cas"]),
+            "endpoint": body["endpoint"],
+            "confidence": body.get("confidence", 0.7),
+        }
+    raise ValueError(f"Tipo de trabajo desconocido: {kind}")
 
-    if not category_id:
-        return jsonify({"error": "category_id requerido"}), 400
 
-    data = toolbox_post("category/datamatrix", {
-        "category_id": category_id,
-        "endpoints": endpoints
-    })
+def wants_async(body: dict) -> bool:
+    return bool(body.get("async")) or request.args.get("async") in ("1", "true")
+
+
+def _toolbox_job_route(kind: str):
+    body = read_json()
+    try:
+        endpoint, payload = toolbox_job_request(kind, body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    if wants_async(body):
+        return submit_job_response(kind, body)
+
+    data = toolbox_post(endpoint, payload)
     if data is None:
         return jsonify({"error": "Toolbox no disponible"}), 503
 
     return jsonify(data)
 
 
-@app.route("/api/toolbox/readacross", methods=["POST"])
+DATAMATRIX_PAGE_DEFAULT = _env_int("DATAMATRIX_PAGE_DEFAULT", 100)
+DATAMATRIX_PAGE_MAX = _env_int("DATAMATRIX_PAGE_MAX", 1000)
+DATAMATRIX_STREAM_CHUNK = _env_int("DATAMATRIX_STREAM_CHUNK", 64 * 1024)
+
+# Keys under which a data matrix lists its rows, and a row names its analog
+_MATRIX_ROW_KEYS = ("rows", "matrix", "data", "analogs", "members")
+_MATRIX_ID_KEYS = ("analog", "cas", "name", "id", "substance_id")
+
+
+def matrix_rows(matrix) -> list:
+    """Normalize a Toolbox data matrix to [{"analog": id, "values": {endpoint: value}}]."""
+    rows = matrix
+    if isinstance(matrix, dict):
+        rows = next((matrix[k] for k in _MATRIX_ROW_KEYS if isinstance(matrix.get(k), list)), [])
+    normalized = []
+    for i, row in enumerate(rows if isinstance(rows, list) else []):
+        if not isinstance(row, dict):
+            normalized.append({"analog": str(i), "values": {"value": row}})
+            continue
+        analog = next((row[k] for k in _MATRIX_ID_KEYS if row.get(k) not in (None, "")), str(i))
+        values = row.get("values")
+        if not isinstance(values, dict):
+            values = {k: v for k, v in row.items() if k not in _MATRIX_ID_KEYS}
+        normalized.append({"analog": analog, "values": values})
+    return normalized
+
+
+def prepare_datamatrix(matrix) -> Optional[dict]:
+    """Normalized rows and endpoint list of a Toolbox data matrix, computed once and cached."""
+    if matrix is None:
+        return None
+    rows = matrix_rows(matrix)
+    endpoints = {}
+    for row in rows:
+        endpoints.update(dict.fromkeys(row["values"]))
+    return {
+        "category_id": matrix.get("category_id") if isinstance(matrix, dict) else None,
+        "rows": rows,
+        "endpoints": list(endpoints),
+    }
+
+
+def datamatrix_page(matrix: dict, view: str, offset: int, limit: int, columns: list = None) -> dict:
+    """
+    One page of a data matrix prepared by prepare_datamatrix().
+
+    `view="rows"` returns rows by analog; `view="columns"` returns the analog
+    ids of the page and one value array per endpoint. `columns` restricts
+    the endpoints included in either view.
+    """
+    rows = matrix["rows"]
+    endpoints = matrix["endpoints"]
+    selected = [e for e in endpoints if e in columns] if columns else endpoints
+
+    page = rows[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(rows) else None
+    result = {
+        "category_id": matrix["category_id"],
+        "view": view,
+        "total_rows": len(rows),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset,
+        "endpoints": selected,
+        "available_endpoints": endpoints,
+    }
+    if view == "columns":
+        result["analogs"] = [row["analog"] for row in page]
+        result["columns"] = {e: [row["values"].get(e) for row in page] for e in selected}
+    else:
+        result["rows"] = [
+            {"analog": row["analog"], "values": {e: row["values"][e] for e in selected if e in row["values"]}}
+            for row in page
+        ]
+    return result
+
+
+def datamatrix_view_params(params: dict) -> tuple:
+    """(view, offset, limit, columns) of a paginated data-matrix request. Raises ValueError."""
+    view = params.get("view")
+    if view not in ("rows", "columns"):
+        raise ValueError("view debe ser 'rows' o 'columns'")
+    try:
+        offset = max(int(params.get("offset", 0)), 0)
+        limit = min(max(int(params.get("limit", DATAMATRIX_PAGE_DEFAULT)), 1), DATAMATRIX_PAGE_MAX)
+    except (TypeError, ValueError):
+        raise ValueError("offset y limit deben ser enteros")
+    columns = params.get("columns")
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+    return view, offset, limit, columns or None
+
+
+def datamatrix_cache_payload(payload: dict) -> dict:
+    """Cache key fields of a data matrix (entries hold the prepare_datamatrix() form)."""
+    return {"endpoints": payload["endpoints"], "prepared": True}
+
+
+def load_datamatrix(endpoint: str, payload: dict) -> Optional[dict]:
+    """Prepared data matrix for `payload`, cached so that successive pages reuse one Toolbox build."""
+    return lookup_cache.get_or_compute(
+        "datamatrix", payload["category_id"],
+        lambda: prepare_datamatrix(toolbox_post(endpoint, payload)),
+        payload=datamatrix_cache_payload(payload),
+    )
+
+
+def wants_stream(body: dict) -> bool:
+    return bool(body.get("stream")) or request.args.get("stream") in ("1", "true")
+
+
+def stream_toolbox_post(endpoint: str, payload: dict):
+    """Relay a Toolbox POST response body chunk by chunk, without parsing it."""
+    try:
+        r = toolbox_client.post(endpoint, json=payload, stream=True)
+    except (UpstreamUnavailable, requests.exceptions.RequestException) as e:
+        log.warning(f"Toolbox POST {endpoint} (stream) failed: {e}")
+        return jsonify({"error": "Toolbox no disponible"}), 503
+    if not r.ok:
+        log.warning(f"Toolbox POST {endpoint} (stream) returned HTTP {r.status_code}")
+        r.close()
+        return jsonify({"error": "Toolbox no disponible"}), 503
+
+    def generate():
+        try:
+            for chunk in r.iter_content(chunk_size=DATAMATRIX_STREAM_CHUNK):
+                if chunk:
+                    yield chunk
+        finally:
+            r.close()
+
+    return Response(
+        stream_with_context(generate()),
+        content_type=r.headers.get("Content-Type", "application/json"),
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/toolbox/datamatrix", methods=["POST"])
 @require_key
-def toolbox_readacross():
-    """Perform read-across prediction for a substance."""
-    body = request.get_json(force=True)
-    cas = body.get("cas")
-    endpoint = body.get("endpoint")
+def toolbox_datamatrix():
+    """
+    Build data matrix for a category.
 
-    if not cas or not endpoint:
-        return jsonify({"error": "CAS y endpoint son requeridos"}), 400
+    `"async": true` runs it as a job, `"stream": true` relays the Toolbox
+    body as it arrives, and `"view": "rows" | "columns"` (with `offset`,
+    `limit`, `columns`) returns one page of the matrix.
+    """
+    body = read_json()
+    if wants_async(body) or not (wants_stream(body) or body.get("view") or request.args.get("view")):
+        return _toolbox_job_route("datamatrix")
 
-    data = toolbox_post("readacross/predict", {
-        "cas": cas,
-        "endpoint": endpoint,
-        "confidence": body.get("confidence", 0.7)
-    })
+    try:
+        endpoint, payload = toolbox_job_request("datamatrix", body)
+        if wants_stream(body):
+            return stream_toolbox_post(endpoint, payload)
+        view, offset, limit, columns = datamatrix_view_params({**request.args.to_dict(), **body})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    data = load_datamatrix(endpoint, payload)
     if data is None:
         return jsonify({"error": "Toolbox no disponible"}), 503
 
-    return jsonify(data)
+    return jsonify(datamatrix_page(data, view, offset, limit, columns))
+
+
+@app.route("/api/toolbox/readacross", methods=["POST"])
+@require_key
+def toolbox_readacross():
+    """Perform read-across prediction for a substance (`"async": true` runs it as a job)."""
+    return _toolbox_job_route("readacross")
 
 
 @app.route("/api/pubchem")
@@ -576,6 +3973,10 @@ def pubchem_lookup():
     identifier = request.args.get("q", "")
     if not identifier:
         return jsonify({"error": "Parámetro 'q' requerido"}), 400
+    try:
+        identifier = checked_identifier(identifier)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     data = get_pubchem_data(identifier)
     if data:
@@ -583,10 +3984,779 @@ def pubchem_lookup():
     return jsonify({"error": "No encontrado en PubChem"}), 404
 
 
+# ──────────────────────────────────────────────
+# BACKGROUND JOBS (read-across, data matrix)
+# ──────────────────────────────────────────────
+JOB_WORKERS = _env_int("JOB_WORKERS", 2)
+JOB_QUEUE_MAX = _env_int("JOB_QUEUE_MAX", 50)
+JOB_RESULT_TTL = _env_float("JOB_RESULT_TTL", 3600)
+JOB_MAX_WAIT = _env_float("JOB_MAX_WAIT", 30)
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite3"))
+
+
+class JobStore:
+    """
+    Long-running Toolbox calls run off the request path.
+
+    Jobs execute on a bounded pool in the worker that accepted them; their
+    state and results live in a SQLite file so any gunicorn worker can answer
+    a poll. Finished jobs are kept for `result_ttl` seconds. A job left
+    queued or running by a worker that no longer exists is reported as failed.
+    """
+
+    def __init__(self, path: str, workers: int, queue_max: int, result_ttl: float):
+        self.path = path
+        self.queue_max = queue_max
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="job")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._done = {}   # job id -> threading.Event, for jobs of this worker
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "rejected": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT, status TEXT, params TEXT, result TEXT,"
+                " error TEXT, pid INTEGER, created REAL, started REAL, finished REAL, expires REAL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, job_id: str, **fields) -> None:
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        db = self._db()
+        db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        db.commit()
+
+    def submit(self, kind: str, params: dict, fn) -> Optional[str]:
+        """Queue `fn()` as a job; returns its id, or None when the queue is full."""
+        with self._lock:
+            if self._pending >= self.queue_max:
+                self.counters["rejected"] += 1
+                return None
+            self._pending += 1
+            self.counters["submitted"] += 1
+        self.purge()
+
+        job_id = uuid.uuid4().hex
+        try:
+            db = self._db()
+            db.execute(
+                "INSERT INTO jobs (id, kind, status, params, pid, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), os.getpid(), time.time()),
+            )
+            db.commit()
+            with self._lock:
+                self._done[job_id] = threading.Event()
+            self._executor.submit(self._run, job_id, kind, fn)
+        except Exception as e:
+            # The job never reached a worker: give its queue slot back
+            with self._lock:
+                self._pending -= 1
+                self._done.pop(job_id, None)
+            try:
+                self._update(job_id, status="failed", error=str(e), finished=time.time(), expires=time.time())
+            except sqlite3.Error:
+                pass
+            raise
+        log.info(f"Job {job_id} ({kind}) queued")
+        return job_id
+
+    def _run(self, job_id: str, kind: str, fn) -> None:
+        started = time.time()
+        try:
+            self._update(job_id, status="running", started=started)
+            try:
+                result = fn()
+                error = None if result is not None else "Toolbox no disponible"
+            except Exception as e:
+                log.warning(f"Job {job_id} ({kind}) failed: {e}")
+                result, error = None, str(e)
+            finished = time.time()
+            self._update(
+                job_id,
+                status="failed" if error else "succeeded",
+                result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error=error, finished=finished, expires=finished + self.result_ttl,
+            )
+            STAGE_DURATION.observe(finished - started, stage=f"job_{kind}")
+            with self._lock:
+                self.counters["failed" if error else "succeeded"] += 1
+            log.info(f"Job {job_id} ({kind}) {'failed' if error else 'done'} in {finished - started:.1f}s")
+        except sqlite3.Error as e:
+            log.error(f"Job store write failed for {job_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                event = self._done.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    def get(self, job_id: str, include_result: bool = False) -> Optional[dict]:
+        row = self._db().execute(
+            "SELECT id, kind, status, result, error, pid, created, started, finished, expires"
+            " FROM jobs WHERE id = ?", (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, result, error, pid, created, started, finished, expires = row
+        if expires is not None and expires <= time.time():
+            return None
+        if status in ("queued", "running") and not _process_alive(pid):
+            status, error = "failed", "El proceso que ejecutaba el trabajo terminó"
+            self._update(job_id, status=status, error=error, finished=time.time(),
+                         expires=time.time() + self.result_ttl)
+        job = {
+            "job_id": job_id,
+            "type": kind,
+            "status": status,
+            "created": _iso(created),
+            "started": _iso(started),
+            "finished": _iso(finished),
+            "expires": _iso(expires),
+        }
+        if started:
+            job["elapsed_s"] = round((finished or time.time()) - started, 2)
+        if error:
+            job["error"] = error
+        if include_result and result is not None:
+            job["result"] = json.loads(result)
+        return job
+
+    def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Long-poll: return the job once finished, or its current state after `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            event = self._done.get(job_id)
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in ("succeeded", "failed") or remaining <= 0:
+                return job
+            if event is not None:
+                # Local job: wake up as soon as it finishes
+                event.wait(remaining)
+                event = None
+            else:
+                # Job owned by another worker: watch the store
+                time.sleep(min(0.5, remaining))
+
+    def purge(self) -> None:
+        try:
+            db = self._db()
+            db.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            db.commit()
+        except sqlite3.Error as e:
+            log.warning(f"Job store purge failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending, "queue_max": self.queue_max, **self.counters}
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+jobs = JobStore(JOB_STORE_PATH, JOB_WORKERS, JOB_QUEUE_MAX, JOB_RESULT_TTL)
+
+
+def queue_toolbox_job(kind: str, body: dict) -> Optional[dict]:
+    """Queue a data-matrix or read-across job; returns its descriptor, or None if the queue is full."""
+    endpoint, payload = toolbox_job_request(kind, body)
+    job_id = jobs.submit(kind, payload, partial(toolbox_post, endpoint, payload))
+    if job_id is None:
+        return None
+    status_url = f"/api/jobs/{job_id}"
+    return {
+        "job_id": job_id,
+        "type": kind,
+        "status": "queued",
+        "status_url": status_url,
+        "result_url": f"{status_url}/result",
+    }
+
+
+def submit_job_response(kind: str, body: dict):
+    """Queue a job and answer 202 pointing at its status URL."""
+    job = queue_toolbox_job(kind, body)
+    if job is None:
+        return jsonify({"error": "Cola de trabajos llena, reintenta más tarde"}), 429
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = job["status_url"]
+    return response
+
+
+@app.route("/api/jobs", methods=["POST"])
+@require_key
+def submit_job():
+    """Submit a job: {"type": "datamatrix" | "readacross", ...same fields as the direct endpoint}."""
+    body = read_json()
+    try:
+        toolbox_job_request(body.get("type", ""), body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return submit_job_response(body["type"], body)
+
+
+@app.route("/api/jobs/<job_id>")
+@require_key
+def job_status(job_id):
+    """Job state; `?wait=N` long-polls up to N seconds (max JOB_MAX_WAIT) for it to finish."""
+    try:
+        wait_s = min(float(request.args.get("wait", 0)), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "Parámetro 'wait' inválido"}), 400
+    job = jobs.wait(job_id, wait_s) if wait_s > 0 else jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado o expirado"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<job_id>/result")
+@require_key
+def job_result(job_id):
+    """Result of a finished job: 200 with the Toolbox data, 202 while pending, 502 if it failed."""
+    job = jobs.get(job_id, include_result=True)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado o expirado"}), 404
+    if job["status"] == "succeeded":
+        return jsonify(job["result"])
+    if job["status"] == "failed":
+        return jsonify({"error": job.get("error"), "job_id": job_id}), 502
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Retry-After"] = "2"
+    return response
+
+
+# ──────────────────────────────────────────────
+# BATCH SCREENING
+# ──────────────────────────────────────────────
+BATCH_PARALLELISM = _env_int("BATCH_PARALLELISM", 4)
+BATCH_MAX_PARALLELISM = _env_int("BATCH_MAX_PARALLELISM", 16)
+BATCH_MAX_SUBSTANCES = _env_int("BATCH_MAX_SUBSTANCES", 500)
+
+# Analysis stages per screened substance (search, PubChem, profiling, category);
+# each batch sizes its own stage pool from it instead of using the chat's
+BATCH_STAGES_PER_SUBSTANCE = 4
+
+
+def parse_batch_identifiers() -> tuple:
+    """
+    Read the substance list and options of a batch request.
+
+    Accepts a JSON body ({"substances": [...], "options": {...}}) or a
+    multipart upload with a CSV `file` whose `cas`, `name` or `identifier`
+    column (or, failing that, first column) holds the identifiers. Raises
+    ValueError when the body or the options are not JSON objects.
+    """
+    if "file" in request.files:
+        text = request.files["file"].read().decode("utf-8-sig", errors="replace")
+        rows = list(csv.reader(io.StringIO(text)))
+        column = 0
+        if rows:
+            header = [h.strip().lower() for h in rows[0]]
+            for name in ("cas", "name", "identifier", "nombre"):
+                if name in header:
+                    column = header.index(name)
+                    rows = rows[1:]
+                    break
+        identifiers = [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+        options = json.loads(request.form.get("options", "{}") or "{}")
+        parallelism = request.form.get("parallelism")
+    else:
+        body = request.get_json(force=True, silent=True)
+        if not isinstance(body, dict):
+            raise ValueError("se esperaba un objeto JSON")
+        substances = body.get("substances", [])
+        if not isinstance(substances, list):
+            raise ValueError("'substances' debe ser una lista")
+        identifiers = [str(s).strip() for s in substances if str(s).strip()]
+        options = body.get("options", {})
+        parallelism = body.get("parallelism")
+    if not isinstance(options, dict):
+        raise ValueError("'options' debe ser un objeto JSON")
+
+    try:
+        parallelism = int(parallelism) if parallelism else BATCH_PARALLELISM
+    except (TypeError, ValueError):
+        parallelism = BATCH_PARALLELISM
+    parallelism = max(1, min(parallelism, BATCH_MAX_PARALLELISM))
+    return identifiers, options, parallelism
+
+
+def screen_substance(index: int, identifier: str, options: dict, executor: ThreadPoolExecutor = None) -> dict:
+    """Run the analysis pipeline for one batch entry, its stages on the batch's `executor`."""
+    started = time.perf_counter()
+    try:
+        if looks_like_cas(identifier) and normalize_cas(identifier) is None:
+            # Rejected locally: no Toolbox or PubChem call for a bad check digit
+            results, status, error = {}, "invalid", f"CAS inválido: {identifier}"
+        else:
+            results = run_toolbox_analysis(identifier, options, executor)
+            status = "ok" if results.get("pubchem_data") or results.get("toolbox_data") else "not_found"
+            error = None
+    except Exception as e:
+        log.warning(f"Batch screening of {identifier} failed: {e}")
+        results, status, error = {}, "error", str(e)
+
+    return {
+        "index": index,
+        "input": identifier,
+        "status": status,
+        "error": error,
+        "cas": results.get("cas"),
+        "data": build_card_data(results, {"moleculeName": identifier}) if results else None,
+        "pubchem_data": results.get("pubchem_data"),
+        "toolbox_data": results.get("toolbox_data"),
+        "profiling": results.get("profiling"),
+        "category": results.get("category"),
+        "stages": results.get("stages"),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+@app.route("/api/batch/screen", methods=["POST"])
+@require_key
+def batch_screen():
+    """
+    Screen a list of CAS numbers or names with bounded parallelism.
+
+    Results are streamed as NDJSON, one line per substance in completion
+    order, followed by a final `summary` line.
+    """
+    try:
+        identifiers, options, parallelism = parse_batch_identifiers()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Lista de sustancias inválida: {e}"}), 400
+
+    if not identifiers:
+        return jsonify({"error": "Lista de sustancias vacía"}), 400
+    if len(identifiers) > BATCH_MAX_SUBSTANCES:
+        return jsonify({"error": f"Máximo {BATCH_MAX_SUBSTANCES} sustancias por solicitud"}), 400
+
+    log.info(f"Batch screening: {len(identifiers)} substances, parallelism {parallelism}")
+
+    def generate():
+        started = time.perf_counter()
+        counts = {"ok": 0, "not_found": 0, "invalid": 0, "error": 0}
+
+        executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="batch")
+        stage_executor = ThreadPoolExecutor(
+            max_workers=parallelism * BATCH_STAGES_PER_SUBSTANCE, thread_name_prefix="batch-stage",
+        )
+        if lookup_cache.enabled and len(identifiers) > parallelism:
+            # Warm the lookup cache with batched PubChem queries alongside the
+            # screening; the first `parallelism` entries start right away anyway
+            prefetch = [extract_cas(i) or i for i in identifiers[parallelism:]]
+            threading.Thread(
+                target=contextvars.copy_context().run, args=(get_pubchem_data_batch, prefetch),
+                name="batch-prefetch", daemon=True,
+            ).start()
+        try:
+            futures = [
+                executor.submit(screen_substance, i, identifier, options, stage_executor)
+                for i, identifier in enumerate(identifiers)
+            ]
+            for future in as_completed(futures):
+                line = future.result()
+                counts[line["status"]] += 1
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+            yield json.dumps({"summary": {
+                "total": len(identifiers),
+                **counts,
+                "parallelism": parallelism,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }}) + "\n"
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            stage_executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ──────────────────────────────────────────────
+# WATCHLIST WARM-UP
+# ──────────────────────────────────────────────
+WATCHLIST_PATH = os.environ.get("WATCHLIST_PATH", "")
+WATCHLIST_INTERVAL = _env_float("WATCHLIST_INTERVAL", 6 * 3600)
+WATCHLIST_STARTUP_DELAY = _env_float("WATCHLIST_STARTUP_DELAY", 10)
+WATCHLIST_CONCURRENCY = _env_int("WATCHLIST_CONCURRENCY", 2)
+# Re-fetch every lookup on each run instead of reusing entries that are still cached
+WATCHLIST_REFRESH = _env_bool("WATCHLIST_REFRESH", True)
+WATCHLIST_STATE_PATH = os.environ.get("WATCHLIST_STATE_PATH", os.path.join(".cache", "watchlist.sqlite3"))
+
+# Seconds /api/status reuses the watchlist summary before recomputing it
+WATCHLIST_SUMMARY_TTL = 30
+
+# Same pipeline as a chat request with every option on, so all its lookups are cached
+WATCHLIST_OPTIONS = {"profiling": True, "readAcross": True}
+
+
+def read_watchlist(path: str) -> tuple:
+    """
+    CAS numbers listed in a watchlist file: (valid, invalid).
+
+    One or more CAS per line (plain text or CSV); anything else on the line,
+    and lines starting with #, are ignored. Valid numbers are normalized and
+    deduplicated in file order.
+    """
+    valid, invalid = [], []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            if line.lstrip().startswith("#"):
+                continue
+            found = extract_identifiers(line)
+            valid.extend(cas for cas in found["cas"] if cas not in valid)
+            invalid.extend(found["invalid_cas"])
+    return valid, invalid
+
+
+class WatchlistWarmer:
+    """
+    Keeps the lookup cache warm for a portfolio of substances.
+
+    Runs the full analysis pipeline (Toolbox search, PubChem, default
+    profilers, category) for every CAS in the watchlist shortly after startup
+    and then every `interval` seconds. With `refresh` the cache is bypassed,
+    so every lookup is fetched again and stored with a new expiry; the keys
+    each substance filled are kept, and coverage is judged from their expiry
+    in the lookup cache. Calls go through the shared upstream
+    clients, so rate limits and circuit breakers apply as for user traffic;
+    substances are skipped while the Toolbox circuit is open. Their stages
+    run on the warmer's own pool, never on the one chat requests share. Run
+    progress and per-substance outcomes live in a SQLite file, so any
+    gunicorn worker can report them and only one worker runs at a time.
+    """
+
+    def __init__(self, path: str, state_path: str, interval: float, concurrency: int, startup_delay: float,
+                 refresh: bool = True):
+        self.path = path
+        self.state_path = state_path
+        self.interval = interval
+        self.concurrency = max(concurrency, 1)
+        self.startup_delay = startup_delay
+        self.refresh = refresh
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._listed = (None, ([], []))
+        self._summary = (0.0, None)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def substances(self) -> tuple:
+        """read_watchlist() of the watchlist file, re-read only when the file changes."""
+        info = os.stat(self.path)
+        signature, listed = self._listed
+        if signature != (info.st_mtime, info.st_size):
+            listed = read_watchlist(self.path)
+            self._listed = ((info.st_mtime, info.st_size), listed)
+        return listed
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.state_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, started REAL, finished REAL,"
+                " total INTEGER, done INTEGER DEFAULT 0, failed INTEGER DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS substances ("
+                " cas TEXT PRIMARY KEY, status TEXT, stages TEXT, error TEXT,"
+                " duration_ms REAL, warmed REAL, keys TEXT)"
+            )
+            try:
+                conn.execute("ALTER TABLE substances ADD COLUMN keys TEXT")   # state files from before `keys`
+            except sqlite3.OperationalError:
+                pass
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _last_run(self) -> Optional[tuple]:
+        return self._db().execute(
+            "SELECT id, pid, started, finished, total, done, failed FROM runs ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+
+    def _begin(self, total: int, force: bool) -> Optional[int]:
+        """Register a new run; None while another live worker runs one, or ran one recently."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                last = self._last_run()
+                if last:
+                    _, pid, started, finished, _, _, _ = last
+                    if finished is None and _process_alive(pid):
+                        db.rollback()
+                        return None
+                    if not force and time.time() - started < max(self.interval / 2, 300):
+                        db.rollback()
+                        return None
+                cur = db.execute(
+                    "INSERT INTO runs (pid, started, total) VALUES (?, ?, ?)",
+                    (os.getpid(), time.time(), total),
+                )
+                db.commit()
+                return cur.lastrowid
+            except Exception:
+                db.rollback()
+                raise
+
+    def _warm(self, cas: str, executor: ThreadPoolExecutor) -> dict:
+        """Run the analysis for one CAS and describe how much of it is now cached."""
+        if toolbox_client.breaker.is_open:
+            return {"status": "deferred", "stages": {}, "error": "Toolbox no disponible", "duration_ms": 0}
+        started = time.perf_counter()
+        with lookup_cache.recording(refresh=self.refresh) as keys:
+            try:
+                stages = run_toolbox_analysis(cas, WATCHLIST_OPTIONS, executor)["stages"]
+                complete = all(s in ("ok", "cached") for s in stages.values())
+                outcome = {"status": "warm" if complete else "partial", "stages": stages, "error": None}
+            except Exception as e:
+                log.warning(f"Watchlist warm-up of {cas} failed: {e}")
+                outcome = {"status": "failed", "stages": {}, "error": str(e)}
+        outcome["keys"] = sorted(set(keys))
+        outcome["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return outcome
+
+    def run(self, force: bool = False) -> Optional[dict]:
+        """Warm every watchlist substance once; None when the run was not started here."""
+        if not self.enabled:
+            return None
+        try:
+            substances, invalid = self.substances()
+        except OSError as e:
+            log.warning(f"Watchlist {self.path} unreadable: {e}")
+            return None
+        if invalid:
+            log.warning(f"Watchlist: {len(invalid)} invalid CAS ignored: {', '.join(invalid[:10])}")
+        run_id = self._begin(len(substances), force)
+        if run_id is None:
+            return None
+
+        log.info(f"Watchlist warm-up: {len(substances)} substances")
+        started = time.perf_counter()
+        counts = {"warm": 0, "partial": 0, "failed": 0, "deferred": 0}
+        stage_executor = ThreadPoolExecutor(
+            max_workers=self.concurrency * BATCH_STAGES_PER_SUBSTANCE, thread_name_prefix="watchlist-stage",
+        )
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="watchlist")
+        with stage_executor, executor:
+            warm = partial(self._warm, executor=stage_executor)
+            for cas, outcome in zip(substances, executor.map(warm, substances)):
+                counts[outcome["status"]] += 1
+                with self._lock:
+                    db = self._db()
+                    db.execute(
+                        "INSERT OR REPLACE INTO substances (cas, status, stages, error, duration_ms, warmed, keys)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (cas, outcome["status"], json.dumps(outcome["stages"]), outcome["error"],
+                         outcome["duration_ms"], time.time(), json.dumps(outcome["keys"])),
+                    )
+                    db.execute(
+                        "UPDATE runs SET done = done + 1, failed = failed + ? WHERE id = ?",
+                        (int(outcome["status"] != "warm"), run_id),
+                    )
+                    db.commit()
+
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+            db.commit()
+        elapsed = time.perf_counter() - started
+        log.info(f"Watchlist warm-up done in {elapsed:.1f}s: {counts}")
+        return {"substances": len(substances), "invalid": invalid, "elapsed_s": round(elapsed, 1), **counts}
+
+    def _loop(self) -> None:
+        time.sleep(self.startup_delay)
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                log.warning(f"Watchlist warm-up failed: {e}")
+            if self.interval <= 0:
+                return
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        """Warm up in the background: after `startup_delay`, then every `interval` seconds."""
+        threading.Thread(target=self._loop, name="watchlist-warmup", daemon=True).start()
+
+    def stats(self, details: bool = False) -> dict:
+        """Progress of the latest run and cache coverage of the watchlist."""
+        if not self.enabled:
+            return {"enabled": False}
+        try:
+            substances, invalid = self.substances()
+        except OSError as e:
+            return {"enabled": True, "path": self.path, "error": str(e)}
+
+        report = {"enabled": True, "path": self.path, "interval_s": self.interval,
+                  "substances": len(substances), "invalid": invalid}
+        try:
+            last = self._last_run()
+            rows = {
+                row[0]: row
+                for row in self._db().execute(
+                    "SELECT cas, status, stages, error, duration_ms, warmed, keys FROM substances"
+                )
+            }
+        except sqlite3.Error as e:
+            log.warning(f"Watchlist state read failed: {e}")
+            return report
+
+        if last:
+            _, pid, started, finished, total, done, failed = last
+            report["last_run"] = {
+                "started": _iso(started),
+                "finished": _iso(finished),
+                "running": finished is None and _process_alive(pid),
+                "progress": f"{done}/{total}",
+                "not_warm": failed,
+            }
+            if self.interval > 0:
+                report["next_run"] = _iso(started + self.interval)
+
+        # A substance counts as covered while every entry its last warm-up filled is
+        # still in the lookup cache: expired, evicted or invalidated entries make it stale
+        keys = {cas: json.loads(row[6] or "[]") for cas, row in rows.items() if cas in substances}
+        expiries = lookup_cache.expiries({key for listed in keys.values() for key in listed})
+        coverage = {"warm": 0, "stale": 0, "partial": 0, "failed": 0, "deferred": 0, "pending": 0}
+        per_substance = []
+        for cas in substances:
+            row = rows.get(cas)
+            expires = min((expiries.get(key, 0) for key in keys.get(cas, ())), default=0)
+            if row is None:
+                state = "pending"
+            elif row[1] == "warm" and not expires:
+                state = "stale"
+            else:
+                state = row[1]
+            coverage[state] += 1
+            if details:
+                per_substance.append({
+                    "cas": cas,
+                    "state": state,
+                    "stages": json.loads(row[2]) if row else {},
+                    "error": row[3] if row else None,
+                    "duration_ms": row[4] if row else None,
+                    "warmed": _iso(row[5]) if row else None,
+                    "expires": _iso(expires),
+                })
+        coverage["ratio"] = round(coverage["warm"] / len(substances), 3) if substances else None
+        report["coverage"] = coverage
+        if details:
+            report["details"] = per_substance
+        return report
+
+    def summary(self) -> dict:
+        """stats() without per-substance details, reused for WATCHLIST_SUMMARY_TTL seconds."""
+        computed, summary = self._summary
+        if summary is None or time.monotonic() - computed > WATCHLIST_SUMMARY_TTL:
+            summary = self.stats()
+            self._summary = (time.monotonic(), summary)
+        return summary
+
+
+watchlist = WatchlistWarmer(
+    WATCHLIST_PATH, WATCHLIST_STATE_PATH, WATCHLIST_INTERVAL, WATCHLIST_CONCURRENCY, WATCHLIST_STARTUP_DELAY,
+    WATCHLIST_REFRESH,
+)
+
+
+@app.route("/api/admin/watchlist", methods=["GET", "POST"])
+@require_key
+def admin_watchlist():
+    """
+    Watchlist warm-up progress and coverage (`?details=1` lists every
+    substance). POST starts a run now in the background.
+    """
+    if not watchlist.enabled:
+        return jsonify({"error": "WATCHLIST_PATH no configurado"}), 404
+    if request.method == "POST":
+        if watchlist.stats().get("last_run", {}).get("running"):
+            return jsonify({"error": "Ya hay un precalentamiento en curso", **watchlist.stats()}), 409
+        threading.Thread(target=watchlist.run, kwargs={"force": True}, name="watchlist-run", daemon=True).start()
+        return jsonify({"status": "started", **watchlist.stats()}), 202
+    return jsonify(watchlist.stats(details=request.args.get("details") in ("1", "true")))
+
+
+if watchlist.enabled and __name__ != "__main__":
+    watchlist.start()
+
+
+BOOT_SECONDS = time.perf_counter() - _BOOT_STARTED
+log.info(f"Worker boot: {BOOT_SECONDS * 1000:.0f} ms")
+
+
 # ──────────────────────────────────────────────
 # ENTRY POINT
 # ──────────────────────────────────────────────
 if __name__ == "__main__":
+    if "--import-identities" in sys.argv:
+        # Bulk-load a CSV or SDF dump into the identity index and exit
+        for path in sys.argv[sys.argv.index("--import-identities") + 1:]:
+            loader = identity_index.import_sdf if path.lower().endswith((".sdf", ".sd")) else identity_index.import_csv
+            log.info(f"Identity index: {loader(path)} substances imported from {path}")
+        log.info(f"Identity index: {identity_index.stats()}")
+        sys.exit(0)
+
+    if "--warm-watchlist" in sys.argv:
+        # Warm the lookup cache for the watchlist once and exit (e.g. from cron)
+        if not watchlist.enabled:
+            log.error("WATCHLIST_PATH no configurado")
+            sys.exit(1)
+        log.info(f"Watchlist: {watchlist.run(force=True)}")
+        log.info(f"Watchlist: {watchlist.stats()['coverage']}")
+        sys.exit(0)
+
+    if "--import-time" in sys.argv:
+        # Print the import-time breakdown of `import app` and exit
+        print(json.dumps(import_time_report("app"), indent=2))
+        sys.exit(0)
+
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("DEBUG", "false").lower() == "true"
 
@@ -597,4 +4767,6 @@ if __name__ == "__main__":
     log.info(f"  Gemini API: {'✓ Configurado' if GEMINI_KEY else '✗ Falta GEMINI_API_KEY'}")
     log.info("=" * 60)
 
+    if watchlist.enabled:
+        watchlist.start()
     app.run(host="0.0.0.0", port=port, debug=debug)
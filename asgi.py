@@ -0,0 +1,766 @@
+"""
+QSAR LLM Backend — modo ASGI (asyncio)
+Sirve /api/chat, /api/chat/stream, los proxies /api/toolbox/* y /api/pubchem
+con clientes HTTP asíncronos (httpx) y la API asíncrona de Gemini, de modo que
+un proceso mantiene cientos de solicitudes en vuelo sin bloquear workers.
+El resto de rutas (/, /api/status, /api/toolbox/health, lotes…) se delegan a
+la app Flask de app.py.
+
+Uso:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import quote
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as core
+from app import log
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# ──────────────────────────────────────────────
+# ASYNC UPSTREAM CLIENTS
+# ──────────────────────────────────────────────
+class AsyncUpstreamClient:
+    """
+    Async counterpart of app.UpstreamClient for one upstream.
+
+    Uses the same UPSTREAM_CONFIG pool/timeout settings and shares the circuit
+    breaker and token bucket of the sync client, so limits and breaker state
+    are the same whichever serving mode handles the request. Concurrency is
+    capped per process with a semaphore.
+    """
+
+    def __init__(self, sync_client: core.UpstreamClient):
+        self.name = sync_client.name
+        self.config = sync_client.config
+        self.base_url = sync_client.base_url
+        self.breaker = sync_client.breaker
+        self.limiter = sync_client.limiter
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            pool_size = self.config["pool_size"]
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size if self.config["keepalive"] else 0,
+                ),
+                transport=httpx.AsyncHTTPTransport(retries=self.config["retries"]),
+            )
+            max_concurrent = self.config["max_concurrent"]
+            self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def timeout(self, method: str) -> httpx.Timeout:
+        read = self.config["post_timeout"] if method.upper() == "POST" else self.config["get_timeout"]
+        return httpx.Timeout(read, connect=self.config["connect_timeout"])
+
+    async def _acquire(self) -> None:
+        """Wait for a concurrency slot and a token, up to the limiter's max_wait."""
+        started = time.monotonic()
+        deadline = started + self.limiter.max_wait
+        self.limiter.record_queued(1)
+        try:
+            if self._semaphore is not None:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.limiter.max_wait)
+                except asyncio.TimeoutError:
+                    self.limiter.record_timeout()
+                    raise core.UpstreamBusy(f"{self.name}: no rate-limit slot after {self.limiter.max_wait:.0f}s")
+            while True:
+                if self.limiter.shared_dir:
+                    # The bucket is a lock file shared by all workers: take the flock off the event loop
+                    wait_s = await asyncio.to_thread(self.limiter.take_token)
+                else:
+                    wait_s = self.limiter.take_token()
+                if wait_s == 0:
+                    break
+                if time.monotonic() + wait_s > deadline:
+                    if self._semaphore is not None:
+                        self._semaphore.release()
+                    self.limiter.record_timeout()
+                    raise core.UpstreamBusy(f"{self.name}: no rate-limit slot after {self.limiter.max_wait:.0f}s")
+                await asyncio.sleep(wait_s)
+        finally:
+            self.limiter.record_queued(-1)
+        self.limiter.record_wait(time.monotonic() - started)
+
+    async def request(self, method: str, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        """Like app.UpstreamClient.request; with `stream=True` the body is left unread (close it)."""
+        if not self.breaker.allow():
+            raise core.UpstreamUnavailable(f"{self.name} circuit open, skipping {path}")
+        try:
+            return await self._request(method, path, stream, **kwargs)
+        finally:
+            # A half-open trial that ended without a verdict must not block the next one
+            self.breaker.release()
+
+    async def _request(self, method: str, path: str, stream: bool, **kwargs) -> httpx.Response:
+        client = self.client
+        url = path if path.startswith(("http://", "https://")) else f"{self.base_url}/{path.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeout(method))
+        for attempt in range(self.config["retries"] + 1):
+            await self._acquire()
+            started = time.perf_counter()
+            try:
+                if stream:
+                    r = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                else:
+                    r = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                core.observe_upstream(self.name, method, path, time.perf_counter() - started, type(e).__name__)
+                self.breaker.record_failure()
+                raise
+            finally:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+            core.observe_upstream(self.name, method, path, time.perf_counter() - started, r.status_code)
+            if r.status_code in (500, 502, 504):
+                self.breaker.record_failure()
+            elif r.status_code not in (429, 503):
+                self.breaker.record_success()
+            if r.status_code not in (429, 503) or attempt == self.config["retries"]:
+                return r
+            try:
+                pause = float(r.headers.get("Retry-After", ""))
+            except ValueError:
+                pause = self.config["backoff"] * (2 ** attempt)
+            log.warning(f"{self.name} busy (HTTP {r.status_code}), pausing for {pause:.1f}s")
+            await r.aclose()
+            self.limiter.penalize(pause)
+        return r
+
+
+toolbox_client = AsyncUpstreamClient(core.toolbox_client)
+pubchem_client = AsyncUpstreamClient(core.pubchem_client)
+
+
+class AsyncSingleFlight:
+    """Collapse identical concurrent upstream calls on the event loop."""
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, upstream: str, key: str, coro_fn):
+        flight = self._flights.get(key)
+        core.single_flight.record(upstream, deduplicated=flight is not None)
+        if flight is not None:
+            return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(coro_fn())
+        self._flights[key] = flight
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            self._flights.pop(key, None)
+
+
+single_flight = AsyncSingleFlight()
+
+
+async def cached(source: str, identifier: str, coro_fn, payload: dict = None):
+    """Async get-or-compute over the shared lookup cache (SQLite I/O off the loop)."""
+    value = await asyncio.to_thread(core.lookup_cache.lookup, source, identifier, payload)
+    if value is not None:
+        return value
+    value = await coro_fn()
+    if value:
+        await asyncio.to_thread(core.lookup_cache.store, source, identifier, value, payload)
+    return value
+
+# ──────────────────────────────────────────────
+# QSAR TOOLBOX / PUBCHEM HELPERS (async)
+# ──────────────────────────────────────────────
+
+async def toolbox_call(method: str, endpoint: str, body: dict = None) -> Optional[dict]:
+    """Async GET/POST to the QSAR Toolbox REST API; None on any failure."""
+    key = core.single_flight.make_key("toolbox", method, endpoint, body)
+
+    async def fetch():
+        try:
+            if method == "GET":
+                r = await toolbox_client.request("GET", endpoint, params=body or {})
+            else:
+                r = await toolbox_client.request("POST", endpoint, json=body)
+            r.raise_for_status()
+            return r.json()
+        except core.UpstreamUnavailable:
+            return None
+        except httpx.TimeoutException:
+            log.warning(f"Toolbox {method} {endpoint} timed out")
+        except httpx.ConnectError:
+            log.warning(f"Toolbox {method} {endpoint} connection error — is QSAR Toolbox running on {core.TOOLBOX_URL}?")
+        except Exception as e:
+            log.warning(f"Toolbox {method} {endpoint} failed: {e}")
+        return None
+
+    return await single_flight.do("toolbox", key, fetch)
+
+
+async def get_pubchem_data(cas_or_name: str) -> Optional[dict]:
+    """Async, cached PubChem property lookup (same record as app.get_pubchem_data)."""
+    if core.looks_like_cas(cas_or_name):
+        cas_or_name = core.normalize_cas(cas_or_name)
+        if cas_or_name is None:
+            return None
+
+    known = await asyncio.to_thread(core.identity_index.resolve, cas_or_name)
+    if known:
+        return known
+
+    key = core.single_flight.make_key("pubchem", "GET", "properties", core.normalize_identifier(cas_or_name))
+
+    async def fetch():
+        try:
+            path = f"compound/name/{quote(cas_or_name)}/property/{core.PUBCHEM_PROPERTIES}/JSON"
+            r = await pubchem_client.request("GET", path)
+            if r.status_code == 200:
+                record = core._pubchem_record(r.json()["PropertyTable"]["Properties"][0])
+                if record.get("cid"):
+                    await asyncio.to_thread(core.lookup_cache.store, "pubchem_cid", cas_or_name, record["cid"])
+                    await asyncio.to_thread(
+                        core.identity_index.add, record, [cas_or_name], cas=core.extract_cas(cas_or_name),
+                    )
+                return record
+        except Exception as e:
+            log.warning(f"PubChem lookup failed: {e}")
+        return None
+
+    return await cached("pubchem", cas_or_name, lambda: single_flight.do("pubchem", key, fetch))
+
+
+_profiling_slots = None
+
+
+async def run_profiling(cas: str, profilers: list, timeout: float = core.ANALYSIS_DEADLINE,
+                        report: dict = None) -> Optional[dict]:
+    """Async version of app.run_profiling: one call per missing profiler, merged."""
+    global _profiling_slots
+    if _profiling_slots is None:
+        _profiling_slots = asyncio.Semaphore(max(core.PROFILING_CONCURRENCY, 1))
+
+    profilers = list(dict.fromkeys(profilers))
+    values, missing = await asyncio.to_thread(core.cached_profiling, cas, profilers)
+    status = {p: "cached" for p in values}
+    timings = {}
+
+    async def run_one(profiler: str):
+        async with _profiling_slots:
+            started = time.perf_counter()
+            value = await toolbox_call("POST", "profiling/run", {"cas": cas, "profilers": [profiler]})
+        await asyncio.to_thread(core.lookup_cache.store, "profiling", cas, value, core.profiler_payload(profiler))
+        return value, round((time.perf_counter() - started) * 1000, 1)
+
+    tasks = {p: asyncio.ensure_future(run_one(p)) for p in missing}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=timeout)
+    for profiler, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            status[profiler] = "timeout"
+            log.warning(f"Profiler {profiler} for {cas} did not finish within {timeout}s")
+            continue
+        if task.exception() is not None:
+            log.warning(f"Profiler {profiler} for {cas} failed: {task.exception()}")
+            status[profiler] = "error"
+            continue
+        value, timings[profiler] = task.result()
+        status[profiler] = "ok" if value else "error"
+        if value:
+            values[profiler] = value
+
+    if report is not None:
+        report.update(core.profiling_report(profilers, status, timings))
+    return core.merge_profiling(cas, profilers, values)
+
+
+async def timed_stage(key, coro, slots: asyncio.Semaphore, cutoff: float):
+    """
+    Run one analysis stage once one of the request's `slots` is free.
+
+    Like app.run_stages: the stage must finish by `cutoff` (loop time), the
+    request's overall deadline, time spent waiting for a slot included.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(slots.acquire(), max(cutoff - loop.time(), 0))
+    except asyncio.TimeoutError:
+        coro.close()
+        raise
+    try:
+        with core.span(core.stage_name(key)):
+            return await asyncio.wait_for(coro, max(cutoff - loop.time(), 0))
+    finally:
+        slots.release()
+
+
+async def run_toolbox_analysis(query: str, options: dict) -> dict:
+    """Async version of app.run_toolbox_analysis with the same stages and result shape."""
+    found, plans = core.plan_toolbox_analysis(query, options)
+
+    stages, skipped = {}, []
+    for i, (results, identifier, toolbox_calls) in enumerate(plans):
+        cas = results["cas"]
+        if identifier:
+            stages[(i, "pubchem_data")] = get_pubchem_data(identifier)
+
+        plan_skipped = await asyncio.to_thread(core.serve_cached_if_circuit_open, results, toolbox_calls)
+        if plan_skipped is None:
+            plan_skipped = {}
+            for key, (source, payload, method, endpoint, body) in toolbox_calls.items():
+                if key == "profiling" and core.PROFILING_SPLIT:
+                    results["profiling_report"] = {}
+                    stages[(i, key)] = run_profiling(
+                        cas, body["profilers"],
+                        timeout=core.ANALYSIS_DEADLINE - core.PROFILING_MERGE_MARGIN,
+                        report=results["profiling_report"],
+                    )
+                    continue
+                stages[(i, key)] = cached(
+                    source, cas,
+                    lambda method=method, endpoint=endpoint, body=body: toolbox_call(method, endpoint, body),
+                    payload=payload,
+                )
+        skipped.append(plan_skipped)
+
+    # At most ANALYSIS_WORKERS stages of this request in flight at a time
+    slots = asyncio.Semaphore(max(core.ANALYSIS_WORKERS, 1))
+    cutoff = asyncio.get_running_loop().time() + core.ANALYSIS_DEADLINE
+    tasks = {
+        key: asyncio.ensure_future(timed_stage(key, coro, slots, cutoff))
+        for key, coro in stages.items()
+    }
+    if tasks:
+        await asyncio.wait(tasks.values())
+
+    values, status = {}, {}
+    for key, task in tasks.items():
+        if isinstance(task.exception(), asyncio.TimeoutError):
+            status[key] = "timeout"
+            log.warning(f"Analysis stage {key} did not finish within {core.ANALYSIS_DEADLINE}s")
+            continue
+        if task.exception() is not None:
+            log.warning(f"Analysis stage {key} failed: {task.exception()}")
+            status[key] = "error"
+            continue
+        value = task.result()
+        status[key] = "ok" if value else "empty"
+        values[key] = value
+
+    return core.finish_analysis(found, plans, values, status, skipped)
+
+# ──────────────────────────────────────────────
+# ROUTES
+# ──────────────────────────────────────────────
+
+def jsonify(data, status: int = 200) -> Response:
+    """JSON response serialized like Flask's jsonify."""
+    return Response(json.dumps(data, sort_keys=True), status_code=status, media_type="application/json")
+
+
+async def read_json(request: Request) -> dict:
+    """Parse the body as a JSON object regardless of Content-Type; an empty body reads as {} (like app.read_json)."""
+    raw = await request.body()
+    if not raw.strip():
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise core.InvalidJSON()
+    if not isinstance(body, dict):
+        raise core.InvalidJSON()
+    return body
+
+
+async def invalid_json(request: Request, exc: core.InvalidJSON) -> Response:
+    return jsonify({"error": "JSON inválido"}, 400)
+
+
+async def chat(request: Request) -> Response:
+    """Main chat endpoint: orchestrates Toolbox + Gemini."""
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await chat_stream(request)
+
+    body = await read_json(request)
+    try:
+        query = body.get("query", "").strip()
+        options = body.get("options", {})
+        language = body.get("language", "es")
+
+        if not query:
+            return jsonify({"error": "Query vacío"}, 400)
+
+        if not core.GEMINI_KEY:
+            return jsonify({"error": "GEMINI_API_KEY no configurado"}, 503)
+
+        log.info(f"Chat query (async): {query[:80]}…")
+
+        gemini_model = core.get_gemini_model()
+        report_cache = core.ReportCache(body, query, options, language)
+        report = await asyncio.to_thread(report_cache.lookup, gemini_model.model_name)
+
+        if report is None:
+            with core.span("analysis"):
+                toolbox_results = await run_toolbox_analysis(query, options)
+            with core.span("prompt"):
+                user_prompt = core.build_llm_prompt(query, toolbox_results, language)
+            card_data = core.build_card_data(toolbox_results, body)
+            metadata = core.chat_metadata(toolbox_results)
+
+            cached = await asyncio.to_thread(report_cache.lookup_prompt, user_prompt, gemini_model.model_name)
+            if cached is not None:
+                response_text, model_name = cached["message"], gemini_model.model_name
+            else:
+                with core.span("llm", gemini_model.model_name):
+                    response, model_name = await gemini_model.generate_async(user_prompt)
+                    response_text = response.text
+            await asyncio.to_thread(report_cache.store, response_text, model_name, toolbox_results, card_data, metadata)
+            report = {"message": response_text, "data": card_data, "metadata": metadata}
+
+        response = jsonify({
+            "message": report["message"],
+            "data": report["data"],
+            **report["metadata"],
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+        response.headers["X-Cache"] = report_cache.status
+        return response
+
+    except Exception as e:
+        log.error(f"API error: {e}", exc_info=True)
+        return jsonify({"error": f"Error de API: {str(e)}"}, 502)
+
+
+async def chat_stream(request: Request) -> Response:
+    """Streaming chat endpoint (Server-Sent Events), same events as app.chat_stream."""
+    body = await read_json(request)
+    query = body.get("query", "").strip()
+    options = body.get("options", {})
+    language = body.get("language", "es")
+
+    if not query:
+        return jsonify({"error": "Query vacío"}, 400)
+    if not core.GEMINI_KEY:
+        return jsonify({"error": "GEMINI_API_KEY no configurado"}, 503)
+
+    log.info(f"Chat stream query (async): {query[:80]}…")
+
+    async def generate():
+        yield ": stream open\n\n"
+        timer = core.current_timer()
+        try:
+            gemini_model = core.get_gemini_model()
+            report_cache = core.ReportCache(body, query, options, language)
+            report = await asyncio.to_thread(report_cache.lookup, gemini_model.model_name)
+            if report is not None:
+                yield core.sse_event("context", {"data": report["data"], **report["metadata"]})
+                yield core.sse_event("token", {"text": report["message"]})
+                metadata = report["metadata"]
+            else:
+                with core.span("analysis"):
+                    toolbox_results = await run_toolbox_analysis(query, options)
+                card_data = core.build_card_data(toolbox_results, body)
+                metadata = core.chat_metadata(toolbox_results)
+                yield core.sse_event("context", {"data": card_data, **metadata})
+
+                with core.span("prompt"):
+                    user_prompt = core.build_llm_prompt(query, toolbox_results, language)
+                cached = await asyncio.to_thread(report_cache.lookup_prompt, user_prompt, gemini_model.model_name)
+                if cached is not None:
+                    parts, model_name = [cached["message"]], gemini_model.model_name
+                    yield core.sse_event("token", {"text": cached["message"]})
+                else:
+                    parts = []
+                    with core.span("llm", gemini_model.model_name):
+                        response, model_name = await gemini_model.generate_async(user_prompt, stream=True)
+                        async for chunk in response:
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                continue
+                            if text:
+                                parts.append(text)
+                                yield core.sse_event("token", {"text": text})
+                await asyncio.to_thread(
+                    report_cache.store, "".join(parts), model_name, toolbox_results, card_data, metadata,
+                )
+
+            yield core.sse_event("done", {
+                **metadata,
+                "cache": report_cache.status,
+                "timings": timer.as_list() if timer else [],
+                "timestamp": datetime.utcnow().isoformat(),
+            })
+        except Exception as e:
+            log.error(f"Stream error: {e}", exc_info=True)
+            core.ERRORS.inc(route="/api/chat/stream", kind=type(e).__name__)
+            yield core.sse_event("error", {"error": f"Error de API: {str(e)}"})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def toolbox_search(request: Request) -> Response:
+    """Search substance in QSAR Toolbox by CAS or name."""
+    identifier = request.query_params.get("q", "")
+    if not identifier:
+        return jsonify({"error": "Parámetro 'q' requerido"}, 400)
+    try:
+        identifier = core.checked_identifier(identifier)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    data = await cached(
+        "toolbox_search", identifier,
+        lambda: toolbox_call("GET", "substances/search", {"query": identifier}),
+        payload={"query": identifier},
+    )
+    if data is None:
+        return jsonify({"error": "Toolbox no disponible", "fallback": True}, 503)
+    return jsonify(data)
+
+
+async def toolbox_substance_details(request: Request) -> Response:
+    """Get detailed information about a substance."""
+    data = await toolbox_call("GET", f"substances/{request.path_params['substance_id']}")
+    if data is None:
+        return jsonify({"error": "Sustancia no encontrada"}, 404)
+    return jsonify(data)
+
+
+async def toolbox_profile(request: Request) -> Response:
+    """Run profiling for a CAS number."""
+    body = await read_json(request)
+    try:
+        cas = core.checked_cas(body.get("cas"))
+        profilers = core.checked_profilers(body.get("profilers"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+    report = {}
+    if core.PROFILING_SPLIT:
+        data = await run_profiling(cas, profilers, report=report)
+    else:
+        data = await cached(
+            "profiling", cas,
+            lambda: toolbox_call("POST", "profiling/run", {"cas": cas, "profilers": profilers}),
+            payload={"profilers": profilers},
+        )
+    if data is None:
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+    return jsonify({**data, **report})
+
+
+async def toolbox_profilers(request: Request) -> Response:
+    """Get list of available profilers."""
+    data = await toolbox_call("GET", "profiling/available")
+    if data is None:
+        return jsonify({"profilers": core.FALLBACK_PROFILERS})
+    return jsonify(data)
+
+
+async def toolbox_category(request: Request) -> Response:
+    """Build chemical category for a CAS number."""
+    body = await read_json(request)
+    try:
+        cas = core.checked_cas(body.get("cas"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    data = await cached("category", cas, lambda: toolbox_call("POST", "category/build", {"cas": cas}))
+    if data is None:
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+    return jsonify(data)
+
+
+async def _toolbox_job_route(request: Request, kind: str) -> Response:
+    body = await read_json(request)
+    try:
+        endpoint, payload = core.toolbox_job_request(kind, body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    if body.get("async") or request.query_params.get("async") in ("1", "true"):
+        job = await asyncio.to_thread(core.queue_toolbox_job, kind, body)
+        if job is None:
+            return jsonify({"error": "Cola de trabajos llena, reintenta más tarde"}, 429)
+        response = jsonify(job, 202)
+        response.headers["Location"] = job["status_url"]
+        return response
+
+    data = await toolbox_call("POST", endpoint, payload)
+    if data is None:
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+    return jsonify(data)
+
+
+async def toolbox_datamatrix(request: Request) -> Response:
+    """Build data matrix for a category; same `async`, `stream` and `view` modes as app.toolbox_datamatrix."""
+    body = await read_json(request)
+    params = request.query_params
+    stream = body.get("stream") or params.get("stream") in ("1", "true")
+    view = body.get("view") or params.get("view")
+    if body.get("async") or params.get("async") in ("1", "true") or not (stream or view):
+        return await _toolbox_job_route(request, "datamatrix")
+
+    try:
+        endpoint, payload = core.toolbox_job_request("datamatrix", body)
+        if stream:
+            return await stream_toolbox_post(endpoint, payload)
+        merged = {**dict(params), **body}
+        view, offset, limit, columns = core.datamatrix_view_params(merged)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    async def build():
+        return core.prepare_datamatrix(await toolbox_call("POST", endpoint, payload))
+
+    data = await cached("datamatrix", payload["category_id"], build, payload=core.datamatrix_cache_payload(payload))
+    if data is None:
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+    return jsonify(core.datamatrix_page(data, view, offset, limit, columns))
+
+
+async def stream_toolbox_post(endpoint: str, payload: dict) -> Response:
+    """Relay a Toolbox POST response body chunk by chunk, without parsing it."""
+    try:
+        r = await toolbox_client.request("POST", endpoint, json=payload, stream=True)
+    except (core.UpstreamUnavailable, core.UpstreamBusy, httpx.HTTPError) as e:
+        log.warning(f"Toolbox POST {endpoint} (stream) failed: {e}")
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+    if r.status_code >= 400:
+        log.warning(f"Toolbox POST {endpoint} (stream) returned HTTP {r.status_code}")
+        await r.aclose()
+        return jsonify({"error": "Toolbox no disponible"}, 503)
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw(core.DATAMATRIX_STREAM_CHUNK):
+                yield chunk
+        finally:
+            await r.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type=r.headers.get("Content-Type", "application/json"),
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+async def toolbox_readacross(request: Request) -> Response:
+    """Perform read-across prediction for a substance (`"async": true` runs it as a job)."""
+    return await _toolbox_job_route(request, "readacross")
+
+
+async def pubchem_lookup(request: Request) -> Response:
+    """PubChem lookup proxy — no auth required."""
+    identifier = request.query_params.get("q", "")
+    if not identifier:
+        return jsonify({"error": "Parámetro 'q' requerido"}, 400)
+    try:
+        identifier = core.checked_identifier(identifier)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    data = await get_pubchem_data(identifier)
+    if data:
+        return jsonify(data)
+    return jsonify({"error": "No encontrado en PubChem"}, 404)
+
+
+class ServerTimingMiddleware:
+    """
+    Request timer for the async routes: Server-Timing header and the HTTP
+    duration metric. Requests handed to Flask are timed by Flask itself.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timer = core.start_request_timer()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                if timer.spans and "server-timing" not in headers:
+                    headers.append("Server-Timing", timer.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = ROUTE_PATHS.get(scope.get("endpoint"))
+            if route is not None:
+                core.HTTP_DURATION.observe(
+                    time.perf_counter() - timer.started,
+                    route=route, method=scope["method"], status=status["code"],
+                )
+                if status["code"] >= 500:
+                    core.ERRORS.inc(route=route, kind=f"http_{status['code']}")
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    await toolbox_client.close()
+    await pubchem_client.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/chat/stream", chat_stream, methods=["POST"]),
+        Route("/api/toolbox/search", toolbox_search),
+        Route("/api/toolbox/substances/{substance_id}", toolbox_substance_details),
+        Route("/api/toolbox/profile", toolbox_profile, methods=["POST"]),
+        Route("/api/toolbox/profilers", toolbox_profilers),
+        Route("/api/toolbox/category", toolbox_category, methods=["POST"]),
+        Route("/api/toolbox/datamatrix", toolbox_datamatrix, methods=["POST"]),
+        Route("/api/toolbox/readacross", toolbox_readacross, methods=["POST"]),
+        Route("/api/pubchem", pubchem_lookup),
+        # Everything else (static files, status, health, batch) is served by Flask
+        Mount("/", app=WsgiToAsgi(core.app)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(ServerTimingMiddleware),
+    ],
+    exception_handlers={core.InvalidJSON: invalid_json},
+    lifespan=lifespan,
+)
+
+# Route templates of the async endpoints, used as the `route` metric label
+ROUTE_PATHS = {route.endpoint: route.path for route in app.routes if isinstance(route, Route)}
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the QSAR LLM backend
+
+Starts local stand-ins for the QSAR Toolbox WebAPI, PubChem PUG-REST and the
+Gemini API (with configurable latency and error injection), launches the
+backend against them and drives /api/chat, /api/toolbox/* and /api/pubchem
+at the requested concurrency levels. Results are printed (or written) as
+JSON: p50/p95/p99 latency, throughput, status codes and the number of calls
+each upstream received, per scenario and concurrency level.
+
+Requirements:
+- Backend dependencies installed (pip install -r requirements.txt)
+- No QSAR Toolbox, internet access or Gemini key needed
+
+Usage:
+    python3 benchmark.py
+    python3 benchmark.py --concurrency 1,8,32 --requests 200 --toolbox-latency 0.2
+    python3 benchmark.py --error-rate 0.05 --output results.json
+    python3 benchmark.py --env TOOLBOX_RATE=100 --env TOOLBOX_MAX_CONCURRENT=16
+    python3 benchmark.py --server "gunicorn -w 4 -b 127.0.0.1:{port} app:app"
+    python3 benchmark.py --compare baseline.json --output results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import requests
+
+# Substances used by the scenarios (valid CAS numbers)
+SUBSTANCES = [
+    ("1071-83-6", "glyphosate"),
+    ("50-00-0", "formaldehyde"),
+    ("71-43-2", "benzene"),
+    ("64-17-5", "ethanol"),
+    ("67-64-1", "acetone"),
+    ("108-88-3", "toluene"),
+    ("80-05-7", "bisphenol A"),
+    ("50-32-8", "benzo[a]pyrene"),
+    ("1912-24-9", "atrazine"),
+    ("7440-50-8", "copper"),
+]
+
+SCENARIOS = ["chat", "toolbox_search", "toolbox_profile", "toolbox_category", "pubchem"]
+
+
+# ──────────────────────────────────────────────
+# FAKE UPSTREAMS
+# ──────────────────────────────────────────────
+class FakeUpstream:
+    """
+    Threaded local HTTP server answering one upstream's routes.
+
+    Every request sleeps for `latency` seconds (± `jitter`) and fails with
+    HTTP 503 with probability `error_rate`. Calls are counted per route.
+    """
+
+    def __init__(self, name: str, routes, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.name = name
+        self.routes = routes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+                status, payload = upstream.handle(method, parsed.path, parse_qs(parsed.query), raw)
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+        return Handler
+
+    def handle(self, method: str, path: str, query: dict, raw: bytes) -> tuple:
+        route, handler = self.match(method, path)
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if handler is None:
+            return 404, {"error": f"no fake route for {method} {path}"}
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {"error": "injected failure"}
+        try:
+            body = json.loads(raw) if raw.startswith((b"{", b"[")) else parse_qs(raw.decode())
+        except ValueError:
+            body = {}
+        return 200, handler(path, query, body)
+
+    def match(self, method: str, path: str) -> tuple:
+        for route_method, prefix, handler in self.routes:
+            if method == route_method and path.startswith(prefix):
+                return f"{method} {prefix}", handler
+        return f"{method} {path}", None
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.calls)
+
+    def start(self) -> "FakeUpstream":
+        threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _cas_of(query: dict, body: dict) -> str:
+    for source in (body, query):
+        value = source.get("cas") or source.get("query")
+        if isinstance(value, list):
+            value = value[0]
+        if value:
+            return str(value)
+    return SUBSTANCES[0][0]
+
+
+def _toolbox_routes() -> list:
+    def version(path, query, body):
+        return {"version": "bench-1.0"}
+
+    def profilers(path, query, body):
+        return {"profilers": ["DNA binding by OASIS", "Protein binding by OECD", "Aquatic toxicity classification by ECOSAR"]}
+
+    def search(path, query, body):
+        cas = _cas_of(query, body)
+        return [{"id": f"sub-{cas}", "cas": cas, "name": dict(SUBSTANCES).get(cas, cas), "smiles": "C"}]
+
+    def substance(path, query, body):
+        return {"id": path.rsplit("/", 1)[-1], "names": ["bench substance"], "smiles": "C"}
+
+    def profile(path, query, body):
+        return {
+            "cas": body.get("cas"),
+            "results": [
+                {"profiler": p, "alerts": [{"name": f"{p} alert {i}", "level": "moderate"} for i in range(3)]}
+                for p in body.get("profilers") or ["DNA binding by OASIS"]
+            ],
+        }
+
+    def category(path, query, body):
+        return {
+            "category_id": f"cat-{body.get('cas')}",
+            "members": [
+                {"cas": f"{100 + i}-00-{i % 10}", "name": f"analog {i}", "similarity": round(0.95 - i * 0.02, 2)}
+                for i in range(20)
+            ],
+        }
+
+    def datamatrix(path, query, body):
+        return {
+            "category_id": body.get("category_id"),
+            "rows": [{"analog": f"analog {i}", "values": {"LC50": 10 + i, "logKow": 1.5 + i / 10}} for i in range(50)],
+        }
+
+    def readacross(path, query, body):
+        return {"endpoint": body.get("endpoint"), "prediction": 12.3, "unit": "mg/L", "confidence": 0.8}
+
+    return [
+        ("GET", "/api/v1/version", version),
+        ("GET", "/api/v1/profiling/available", profilers),
+        ("GET", "/api/v1/substances/search", search),
+        ("GET", "/api/v1/substances/", substance),
+        ("POST", "/api/v1/profiling/run", profile),
+        ("POST", "/api/v1/category/build", category),
+        ("POST", "/api/v1/category/datamatrix", datamatrix),
+        ("POST", "/api/v1/readacross/predict", readacross),
+    ]
+
+
+def _pubchem_routes() -> list:
+    def row(cid: int) -> dict:
+        return {
+            "CID": cid,
+            "MolecularFormula": "C3H8NO5P",
+            "MolecularWeight": "169.07",
+            "XLogP": -4.6,
+            "IsomericSMILES": "C(C(=O)O)NCP(=O)(O)O",
+            "IUPACName": "2-(phosphonomethylamino)acetic acid",
+        }
+
+    def by_name(path, query, body):
+        name = unquote(path.split("/compound/name/", 1)[1].split("/", 1)[0])
+        cid = 1000 + sum(map(ord, name))
+        if path.endswith("/cids/JSON"):
+            return {"IdentifierList": {"CID": [cid]}}
+        return {"PropertyTable": {"Properties": [row(cid)]}}
+
+    def by_cid(path, query, body):
+        cids = body.get("cid") or [path.split("/compound/cid/", 1)[1].split("/", 1)[0]]
+        cids = ",".join(cids).split(",")
+        return {"PropertyTable": {"Properties": [row(int(cid)) for cid in cids if cid.isdigit()]}}
+
+    return [
+        ("GET", "/rest/pug/compound/name/", by_name),
+        ("POST", "/rest/pug/compound/name/", by_name),
+        ("GET", "/rest/pug/compound/cid/", by_cid),
+        ("POST", "/rest/pug/compound/cid/", by_cid),
+    ]
+
+
+def _gemini_routes() -> list:
+    text = "## Análisis regulatorio\n\nInforme de prueba generado por el stub del benchmark.\n" * 5
+
+    def candidate(part: str) -> dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": part}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 50, "totalTokenCount": 150},
+        }
+
+    def generate(path, query, body):
+        return candidate(text)
+
+    def stream(path, query, body):
+        # The REST transport reads streamed responses as one JSON array
+        return json.dumps([candidate(line + "\n") for line in text.splitlines()]).encode()
+
+    def model(path, query, body):
+        name = path.split("/v1beta/", 1)[1]
+        return {
+            "name": name, "baseModelId": name.split("/")[-1], "version": "001", "displayName": name,
+            "inputTokenLimit": 30720, "outputTokenLimit": 2048,
+            "supportedGenerationMethods": ["generateContent", "streamGenerateContent"],
+        }
+
+    return [
+        ("POST", ":streamGenerateContent", stream),
+        ("POST", ":generateContent", generate),
+        ("GET", "/v1beta/models/", model),
+    ]
+
+
+class FakeGemini(FakeUpstream):
+    """Gemini routes end in `:generateContent` / `:streamGenerateContent`, so match on the suffix too."""
+
+    def match(self, method: str, path: str) -> tuple:
+        for route_method, suffix, handler in self.routes:
+            if method == route_method and (path.endswith(suffix) or path.startswith(suffix)):
+                return f"{method} {suffix}", handler
+        return f"{method} {path}", None
+
+
+# ──────────────────────────────────────────────
+# BACKEND UNDER TEST
+# ──────────────────────────────────────────────
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def backend_env(args, upstreams: Dict[str, FakeUpstream], workdir: str, port: int) -> dict:
+    """Environment of the backend under test: fake upstreams, all on-disk state in `workdir`."""
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        DEBUG="false",
+        TOOLBOX_URL=upstreams["toolbox"].url,
+        PUBCHEM_URL=f"{upstreams['pubchem'].url}/rest/pug",
+        GEMINI_API_KEY="benchmark",
+        GEMINI_API_ENDPOINT=upstreams["gemini"].url,
+        LOOKUP_CACHE_PATH=os.path.join(workdir, "lookup_cache.sqlite3"),
+        LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.sqlite3"),
+        # Keep every piece of on-disk state in the workdir: the fake records must never
+        # reach the real identity index, and rate-limit buckets are not shared with production
+        IDENTITY_INDEX_PATH=os.path.join(workdir, "identity_index.sqlite3"),
+        RATE_LIMIT_DIR=os.path.join(workdir, "ratelimit"),
+        JOB_STORE_PATH=os.path.join(workdir, "jobs.sqlite3"),
+        WATCHLIST_STATE_PATH=os.path.join(workdir, "watchlist.sqlite3"),
+    )
+    if not args.cache:
+        env.update(LOOKUP_CACHE_ENABLED="false", LLM_CACHE_ENABLED="false", IDENTITY_INDEX_ENABLED="false")
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def start_backend(args, upstreams: Dict[str, FakeUpstream], workdir: str) -> tuple:
+    """Launch the backend pointed at the fake upstreams; returns (process, base URL)."""
+    port = _free_port()
+    env = backend_env(args, upstreams, workdir, port)
+    here = os.path.dirname(os.path.abspath(__file__))
+    if args.server:
+        cmd = shlex.split(args.server.format(port=port))
+    else:
+        cmd = [sys.executable, os.path.join(here, "app.py")]
+    log_file = open(os.path.join(workdir, "backend.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with code {proc.returncode}, see {log_file.name}")
+        try:
+            requests.get(f"{base_url}/api/status", timeout=2)
+            return proc, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"backend did not answer within {args.startup_timeout}s, see {log_file.name}")
+
+
+# ──────────────────────────────────────────────
+# LOAD GENERATION
+# ──────────────────────────────────────────────
+def build_request(scenario: str, i: int, args) -> tuple:
+    """(method, path, kwargs) of the i-th request of a scenario."""
+    cas, name = SUBSTANCES[i % len(SUBSTANCES)]
+    if scenario == "chat":
+        return "POST", "/api/chat", {"json": {
+            "query": f"Perfil regulatorio de {name} (CAS {cas})",
+            "language": "es",
+            "options": {"profiling": True, "readAcross": True},
+        }}
+    if scenario == "toolbox_search":
+        return "GET", "/api/toolbox/search", {"params": {"q": cas}}
+    if scenario == "toolbox_profile":
+        return "POST", "/api/toolbox/profile", {"json": {"cas": cas}}
+    if scenario == "toolbox_category":
+        return "POST", "/api/toolbox/category", {"json": {"cas": cas}}
+    if scenario == "pubchem":
+        return "GET", "/api/pubchem", {"params": {"q": name}}
+    raise ValueError(f"unknown scenario {scenario}")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_scenario(base_url: str, scenario: str, concurrency: int, args, upstreams: Dict[str, FakeUpstream]) -> dict:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(i: int):
+        method, path, kwargs = build_request(scenario, i, args)
+        started = time.perf_counter()
+        try:
+            r = session.request(method, base_url + path, timeout=args.timeout, **kwargs)
+            status = str(r.status_code)
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    for i in range(min(args.warmup, args.requests)):
+        one(i)
+    latencies.clear()
+    statuses.clear()
+
+    before = {name: u.snapshot() for name, u in upstreams.items()}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+    after = {name: u.snapshot() for name, u in upstreams.items()}
+
+    upstream_calls = {}
+    for name in upstreams:
+        delta = {route: n - before[name].get(route, 0) for route, n in after[name].items()}
+        delta = {route: n for route, n in delta.items() if n}
+        upstream_calls[name] = {"total": sum(delta.values()), "routes": delta}
+
+    ok = sum(n for status, n in statuses.items() if status.startswith("2"))
+    ms = [v * 1000 for v in latencies]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "status": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": _round(percentile(ms, 50)),
+            "p95": _round(percentile(ms, 95)),
+            "p99": _round(percentile(ms, 99)),
+            "mean": _round(sum(ms) / len(ms) if ms else None),
+            "max": _round(max(ms) if ms else None),
+        },
+        "upstream_calls": upstream_calls,
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Relative change of p50/p95/p99 and throughput against a previous run."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    rows = []
+    for r in results["results"]:
+        base = previous.get((r["scenario"], r["concurrency"]))
+        if base is None:
+            continue
+        row = {"scenario": r["scenario"], "concurrency": r["concurrency"]}
+        for metric in ("p50", "p95", "p99"):
+            old, new = base["latency_ms"][metric], r["latency_ms"][metric]
+            row[f"{metric}_change_pct"] = round((new - old) / old * 100, 1) if old and new is not None else None
+        old, new = base["throughput_rps"], r["throughput_rps"]
+        row["throughput_change_pct"] = round((new - old) / old * 100, 1) if old and new is not None else None
+        rows.append(row)
+    return rows
+
+
+# ──────────────────────────────────────────────
+# MAIN
+# ──────────────────────────────────────────────
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Offline benchmark for the QSAR LLM backend")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    p.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    p.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    p.add_argument("--warmup", type=int, default=5, help="sequential requests sent before measuring")
+    p.add_argument("--timeout", type=float, default=120, help="client timeout per request (s)")
+    p.add_argument("--toolbox-latency", type=float, default=0.05, help="fake Toolbox latency (s)")
+    p.add_argument("--pubchem-latency", type=float, default=0.1, help="fake PubChem latency (s)")
+    p.add_argument("--llm-latency", type=float, default=0.5, help="fake Gemini latency (s)")
+    p.add_argument("--jitter", type=float, default=0.0, help="± random latency added to every fake call (s)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake upstream calls answered with 503")
+    p.add_argument("--cache", action="store_true", help="keep the lookup, LLM and identity caches enabled")
+    p.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                   help="extra backend environment variable, e.g. --env TOOLBOX_RATE=50 (repeatable)")
+    p.add_argument("--server", help="command starting the backend; {port} is replaced (default: python app.py)")
+    p.add_argument("--target", help="benchmark an already running backend at this URL (fakes must be configured by hand)")
+    p.add_argument("--startup-timeout", type=float, default=60)
+    p.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    p.add_argument("--compare", help="previous results file to compute relative changes against")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    for s in scenarios:
+        if s not in SCENARIOS:
+            print(f"Unknown scenario: {s}", file=sys.stderr)
+            return 2
+
+    upstreams = {
+        "toolbox": FakeUpstream("toolbox", _toolbox_routes(), args.toolbox_latency, args.jitter, args.error_rate),
+        "pubchem": FakeUpstream("pubchem", _pubchem_routes(), args.pubchem_latency, args.jitter, args.error_rate),
+        "gemini": FakeGemini("gemini", _gemini_routes(), args.llm_latency, args.jitter, args.error_rate),
+    }
+    for upstream in upstreams.values():
+        upstream.start()
+
+    proc = None
+    workdir = tempfile.mkdtemp(prefix="qsar-bench-")
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            proc, base_url = start_backend(args, upstreams, workdir)
+        print(f"Backend: {base_url}  (logs in {workdir})", file=sys.stderr)
+
+        results = []
+        for scenario in scenarios:
+            for concurrency in levels:
+                r = run_scenario(base_url, scenario, concurrency, args, upstreams)
+                results.append(r)
+                print(
+                    f"{scenario:<18} c={concurrency:<3} "
+                    f"p50={r['latency_ms']['p50']}ms p95={r['latency_ms']['p95']}ms p99={r['latency_ms']['p99']}ms "
+                    f"{r['throughput_rps']} req/s errors={r['errors']}",
+                    file=sys.stderr,
+                )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for upstream in upstreams.values():
+            upstream.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": levels,
+            "latency_s": {"toolbox": args.toolbox_latency, "pubchem": args.pubchem_latency, "llm": args.llm_latency},
+            "jitter_s": args.jitter,
+            "error_rate": args.error_rate,
+            "cache": args.cache,
+            "server": args.server or "python app.py",
+            "env": args.env,
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
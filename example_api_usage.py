@@ -147,6 +147,27 @@ class QSARLLMClient:
             print(f"⚠️  PubChem lookup failed: {e}")
             return {"error": str(e)}
 
+    def batch_screen(self, substances: list, parallelism: int = 4, **options) -> list:
+        """Screen a list of CAS numbers/names; returns one result per substance"""
+        payload = {"substances": substances, "options": options, "parallelism": parallelism}
+        results = []
+        try:
+            with self.session.post(
+                f"{self.base_url}/api/batch/screen",
+                json=payload,
+                stream=True,
+                timeout=TIMEOUT,
+            ) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if line:
+                        item = json.loads(line)
+                        if "summary" not in item:
+                            results.append(item)
+        except Exception as e:
+            print(f"⚠️  Batch screening failed: {e}")
+        return results
+
 
 def main():
     """Example usage"""
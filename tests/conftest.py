@@ -0,0 +1,119 @@
+"""
+Shared test setup.
+
+app is imported with every cache and state file in a temporary directory,
+upstreams pointing at a closed local port and no background warm-ups, so
+the tests never touch the network or the working tree.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIR = tempfile.mkdtemp(prefix="qsar-tests-")
+
+os.environ.update({
+    "TOOLBOX_URL": "http://127.0.0.1:9",
+    "PUBCHEM_URL": "http://127.0.0.1:9/rest/pug",
+    "GEMINI_API_KEY": "",
+    "GEMINI_PREWARM": "false",
+    "BACKEND_API_KEY": "",
+    "WATCHLIST_PATH": "",
+    "RATE_LIMIT_DIR": os.path.join(STATE_DIR, "ratelimit"),
+    "LOOKUP_CACHE_PATH": os.path.join(STATE_DIR, "lookup_cache.sqlite3"),
+    "LLM_CACHE_PATH": os.path.join(STATE_DIR, "llm_cache.sqlite3"),
+    "IDENTITY_INDEX_PATH": os.path.join(STATE_DIR, "identity_index.sqlite3"),
+    "JOB_STORE_PATH": os.path.join(STATE_DIR, "jobs.sqlite3"),
+    "WATCHLIST_STATE_PATH": os.path.join(STATE_DIR, "watchlist.sqlite3"),
+})
+sys.path.insert(0, ROOT)
+
+import app as qsar  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return qsar.app.test_client()
+
+
+@pytest.fixture
+def state_dir():
+    return STATE_DIR
+
+
+class FakeUpstream:
+    """
+    Local HTTP stand-in for the Toolbox or PubChem.
+
+    `routes` maps a path (without query string) to a (status, JSON body)
+    pair or to a callable taking (method, path, query, body) and returning
+    one; every request is recorded in `calls`.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.calls = []
+        self.delay = 0.0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, like the real upstreams
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                parts = urlsplit(self.path)
+                upstream.calls.append((self.command, parts.path, parts.query, body))
+                if upstream.delay:
+                    time.sleep(upstream.delay)
+                route = upstream.routes.get(parts.path, (404, {"error": "not found"}))
+                if callable(route):
+                    route = route(self.command, parts.path, parts.query, body)
+                status, payload = route
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def paths(self) -> list:
+        return [path for _, path, _, _ in self.calls]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def upstream_client(base_url, **overrides):
+    """UpstreamClient for a FakeUpstream: fast retries, no rate or concurrency limits unless overridden."""
+    config = {
+        **qsar.UPSTREAM_CONFIG["toolbox"],
+        "base_url": base_url, "retries": 1, "backoff": 0.01, "rate": 0, "max_concurrent": 0,
+        **overrides,
+    }
+    return qsar.UpstreamClient("test", config)
+
+
+@pytest.fixture
+def upstream():
+    server = FakeUpstream()
+    yield server
+    server.close()
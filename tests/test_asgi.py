@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi
+from conftest import qsar
+
+
+@pytest.fixture
+def asgi_client():
+    return TestClient(asgi.app)
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream", "/api/toolbox/profile", "/api/toolbox/datamatrix"])
+@pytest.mark.parametrize("body", [b"{no es json", b"[1, 2]", b'"texto"'])
+def test_malformed_bodies_are_rejected_with_400(asgi_client, client, path, body):
+    response = asgi_client.post(path, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "JSON inválido"}
+
+    response = client.post(path, data=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "JSON inválido"}
+
+
+def test_empty_body_reads_as_empty_object(asgi_client, client):
+    response = asgi_client.post("/api/toolbox/profile", content=b"")
+    assert response.status_code == 400
+    assert response.json() == {"error": "CAS requerido"}
+    response = client.post("/api/toolbox/profile", data=b" ")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "CAS requerido"}
+
+
+@pytest.mark.parametrize("value", ["mutagenicity", [{"name": "mutagenicity"}], ["nope"]])
+def test_bad_profilers_are_rejected_with_400(asgi_client, value):
+    response = asgi_client.post("/api/toolbox/profile", json={"cas": "1912-24-9", "profilers": value})
+    assert response.status_code == 400
+    assert "perfiladores" in response.json()["error"].lower()
+
+
+def limited_client(tmp_path, shared):
+    limiter = qsar.RateLimiter("test", rate=1000, burst=5, max_concurrent=0, max_wait=1,
+                               shared_dir=str(tmp_path) if shared else "")
+    threads = []
+    take = limiter.take_token
+
+    def take_token():
+        threads.append(threading.current_thread())
+        return take()
+
+    limiter.take_token = take_token
+    sync_client = SimpleNamespace(name="test", config={}, base_url="http://127.0.0.1:9", breaker=None, limiter=limiter)
+    return asgi.AsyncUpstreamClient(sync_client), threads
+
+
+def test_shared_limiter_is_taken_off_the_event_loop(tmp_path):
+    client, threads = limited_client(tmp_path, shared=True)
+    asyncio.run(client._acquire())
+    assert threads and threading.main_thread() not in threads
+    assert client.limiter.stats()["acquired"] == 1
+
+
+def test_process_limiter_stays_on_the_event_loop(tmp_path):
+    client, threads = limited_client(tmp_path, shared=False)
+    asyncio.run(client._acquire())
+    assert threads == [threading.main_thread()]
+
+
+def test_stage_wait_for_a_slot_counts_against_the_deadline():
+    async def run():
+        slots = asyncio.Semaphore(1)
+        cutoff = asyncio.get_running_loop().time() + 0.25
+        tasks = [asyncio.ensure_future(asgi.timed_stage(key, asyncio.sleep(0.15, key), slots, cutoff))
+                 for key in ("first", "second")]
+        await asyncio.wait(tasks)
+        return [task.exception() is None for task in tasks]
+
+    assert asyncio.run(run()) == [True, False]
@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from conftest import qsar
+
+
+@pytest.fixture
+def fake_analysis(monkeypatch):
+    calls = []
+
+    def analysis(query, options, executor=None):
+        calls.append((query, options, executor))
+        if query == "unknown":
+            return {"cas": None, "pubchem_data": None, "toolbox_data": None, "stages": {}}
+        return {"cas": query, "pubchem_data": {"cid": 1}, "toolbox_data": None, "stages": {"pubchem_data": "ok"}}
+
+    monkeypatch.setattr(qsar, "run_toolbox_analysis", analysis)
+    monkeypatch.setattr(qsar, "get_pubchem_data_batch", lambda identifiers: {})
+    return calls
+
+
+def ndjson(response) -> list:
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_streams_one_line_per_substance_and_a_summary(client, fake_analysis):
+    body = {"substances": ["50-00-0", "50-00-1", "unknown"], "options": {"profiling": True}, "parallelism": 2}
+    response = client.post("/api/batch/screen", json=body)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = ndjson(response)
+    summary = lines.pop()["summary"]
+    assert sorted(line["status"] for line in lines) == ["invalid", "not_found", "ok"]
+    assert (summary["total"], summary["ok"], summary["not_found"], summary["invalid"]) == (3, 1, 1, 1)
+    assert summary["parallelism"] == 2
+    # The bad check digit never reaches the pipeline
+    assert sorted(query for query, _, _ in fake_analysis) == ["50-00-0", "unknown"]
+
+
+def test_batch_stages_do_not_use_the_shared_analysis_pool(client, fake_analysis):
+    client.post("/api/batch/screen", json={"substances": ["50-00-0", "64-17-5"]}).get_data()
+    executors = {executor for _, _, executor in fake_analysis}
+    assert len(executors) == 1
+    assert None not in executors and qsar._analysis_executor not in executors
+
+
+def test_csv_upload_uses_the_cas_column(client, fake_analysis):
+    csv_file = (io.BytesIO(b"name,cas\nformaldehyde,50-00-0\nethanol,64-17-5\n"), "lista.csv")
+    response = client.post("/api/batch/screen", data={"file": csv_file, "options": '{"readAcross": true}'})
+    lines = ndjson(response)
+    assert lines[-1]["summary"]["ok"] == 2
+    assert {query for query, _, _ in fake_analysis} == {"50-00-0", "64-17-5"}
+    assert all(options == {"readAcross": True} for _, options, _ in fake_analysis)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"json": ["50-00-0"]},
+    {"data": "no es json", "content_type": "application/json"},
+    {"json": {"substances": "50-00-0"}},
+    {"json": {"substances": ["50-00-0"], "options": ["profiling"]}},
+    {"data": {"file": (io.BytesIO(b"cas\n50-00-0\n"), "l.csv"), "options": "{roto"}},
+    {"data": {"file": (io.BytesIO(b"cas\n50-00-0\n"), "l.csv"), "options": "[1, 2]"}},
+    {"json": {"substances": []}},
+])
+def test_malformed_requests_are_rejected(client, fake_analysis, kwargs):
+    response = client.post("/api/batch/screen", **kwargs)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert fake_analysis == []
@@ -0,0 +1,69 @@
+import json
+import sys
+
+import pytest
+
+import benchmark
+
+
+def test_percentile_interpolates():
+    assert benchmark.percentile([], 50) is None
+    assert benchmark.percentile([10, 20, 30, 40], 50) == 25
+    assert benchmark.percentile([10, 20, 30, 40], 100) == 40
+
+
+def test_compare_reports_relative_changes():
+    def run(p50, rps):
+        return {"scenario": "chat", "concurrency": 4, "throughput_rps": rps,
+                "latency_ms": {"p50": p50, "p95": p50 * 2, "p99": None}}
+
+    rows = benchmark.compare({"results": [run(50, 30)]}, {"results": [run(100, 20)]})
+    assert rows == [{
+        "scenario": "chat", "concurrency": 4,
+        "p50_change_pct": -50.0, "p95_change_pct": -50.0, "p99_change_pct": None,
+        "throughput_change_pct": 50.0,
+    }]
+
+
+def test_offline_run_against_the_fakes(tmp_path):
+    output = tmp_path / "results.json"
+    code = benchmark.main([
+        "--scenarios", "chat,toolbox_search", "--concurrency", "2", "--requests", "4", "--warmup", "1",
+        "--toolbox-latency", "0", "--pubchem-latency", "0", "--llm-latency", "0",
+        "--output", str(output),
+    ])
+    assert code == 0
+    results = json.loads(output.read_text())["results"]
+    assert [(r["scenario"], r["ok"]) for r in results] == [("chat", 4), ("toolbox_search", 4)]
+    assert results[0]["upstream_calls"]["gemini"]["total"] >= 1
+
+
+def test_backend_state_stays_in_the_workdir(tmp_path):
+    class Fake:
+        url = "http://127.0.0.1:1"
+
+    upstreams = {"toolbox": Fake(), "pubchem": Fake(), "gemini": Fake()}
+    args = benchmark.parse_args(["--env", "TOOLBOX_RATE=50"])
+    env = benchmark.backend_env(args, upstreams, str(tmp_path), 8000)
+    for key in ("LOOKUP_CACHE_PATH", "LLM_CACHE_PATH", "IDENTITY_INDEX_PATH", "RATE_LIMIT_DIR",
+                "JOB_STORE_PATH", "WATCHLIST_STATE_PATH"):
+        assert env[key].startswith(str(tmp_path))
+    assert env["IDENTITY_INDEX_ENABLED"] == "false"
+    assert env["TOOLBOX_RATE"] == "50"
+
+    cached = benchmark.backend_env(benchmark.parse_args(["--cache"]), upstreams, str(tmp_path), 8000)
+    assert cached.get("IDENTITY_INDEX_ENABLED") != "false"
+
+
+def test_offline_run_against_the_asgi_mode(tmp_path):
+    pytest.importorskip("uvicorn")
+    output = tmp_path / "results.json"
+    code = benchmark.main([
+        "--scenarios", "chat", "--concurrency", "2", "--requests", "4", "--warmup", "1",
+        "--toolbox-latency", "0", "--pubchem-latency", "0", "--llm-latency", "0",
+        "--server", f"{sys.executable} -m uvicorn asgi:app --port {{port}}",
+        "--output", str(output),
+    ])
+    assert code == 0
+    (result,) = json.loads(output.read_text())["results"]
+    assert result["status"] == {"200": 4}
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from conftest import qsar
+
+
+def open_breaker(reset_timeout=0.05):
+    breaker = qsar.CircuitBreaker("test", failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures_and_fails_fast():
+    breaker = open_breaker(reset_timeout=60)
+    assert breaker.state == breaker.OPEN
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.stats()["fast_failures"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = qsar.CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.is_open
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+
+
+def test_trial_without_verdict_frees_the_slot():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_abandoned_trial_expires_after_reset_timeout():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_client_fails_fast_while_open():
+    client = qsar.UpstreamClient("breaker-test", {**qsar.UPSTREAM_CONFIG["toolbox"], "breaker_reset": 60})
+    client.breaker.record_failure()
+    client.breaker._open()
+    with pytest.raises(qsar.UpstreamUnavailable):
+        client.get("api/v1/version")
@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import qsar
+
+
+@pytest.mark.parametrize("typed, cas", [
+    ("50-00-0", "50-00-0"),
+    ("50000", "50-00-0"),
+    ("0050-00-0", "50-00-0"),
+    ("7732 – 18 – 5", "7732-18-5"),
+    ("1071‑83‑6", "1071-83-6"),
+    ("9002-93-1", "9002-93-1"),
+    ("1234567-89-5", "1234567-89-5"),
+])
+def test_normalize_accepts_typed_variants(typed, cas):
+    assert qsar.normalize_cas(typed) == cas
+
+
+@pytest.mark.parametrize("typed", ["50-00-1", "7732-18-4", "1234", "12345678-90-1", "50-0-0", "abc"])
+def test_normalize_rejects_bad_check_digits_and_shapes(typed):
+    assert qsar.normalize_cas(typed) is None
+
+
+def test_check_digit():
+    assert qsar.cas_check_digit_ok("7732-18-5")
+    assert not qsar.cas_check_digit_ok("7732-18-6")
+    assert not qsar.cas_check_digit_ok("1-2")
+
+
+def test_extract_reports_invalid_cas_and_ignores_longer_numbers():
+    found = qsar.extract_identifiers("Compara 1071-83-6, 50-00-1 y 1071−83−6 con el lote 12345678-90-1")
+    assert found == {"cas": ["1071-83-6"], "invalid_cas": ["50-00-1"]}
+
+
+def test_checked_cas_raises_client_message():
+    with pytest.raises(ValueError, match="CAS inválido"):
+        qsar.checked_cas("50-00-1")
+    with pytest.raises(ValueError, match="CAS requerido"):
+        qsar.checked_cas("")
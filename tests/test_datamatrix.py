@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import qsar
+
+MATRIX = {
+    "category_id": "cat-1",
+    "rows": [
+        {"cas": "1071-83-6", "values": {"LD50": 5600, "LogKow": -3.2}},
+        {"cas": "2921-88-2", "LD50": 135, "BCF": 1800},
+        "sin datos",
+    ],
+}
+
+
+@pytest.fixture
+def toolbox(monkeypatch, tmp_path):
+    calls = []
+
+    def toolbox_post(endpoint, payload):
+        calls.append((endpoint, payload["category_id"]))
+        return MATRIX
+
+    cache = qsar.LookupCache(
+        str(tmp_path / "lookup.sqlite3"), memory_entries=16, disk_bytes=1 << 20,
+        ttl=qsar.LOOKUP_TTL, memory_item_bytes=64,
+    )
+    monkeypatch.setattr(cache, "refresh_toolbox_version", lambda: None)
+    monkeypatch.setattr(qsar, "lookup_cache", cache)
+    monkeypatch.setattr(qsar, "toolbox_post", toolbox_post)
+    return calls, cache
+
+
+def page(client, **params):
+    return client.post("/api/toolbox/datamatrix", json={"category_id": "cat-1", **params}).get_json()
+
+
+def test_prepare_normalizes_rows_and_endpoints_once():
+    prepared = qsar.prepare_datamatrix(MATRIX)
+    assert prepared["category_id"] == "cat-1"
+    assert [row["analog"] for row in prepared["rows"]] == ["1071-83-6", "2921-88-2", "2"]
+    assert prepared["endpoints"] == ["LD50", "LogKow", "BCF", "value"]
+    assert qsar.prepare_datamatrix(None) is None
+
+
+def test_pages_reuse_one_prepared_build(client, toolbox, monkeypatch):
+    calls, _ = toolbox
+    first = page(client, view="rows", limit=2)
+    assert first["total_rows"] == 3 and first["next_offset"] == 2
+    assert first["rows"][1] == {"analog": "2921-88-2", "values": {"LD50": 135, "BCF": 1800}}
+
+    def fail(matrix):
+        raise AssertionError("pages must not re-normalize the matrix")
+
+    monkeypatch.setattr(qsar, "matrix_rows", fail)
+    second = page(client, view="columns", offset=2, columns="LD50,value")
+    assert second["analogs"] == ["2"]
+    assert second["columns"] == {"LD50": [None], "value": ["sin datos"]}
+    assert calls == [("category/datamatrix", "cat-1")]
+
+
+def test_large_entries_stay_out_of_memory(client, toolbox):
+    _, cache = toolbox
+    page(client, view="rows")
+    cache.store("pubchem", "small", {"cid": 1})
+    assert cache.stats()["memory_entries"] == 1
+    assert page(client, view="rows")["total_rows"] == 3
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.counters["datamatrix"]["disk_hits"] == 1
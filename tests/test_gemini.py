@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions
+
+from conftest import qsar
+
+
+class FakeClient:
+    def __init__(self, name, errors):
+        self.name = name
+        self.errors = errors
+
+    def _fail(self):
+        error = self.errors.get(self.name)
+        if error:
+            raise error
+
+    def generate_content(self, prompt, stream=False):
+        if not stream:
+            self._fail()
+            return f"{self.name}: {prompt}"
+
+        def chunks():
+            self._fail()   # streamed calls only fail once iterated
+            yield f"{self.name}:"
+            yield prompt
+        return chunks()
+
+    async def generate_content_async(self, prompt, stream=False):
+        if not stream:
+            self._fail()
+            return f"{self.name}: {prompt}"
+
+        async def chunks():
+            self._fail()
+            yield f"{self.name}:"
+            yield prompt
+        return chunks()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    errors, lookups = {}, []
+
+    class FakeGenai:
+        @staticmethod
+        def get_model(name):
+            lookups.append(name)
+
+    monkeypatch.setattr(qsar, "_gemini_client", lambda name, system_prompt: FakeClient(name, errors))
+    monkeypatch.setattr(qsar, "genai", lambda: FakeGenai)
+    model = qsar.GeminiModel("primary", "fallback", "system")
+    return model, errors, lookups
+
+
+def test_active_model_answers(gemini):
+    model, _, lookups = gemini
+    assert model.generate("hola") == ("primary: hola", "primary")
+    assert model.generate_content("hola") == "primary: hola"
+    assert lookups == ["models/primary"]   # check() runs once, on first use
+
+
+def test_unavailable_model_falls_back_and_stays_switched(gemini):
+    model, errors, _ = gemini
+    errors["primary"] = exceptions.NotFound("no such model")
+    assert model.generate("hola") == ("fallback: hola", "fallback")
+    assert model.model_name == "fallback"
+
+
+def test_transient_errors_do_not_fall_back(gemini):
+    model, errors, _ = gemini
+    errors["primary"] = exceptions.ServiceUnavailable("overloaded")
+    with pytest.raises(exceptions.ServiceUnavailable):
+        model.generate("hola")
+    assert model.model_name == "primary"
+
+
+def test_stream_falls_back_when_the_error_surfaces_while_iterating(gemini):
+    model, errors, _ = gemini
+    errors["primary"] = exceptions.PermissionDenied("no access")
+    response, name = model.generate("hola", stream=True)
+    assert name == "fallback"
+    assert list(response) == ["fallback:", "hola"]
+
+
+def test_async_stream_falls_back(gemini):
+    model, errors, _ = gemini
+    errors["primary"] = exceptions.NotFound("no such model")
+
+    async def run():
+        response, name = await model.generate_async("hola", stream=True)
+        return name, [chunk async for chunk in response]
+
+    assert asyncio.run(run()) == ("fallback", ["fallback:", "hola"])
+
+
+def test_rest_transport_runs_the_blocking_client_in_a_thread(gemini, monkeypatch):
+    model, errors, _ = gemini
+    monkeypatch.setattr(qsar, "GEMINI_API_ENDPOINT", "http://127.0.0.1:9")
+    monkeypatch.setattr(FakeClient, "generate_content_async", None)   # no async client on REST
+    errors["primary"] = exceptions.NotFound("no such model")
+
+    async def run():
+        text, _ = await model.generate_async("hola")
+        response, name = await model.generate_async("hola", stream=True)
+        return text, name, [chunk async for chunk in response]
+
+    assert asyncio.run(run()) == ("fallback: hola", "fallback", ["fallback:", "hola"])
+
+
+def test_check_skips_an_unavailable_primary(monkeypatch):
+    class FakeGenai:
+        @staticmethod
+        def get_model(name):
+            if name == "models/primary":
+                raise exceptions.NotFound("no such model")
+
+    monkeypatch.setattr(qsar, "genai", lambda: FakeGenai)
+    model = qsar.GeminiModel("primary", "fallback", "system")
+    assert model.check() == "fallback"
+    assert model.model_name == "fallback"
+
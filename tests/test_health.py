@@ -0,0 +1,49 @@
+from conftest import qsar
+
+
+def prober(base_url):
+    checks = {
+        "version": (f"{base_url}/api/v1/version", None, "Versión check falló"),
+        "profilers": (f"{base_url}/api/v1/profiling/available", None, "Profilers endpoint no disponible"),
+    }
+    return qsar.HealthProber(checks, interval=0, timeout=2, history=3)
+
+
+def test_snapshot_is_probed_once_and_then_served(upstream):
+    upstream.routes["/api/v1/version"] = (200, {"version": "4.8"})
+    upstream.routes["/api/v1/profiling/available"] = (200, [])
+    health = prober(upstream.url)
+
+    first = health.snapshot()
+    second = health.snapshot()
+    assert first["checks"]["version"]["ok"]
+    assert first["checks"]["version"]["version"] == "4.8"
+    assert second["started"] == first["started"]
+    assert len(upstream.calls) == 2
+
+    health.snapshot(fresh=True)
+    assert len(upstream.calls) == 4
+    assert health.stats()["forced"] == 1
+    assert len(health.recent()) == 2
+
+
+def test_probes_bypass_retries_breaker_and_limiter(upstream):
+    upstream.routes["/api/v1/version"] = (500, {})
+    upstream.routes["/api/v1/profiling/available"] = (502, {})
+    breaker = qsar.toolbox_client.breaker.stats()
+    limiter = qsar.toolbox_client.limiter.stats()
+    health = prober(upstream.url)
+
+    snapshot = health.snapshot()
+    assert not snapshot["checks"]["version"]["ok"]
+    assert snapshot["checks"]["version"]["error"] == "Versión check falló: HTTP 500"
+    assert len(upstream.calls) == 2   # no retries
+    assert qsar.toolbox_client.breaker.stats() == breaker
+    assert qsar.toolbox_client.limiter.stats() == limiter
+
+
+def test_unreachable_toolbox_is_reported():
+    health = prober("http://127.0.0.1:9")
+    snapshot = health.snapshot()
+    assert not snapshot["checks"]["version"]["ok"]
+    assert "no se puede conectar" in snapshot["checks"]["version"]["error"]
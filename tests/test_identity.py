@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from conftest import qsar
+
+BROMACIL = {"cid": 9411, "formula": "C9H13BrN2O2", "smiles": "CCC(C)N1C(=O)C(Br)=C(C)NC1=O"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return qsar.IdentityIndex(str(tmp_path / "identity.sqlite3"), 1 << 20)
+
+
+def mentioned(index, text):
+    return [alias for alias, _ in index.find_all_in_text(text)]
+
+
+def test_only_curated_names_match_in_text(index):
+    index.add({**BROMACIL, "name": "Bromacil"}, ["Hyvar X"], cas="314-40-9", curated=True)
+    index.add({"cid": 2256, "name": "Atrazina"}, [], cas="1912-24-9", curated=True)
+    index.add({"cid": 5000}, ["herbicida triazínico"], cas="50-00-0")
+
+    assert mentioned(index, "Compara Hyvar X con atrazina y un herbicida triazínico") == ["hyvar x", "atrazina"]
+    assert index.find_in_text("perfil del herbicida triazínico") is None
+    assert index.resolve("herbicida triazínico")["cas"] == "50-00-0"
+
+
+def test_stop_words_and_short_aliases_never_match(index):
+    index.add({"cid": 962, "name": "Agua"}, ["H2O", "agua destilada"], cas="7732-18-5", curated=True)
+    index.add({"cid": 1, "name": "Sal"}, [], curated=True)
+    assert mentioned(index, "toxicidad en agua del metabolito con sal") == []
+    assert mentioned(index, "ensayo en agua destilada") == ["agua destilada"]
+    assert index.resolve("agua")["cid"] == 962
+
+
+def test_query_alias_does_not_replace_a_curated_one(index):
+    index.add({**BROMACIL, "name": "Bromacil"}, [], cas="314-40-9", curated=True)
+    index.add({"cid": 1234}, ["bromacil"])
+    assert index.resolve("bromacil")["cid"] == 9411
+    assert mentioned(index, "evalúa bromacil") == ["bromacil"]
+
+
+def test_legacy_aliases_are_migrated_as_not_curated(tmp_path):
+    path = str(tmp_path / "legacy.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE substances (id INTEGER PRIMARY KEY, cid INTEGER UNIQUE, cas TEXT, name TEXT, formula TEXT,"
+        " mw TEXT, xlogp TEXT, smiles TEXT, iupac TEXT, source TEXT, updated REAL)"
+    )
+    conn.execute("CREATE TABLE aliases (alias TEXT PRIMARY KEY, substance_id INTEGER NOT NULL) WITHOUT ROWID")
+    conn.execute("INSERT INTO substances (id, cid, cas, name) VALUES (1, 9411, '314-40-9', 'bromacil')")
+    conn.execute("INSERT INTO aliases VALUES ('bromacil', 1)")
+    conn.commit()
+    conn.close()
+
+    index = qsar.IdentityIndex(path, 1 << 20)
+    assert index.resolve("bromacil")["cid"] == 9411
+    assert index.find_in_text("evalúa bromacil") is None
+    index.add({**BROMACIL, "name": "Bromacil"}, [], cas="314-40-9", curated=True)
+    assert mentioned(index, "evalúa bromacil") == ["bromacil"]
+
+
+def test_csv_import_is_curated(index, tmp_path):
+    dump = tmp_path / "sustancias.csv"
+    dump.write_text("cas,name,synonyms,cid\n314-40-9,Bromacil,Hyvar X|Borea,9411\n", encoding="utf-8")
+    assert index.import_csv(str(dump)) == 1
+    assert mentioned(index, "compara borea con bromacil") == ["borea"]
+
+
+def test_pubchem_entries_expire_and_are_replaced(tmp_path, monkeypatch):
+    index = qsar.IdentityIndex(str(tmp_path / "identity.sqlite3"), 1 << 20, max_age=60)
+    index.add({"cid": 241, "formula": "C3H8NO5P"}, ["benceno"], cas="71-43-2")
+    index.import_rows([({"cid": 2256, "name": "Atrazina"}, [], "1912-24-9")], source="csv:portafolio.csv")
+    assert index.resolve("71-43-2")["formula"] == "C3H8NO5P"
+
+    later = qsar.time.time() + 120
+    monkeypatch.setattr(qsar.time, "time", lambda: later)
+    assert index.resolve("71-43-2") is None
+    assert index.resolve("atrazina")["cas"] == "1912-24-9"   # imported entries never expire
+
+    index.add({"cid": 241, "formula": "C6H6"}, ["benceno"], cas="71-43-2")
+    assert index.resolve("benceno")["formula"] == "C6H6"
+
+
+def test_stats_counts_are_reused(index, monkeypatch):
+    index.add({**BROMACIL, "name": "Bromacil"}, [], cas="314-40-9", curated=True)
+    assert index.stats()["substances"] == 1
+    index.add({"cid": 2256, "name": "Atrazina"}, [], cas="1912-24-9", curated=True)
+    assert index.stats()["substances"] == 1
+    monkeypatch.setattr(qsar, "IDENTITY_STATS_TTL", -1)
+    assert index.stats()["substances"] == 2
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from conftest import qsar
+
+READACROSS = {"type": "readacross", "cas": "1071-83-6", "endpoint": "LC50"}
+
+
+@pytest.fixture
+def job_store(monkeypatch, tmp_path):
+    def make(**kwargs):
+        config = {"workers": 2, "queue_max": 10, "result_ttl": 60, **kwargs}
+        store = qsar.JobStore(str(tmp_path / "jobs.sqlite3"), **config)
+        monkeypatch.setattr(qsar, "jobs", store)
+        return store
+    return make
+
+
+def test_job_runs_in_the_background_and_is_polled(client, job_store, monkeypatch):
+    job_store()
+    release = threading.Event()
+
+    def toolbox_post(endpoint, payload):
+        release.wait(2)
+        return {"endpoint": endpoint, "prediction": 3.2}
+
+    monkeypatch.setattr(qsar, "toolbox_post", toolbox_post)
+    submitted = client.post("/api/jobs", json=READACROSS)
+    assert submitted.status_code == 202
+    job = submitted.get_json()
+    assert submitted.headers["Location"] == job["status_url"]
+
+    pending = client.get(job["result_url"])
+    assert pending.status_code == 202 and pending.headers["Retry-After"] == "2"
+
+    release.set()
+    status = client.get(f"{job['status_url']}?wait=2").get_json()
+    assert status["status"] == "succeeded"
+    assert client.get(job["result_url"]).get_json() == {"endpoint": "readacross/predict", "prediction": 3.2}
+
+
+def test_failed_job_answers_502(client, job_store, monkeypatch):
+    job_store()
+    monkeypatch.setattr(qsar, "toolbox_post", lambda endpoint, payload: None)
+    job = client.post("/api/toolbox/readacross", json={**READACROSS, "async": True}).get_json()
+    assert client.get(f"{job['status_url']}?wait=2").get_json()["status"] == "failed"
+    result = client.get(job["result_url"])
+    assert result.status_code == 502
+    assert result.get_json()["error"] == "Toolbox no disponible"
+
+
+def test_full_queue_is_rejected_with_429(client, job_store, monkeypatch):
+    store = job_store(workers=1, queue_max=1)
+    release = threading.Event()
+    monkeypatch.setattr(qsar, "toolbox_post", lambda endpoint, payload: release.wait(2) or {"ok": True})
+    try:
+        assert client.post("/api/jobs", json=READACROSS).status_code == 202
+        assert client.post("/api/jobs", json=READACROSS).status_code == 429
+    finally:
+        release.set()
+    assert store.stats()["rejected"] == 1
+
+
+def test_failed_submit_gives_its_queue_slot_back(job_store, monkeypatch):
+    store = job_store(queue_max=1)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+    submit = store._executor.submit
+    monkeypatch.setattr(store._executor, "submit", broken)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            store.submit("readacross", {}, lambda: {"ok": True})
+    assert store.stats()["pending"] == 0
+
+    monkeypatch.setattr(store._executor, "submit", submit)
+    assert store.submit("readacross", {}, lambda: {"ok": True}) is not None
+
+
+def test_invalid_jobs_are_rejected_with_400(client, job_store):
+    job_store()
+    assert client.post("/api/jobs", json={"type": "otro"}).status_code == 400
+    assert client.post("/api/jobs", json={"type": "readacross", "cas": "50-00-1", "endpoint": "x"}).status_code == 400
+
+
+def test_jobs_of_a_dead_worker_are_reported_failed(job_store):
+    store = job_store()
+    db = store._db()
+    db.execute(
+        "INSERT INTO jobs (id, kind, status, params, pid, created)"
+        " VALUES ('orphan', 'datamatrix', 'running', '{}', ?, ?)",
+        (2 ** 22 + 12345, time.time()),
+    )
+    db.commit()
+    job = store.get("orphan")
+    assert job["status"] == "failed"
+    assert job["error"] == "El proceso que ejecutaba el trabajo terminó"
+
+
+def test_finished_jobs_expire(client, job_store, monkeypatch):
+    job_store(result_ttl=0.05)
+    monkeypatch.setattr(qsar, "toolbox_post", lambda endpoint, payload: {"ok": True})
+    job = client.post("/api/jobs", json=READACROSS).get_json()
+    assert client.get(f"{job['status_url']}?wait=2").get_json()["status"] == "succeeded"
+    time.sleep(0.06)
+    assert client.get(job["status_url"]).status_code == 404
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from conftest import qsar
+
+TTL = {"pubchem": 60, "profiling": 60, "short": 0.05}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "lookup.sqlite3")
+
+
+def make_cache(path, **kwargs):
+    cache = qsar.LookupCache(path, memory_entries=kwargs.pop("memory_entries", 8),
+                             disk_bytes=kwargs.pop("disk_bytes", 1 << 20), ttl=TTL, **kwargs)
+    cache.refresh_toolbox_version = lambda: None
+    return cache
+
+
+def test_computed_values_are_served_from_memory_then_disk(cache_path):
+    calls = []
+    cache = make_cache(cache_path)
+
+    def compute():
+        calls.append(1)
+        return {"cid": 962}
+
+    assert cache.get_or_compute("pubchem", " Water ", compute) == {"cid": 962}
+    assert cache.get_or_compute("pubchem", "water", compute) == {"cid": 962}
+    assert make_cache(cache_path).lookup("pubchem", "WATER") == {"cid": 962}   # another worker
+    assert len(calls) == 1
+    assert cache.stats()["sources"]["pubchem"]["memory_hits"] == 1
+
+
+def test_entries_expire_after_their_source_ttl(cache_path):
+    cache = make_cache(cache_path)
+    cache.store("short", "50-00-0", {"x": 1})
+    assert cache.lookup("short", "50-00-0") == {"x": 1}
+    time.sleep(0.06)
+    assert cache.lookup("short", "50-00-0") is None
+    assert make_cache(cache_path).lookup("short", "50-00-0") is None
+
+
+def test_empty_results_and_disabled_cache_store_nothing(cache_path):
+    cache = make_cache(cache_path)
+    cache.store("pubchem", "nada", None)
+    cache.store("pubchem", "vacio", {})
+    assert cache.lookup("pubchem", "nada") is None and cache.lookup("pubchem", "vacio") is None
+
+    disabled = make_cache(cache_path, enabled=False)
+    disabled.store("pubchem", "water", {"cid": 962})
+    assert disabled.lookup("pubchem", "water") is None
+    assert cache.lookup("pubchem", "water") is None
+
+
+def test_disk_tier_drops_least_recently_used_rows(cache_path):
+    cache = make_cache(cache_path, memory_entries=1, disk_bytes=60)
+    for name in ("a", "b", "c"):
+        cache.store("pubchem", name, {"value": name * 20})
+        time.sleep(0.01)
+    cache.lookup("pubchem", "a")   # from disk: now the most recently used
+    cache._evict(cache._db())
+    fresh = make_cache(cache_path)
+    assert fresh.lookup("pubchem", "a") is not None
+    assert fresh.lookup("pubchem", "b") is None
+
+
+def test_toolbox_version_change_drops_only_toolbox_entries(cache_path):
+    cache = make_cache(cache_path)
+    cache.set_toolbox_version("4.7")
+    cache.store("profiling", "50-00-0", {"alerts": []}, payload={"profilers": ["a"]})
+    cache.store("pubchem", "50-00-0", {"cid": 712})
+
+    cache.set_toolbox_version("4.8")
+    assert cache.lookup("profiling", "50-00-0", payload={"profilers": ["a"]}) is None
+    assert cache.lookup("pubchem", "50-00-0") == {"cid": 712}
+    assert cache.stats()["toolbox_version"] == "4.8"
@@ -0,0 +1,67 @@
+import pytest
+from starlette.testclient import TestClient
+
+import asgi
+from conftest import qsar, upstream_client
+
+
+@pytest.fixture
+def toolbox(upstream, monkeypatch):
+    upstream.routes["/api/v1/substances/search"] = (200, [{"cas": "314-40-9"}])
+    monkeypatch.setattr(qsar, "toolbox_client", upstream_client(f"{upstream.url}/api/v1"))
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", False)
+    return upstream
+
+
+def test_upstream_calls_appear_in_server_timing(client, toolbox):
+    response = client.get("/api/toolbox/search?q=bromacil")
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith('test;desc="GET substances/search 200";dur=')
+    assert ", total;dur=" in timing
+
+
+def test_metrics_expose_requests_upstreams_and_caches(client, toolbox):
+    client.get("/api/toolbox/search?q=bromacil")
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'qsar_upstream_responses_total{upstream="test",status="200"}' in text
+    assert 'qsar_http_request_duration_seconds_count{route="/api/toolbox/search",method="GET",status="200"}' in text
+    assert '# TYPE qsar_upstream_circuit_state gauge' in text
+    assert 'qsar_cache_lookups_total{cache="lookup",source="pubchem",outcome="misses"}' in text
+    assert 'qsar_upstream_rate_limit_wait_seconds_count{upstream="test"}' in text
+    assert 'qsar_upstream_rate_limit_queue_depth{upstream="test"} 0' in text
+
+
+def test_async_routes_report_server_timing(toolbox, monkeypatch):
+    monkeypatch.setattr(asgi, "toolbox_client", asgi.AsyncUpstreamClient(qsar.toolbox_client))
+    response = TestClient(asgi.app).get("/api/toolbox/search?q=bromacil")
+    assert response.json() == [{"cas": "314-40-9"}]
+    assert 'test;desc="GET substances/search 200"' in response.headers["Server-Timing"]
+
+
+def test_requests_without_spans_get_no_header(client):
+    assert "Server-Timing" not in client.get("/metrics").headers
+
+
+@pytest.mark.parametrize("path, label", [
+    ("compound/name/bromacil/property/MolecularFormula/JSON", "compound/name/:id/property"),
+    ("https://pubchem.example/rest/pug/compound/cid/962/JSON", "rest/pug/compound/cid"),
+    ("substances/12345?x=1", "substances/:id"),
+    ("profiling/run", "profiling/run"),
+])
+def test_endpoint_labels_hide_identifiers(path, label):
+    assert qsar.endpoint_label(path) == label
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = qsar.Histogram("qsar_test_seconds", "Test.", ("stage",), buckets=(0.1, 1))
+    qsar.METRICS.remove(histogram)
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    assert histogram.render()[2:] == [
+        'qsar_test_seconds_bucket{stage="a",le="0.1"} 1',
+        'qsar_test_seconds_bucket{stage="a",le="1"} 2',
+        'qsar_test_seconds_bucket{stage="a",le="+Inf"} 2',
+        'qsar_test_seconds_sum{stage="a"} 0.550000',
+        'qsar_test_seconds_count{stage="a"} 2',
+    ]
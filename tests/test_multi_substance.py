@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import qsar
+
+CAS = ["1071-83-6", "2921-88-2", "6515-38-4"]
+
+
+@pytest.fixture
+def fake_upstreams(monkeypatch):
+    """Record every upstream call and answer from memory, with the lookup cache bypassed."""
+    calls = []
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def tracked(kind, *args):
+        with lock:
+            calls.append((kind, *args))
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.02)
+        with lock:
+            state["running"] -= 1
+
+    def pubchem(identifier):
+        tracked("pubchem", identifier)
+        return {"cid": len(identifier), "iupac": identifier}
+
+    def toolbox_get(endpoint, params=None):
+        tracked("get", endpoint, params["cas"])
+        return {"cas": params["cas"], "name": f"substance {params['cas']}"}
+
+    def toolbox_post(endpoint, payload):
+        tracked("post", endpoint, payload["cas"])
+        return {"alerts": [f"{endpoint}:{payload['cas']}"]}
+
+    monkeypatch.setattr(qsar, "get_pubchem_data", pubchem)
+    monkeypatch.setattr(qsar, "toolbox_get", toolbox_get)
+    monkeypatch.setattr(qsar, "toolbox_post", toolbox_post)
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", False)
+    monkeypatch.setattr(qsar, "PROFILING_SPLIT", False)
+    return calls, state
+
+
+def test_every_mentioned_cas_gets_its_own_plan():
+    found, plans = qsar.plan_toolbox_analysis(f"Compara {CAS[0]} con {CAS[1]} y 50-00-1", {"profiling": True})
+    assert found == {"cas": CAS[:2], "invalid_cas": ["50-00-1"]}
+    assert [results["cas"] for results, _, _ in plans] == CAS[:2]
+    assert set(plans[0][2]) == {"toolbox_data", "profiling"}
+
+
+def test_substances_are_capped(monkeypatch):
+    monkeypatch.setattr(qsar, "CHAT_MAX_SUBSTANCES", 2)
+    found, plans = qsar.plan_toolbox_analysis(" ".join(CAS), {})
+    assert len(plans) == 2
+
+
+def test_names_known_to_the_identity_index_are_planned_once():
+    qsar.identity_index.add({"cid": 4000, "iupac": "x"}, ["quimicomulti"], cas=CAS[2], curated=True)
+    found, plans = qsar.plan_toolbox_analysis(f"Compara {CAS[0]}, quimicomulti y {CAS[2]}", {})
+    assert [results["cas"] for results, _, _ in plans] == [CAS[0], CAS[2]]
+
+
+def test_combined_result_keys_stages_by_cas(fake_upstreams):
+    results = qsar.run_toolbox_analysis(f"Compara {CAS[0]} con {CAS[1]}", {"profiling": True, "readAcross": True})
+    assert [part["cas"] for part in results["substances"]] == CAS[:2]
+    assert results["cas"] == CAS[0]
+    assert results["stages"][f"toolbox_data:{CAS[1]}"] == "ok"
+    assert set(results["stages"]) == {f"{stage}:{cas}" for stage in
+                                      ("toolbox_data", "pubchem_data", "profiling", "category") for cas in CAS[:2]}
+    assert results["substances"][1]["profiling"] == {"alerts": [f"profiling/run:{CAS[1]}"]}
+
+
+def test_one_request_runs_at_most_analysis_workers_stages(fake_upstreams, monkeypatch):
+    calls, state = fake_upstreams
+    monkeypatch.setattr(qsar, "ANALYSIS_WORKERS", 2)
+    results = qsar.run_toolbox_analysis(" ".join(CAS), {"profiling": True, "readAcross": True})
+    assert len(calls) == 12
+    assert state["peak"] <= 2
+    assert set(results["stages"].values()) == {"ok"}
+
+
+def test_asgi_caps_stages_per_request(fake_upstreams, monkeypatch):
+    asgi = pytest.importorskip("asgi")
+    calls, state = fake_upstreams
+    running = {"now": 0, "peak": 0}
+
+    async def pubchem(identifier):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.02)
+        running["now"] -= 1
+        return {"cid": 1}
+
+    monkeypatch.setattr(qsar, "ANALYSIS_WORKERS", 2)
+    monkeypatch.setattr(asgi, "get_pubchem_data", pubchem)
+    monkeypatch.setattr(asgi, "toolbox_call", lambda method, endpoint, body: pubchem(endpoint))
+    monkeypatch.setattr(asgi, "cached", lambda source, cas, fn, payload=None: fn())
+
+    results = asyncio.run(asgi.run_toolbox_analysis(" ".join(CAS), {"profiling": True}))
+    assert running["peak"] == 2
+    assert set(results["stages"].values()) == {"ok"}
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from conftest import qsar
+
+CAS = "1912-24-9"
+
+
+@pytest.fixture
+def profilers(monkeypatch):
+    """Fake per-profiler Toolbox calls: `delays` and `failures` are keyed by profiler."""
+    calls, delays, failures = [], {}, set()
+
+    def toolbox_post(endpoint, payload):
+        profiler = payload["profilers"][0]
+        calls.append(profiler)
+        time.sleep(delays.get(profiler, 0))
+        if profiler in failures:
+            return None
+        return {"alerts": [f"alert {profiler}"]} if profiler != "other" else {"score": 1}
+
+    monkeypatch.setattr(qsar, "toolbox_post", toolbox_post)
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", False)
+    return calls, delays, failures
+
+
+def test_merge_concatenates_alerts_and_keeps_other_results():
+    merged = qsar.merge_profiling(CAS, ["a", "b", "c"], {"a": {"alerts": [1]}, "b": {"alerts": [2]}, "c": {"x": 1}})
+    assert merged == {"cas": CAS, "profilers": ["a", "b", "c"], "alerts": [1, 2], "results": {"c": {"x": 1}}}
+    assert qsar.merge_profiling(CAS, ["a"], {}) is None
+
+
+def test_report_flags_partial_runs():
+    report = qsar.profiling_report(["a", "b"], {"a": "cached", "b": "timeout"}, {"b": 12.0})
+    assert report == {"status": {"a": "cached", "b": "timeout"}, "timings_ms": {"b": 12.0}, "partial": True}
+    assert not qsar.profiling_report(["a"], {"a": "ok"}, {})["partial"]
+
+
+def test_failed_profiler_is_reported_outside_the_payload(profilers):
+    calls, _, failures = profilers
+    failures.add("b")
+    report = {}
+    data = qsar.run_profiling(CAS, ["a", "b", "other"], report=report)
+    assert data["alerts"] == ["alert a"]
+    assert data["results"] == {"other": {"score": 1}}
+    assert "status" not in data and "timings_ms" not in data
+    assert report["status"] == {"a": "ok", "b": "error", "other": "ok"}
+    assert report["partial"]
+
+
+def test_slow_profiler_is_cut_off_by_the_timeout(profilers):
+    _, delays, _ = profilers
+    delays["slow"] = 1
+    report = {}
+    started = time.monotonic()
+    data = qsar.run_profiling(CAS, ["a", "slow"], timeout=0.2, report=report)
+    assert time.monotonic() - started < 0.8
+    assert data["alerts"] == ["alert a"]
+    assert report["status"]["slow"] == "timeout"
+
+
+def test_cached_profilers_are_not_recomputed(profilers, monkeypatch):
+    calls, _, _ = profilers
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", True)
+    cas = "7732-18-5"
+    qsar.run_profiling(cas, ["a"])
+    report = {}
+    data = qsar.run_profiling(cas, ["a", "b"], report=report)
+    assert calls == ["a", "b"]
+    assert report["status"] == {"a": "cached", "b": "ok"}
+    assert data["alerts"] == ["alert a", "alert b"]
+
+
+def test_partial_profiling_survives_in_the_analysis(profilers, monkeypatch):
+    _, delays, _ = profilers
+    delays["skin_sensitization"] = 1
+    monkeypatch.setattr(qsar, "ANALYSIS_DEADLINE", 0.5)
+    monkeypatch.setattr(qsar, "PROFILING_MERGE_MARGIN", 0.2)
+    monkeypatch.setattr(qsar, "get_pubchem_data", lambda identifier: None)
+    monkeypatch.setattr(qsar, "toolbox_get", lambda endpoint, params=None: None)
+
+    results = qsar.run_toolbox_analysis(f"perfila {CAS}", {"profiling": True})
+    assert results["stages"]["profiling"] == "partial"
+    assert results["profiling"]["alerts"] == ["alert mutagenicity", "alert aquatic_toxicity"]
+    assert results["profiling_report"]["status"]["skin_sensitization"] == "timeout"
+    assert not qsar.llm_cacheable(results)
+
+
+def test_profile_endpoint_reports_status_and_timings(client, profilers):
+    response = client.post("/api/toolbox/profile", json={"cas": CAS, "profilers": ["mutagenicity", "ecotoxicity"]})
+    body = response.get_json()
+    assert body["alerts"] == ["alert mutagenicity", "alert ecotoxicity"]
+    assert body["status"] == {"mutagenicity": "ok", "ecotoxicity": "ok"}
+    assert set(body["timings_ms"]) == {"mutagenicity", "ecotoxicity"}
+    assert body["partial"] is False
+
+
+def test_checked_profilers():
+    assert qsar.checked_profilers(None) == qsar.DEFAULT_PROFILERS
+    assert qsar.checked_profilers(["ecotoxicity", "mutagenicity", "ecotoxicity"]) == ["ecotoxicity", "mutagenicity"]
+
+
+@pytest.mark.parametrize("value", ["mutagenicity", [], [{"name": "mutagenicity"}], ["mutagenicity", "m"], 3])
+def test_profile_endpoint_rejects_bad_profilers(client, profilers, value):
+    calls, _, _ = profilers
+    response = client.post("/api/toolbox/profile", json={"cas": CAS, "profilers": value})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert calls == []
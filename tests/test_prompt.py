@@ -0,0 +1,50 @@
+from conftest import qsar
+
+PUBCHEM = {"formula": "C9H13BrN2O2", "mw": "261.12", "logKow": 1.9, "iupac": "x", "smiles": "CC"}
+
+
+def analogs(count):
+    return {"category_id": "cat-1", "analogs": [
+        {"cas": f"{i}-00-0", "similarity": 0.9, "internal_blob": "z" * 500} for i in range(count)
+    ]}
+
+
+def test_projection_keeps_relevant_fields_and_clips():
+    projected = qsar.project_payload({
+        "alerts": [{"name": "Michael acceptor", "risk": "high", "debug": {"trace": "…"}}] * 20,
+        "description": "d" * 1000,
+        "raw_xml": "<x/>",
+        "result": None,
+    }, max_items=2)
+    assert projected["alerts"][:2] == [{"name": "Michael acceptor", "risk": "high"}] * 2
+    assert projected["alerts"][2] == "… (+18)"
+    assert len(projected["description"]) == qsar.PROMPT_MAX_STRING + 1
+    assert "raw_xml" not in projected and "result" not in projected
+
+
+def test_prompt_stays_within_budget_dropping_analogs_first(monkeypatch):
+    monkeypatch.setattr(qsar, "PROMPT_TOKEN_BUDGET", 400)
+    results = {
+        "cas": "314-40-9",
+        "pubchem_data": PUBCHEM,
+        "profiling": {"alerts": [{"name": "Protein binding", "risk": "low"}]},
+        "category": analogs(500),
+    }
+    prompt = qsar.build_llm_prompt("Evalúa 314-40-9", results, "es")
+    assert qsar.estimate_tokens(prompt) <= 400
+    assert "Datos PubChem" in prompt and "Protein binding" in prompt
+    assert "internal_blob" not in prompt
+    assert "read-across" in prompt   # shortened list, or named as omitted
+    assert prompt.endswith("técnico y bien estructurado.")
+
+
+def test_sections_shared_by_several_substances_are_sent_once():
+    category = analogs(3)
+    results = {"cas": "314-40-9", "substances": [
+        {"cas": "314-40-9", "name": "bromacil", "pubchem_data": PUBCHEM, "category": category},
+        {"cas": "1912-24-9", "name": "atrazina", "category": category},
+    ]}
+    prompt = qsar.build_llm_prompt("Compara bromacil y atrazina", results, "en")
+    assert prompt.count('"1-00-0"') == 1
+    assert "idéntico a" in prompt
+    assert "Respond in English." in prompt
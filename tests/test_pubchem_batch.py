@@ -0,0 +1,75 @@
+import json
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from conftest import qsar
+
+NAMES = {"formaldehido-batch": 712, "etanol-batch": 702, "50-00-0": 712}
+
+
+def properties(cids):
+    return {"PropertyTable": {"Properties": [
+        {"CID": int(cid), "MolecularFormula": "CH2O", "MolecularWeight": "30.03", "XLogP": 0.35,
+         "IsomericSMILES": "C=O", "IUPACName": f"compound {cid}"}
+        for cid in cids
+    ]}}
+
+
+@pytest.fixture
+def pubchem(upstream, monkeypatch):
+    def by_name(method, path, query, body):
+        name = path.split("/compound/name/", 1)[1].split("/", 1)[0]
+        if name not in NAMES:
+            return 404, {"Fault": {"Code": "PUGREST.NotFound"}}
+        return 200, {"IdentifierList": {"CID": [NAMES[name]]}}
+
+    def by_cid(method, path, query, body):
+        return 200, properties(parse_qs(body)["cid"][0].split(","))
+
+    for name in NAMES:
+        upstream.routes[f"/rest/pug/compound/name/{name}/cids/JSON"] = by_name
+    upstream.routes["/rest/pug/compound/name/desconocido-batch/cids/JSON"] = by_name
+    upstream.routes[f"/rest/pug/compound/cid/property/{qsar.PUBCHEM_PROPERTIES}/JSON"] = by_cid
+    monkeypatch.setattr(qsar.pubchem_client, "base_url", f"{upstream.url}/rest/pug")
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", True)
+    return upstream
+
+
+def test_names_are_resolved_to_cids_then_fetched_in_one_post(pubchem):
+    results = qsar.get_pubchem_data_batch(["formaldehido-batch", "etanol-batch", "desconocido-batch"])
+
+    assert results["formaldehido-batch"]["cid"] == 712
+    assert results["etanol-batch"]["iupac"] == "compound 702"
+    assert results["desconocido-batch"] is None
+    posts = [call for call in pubchem.calls if call[0] == "POST"]
+    assert len(posts) == 1
+    assert sorted(parse_qs(posts[0][3])["cid"][0].split(",")) == ["702", "712"]
+    assert qsar.lookup_cache.lookup("pubchem_cid", "etanol-batch") == 702
+
+
+def test_repeated_batches_are_served_from_cache(pubchem):
+    qsar.get_pubchem_data_batch(["formaldehido-batch", "etanol-batch"])
+    calls = len(pubchem.calls)
+    again = qsar.get_pubchem_data_batch(["formaldehido-batch", "etanol-batch"])
+    assert again["formaldehido-batch"]["cid"] == 712
+    assert len(pubchem.calls) == calls
+
+
+def test_invalid_cas_is_never_sent(pubchem):
+    assert qsar.get_pubchem_data_batch(["50-00-1"]) == {"50-00-1": None}
+    assert pubchem.calls == []
+
+
+def test_streamed_batch_does_not_wait_for_the_prefetch(client, monkeypatch):
+    monkeypatch.setattr(qsar.lookup_cache, "enabled", True)
+    monkeypatch.setattr(qsar, "get_pubchem_data_batch", lambda identifiers: time.sleep(1.5))
+    monkeypatch.setattr(qsar, "run_toolbox_analysis", lambda q, o, e=None: {"cas": q, "pubchem_data": {"cid": 1}})
+
+    started = time.monotonic()
+    response = client.post("/api/batch/screen", json={"substances": ["50-00-0", "64-17-5", "71-43-2"],
+                                                      "parallelism": 1})
+    first = json.loads(next(iter(response.response)))
+    assert first["status"] == "ok"
+    assert time.monotonic() - started < 1
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from conftest import qsar, upstream_client
+
+
+def test_busy_upstream_pauses_the_bucket_and_retries(upstream):
+    answers = iter([(429, {}), (200, {"ok": True})])
+    upstream.routes["/profiling/run"] = lambda *request: next(answers)
+    client = upstream_client(upstream.url, rate=1000, burst=5)
+    assert client.post("profiling/run", json={}).json() == {"ok": True}
+    assert len(upstream.calls) == 2
+    assert client.limiter.stats()["penalties"] == 1
+    assert client.breaker.stats()["state"] == "closed"
+
+
+def limiter(tmp_path=None, **kwargs):
+    config = {"rate": 20, "burst": 2, "max_concurrent": 1, "max_wait": 1, **kwargs}
+    return qsar.RateLimiter("test", shared_dir=str(tmp_path) if tmp_path else "", **config)
+
+
+def test_bucket_allows_a_burst_then_paces_calls():
+    bucket = limiter()
+    started = time.monotonic()
+    for _ in range(3):
+        with bucket.slot():
+            pass
+    assert time.monotonic() - started >= 0.04   # third call waited for a token (1/20 s)
+    assert bucket.stats()["acquired"] == 3
+
+
+def test_waiting_callers_are_counted_in_the_queue_depth():
+    bucket = limiter(rate=0, max_wait=2)
+
+    def call():
+        with bucket.slot():
+            pass
+
+    waiter = threading.Thread(target=call)
+    with bucket.slot():
+        waiter.start()
+        time.sleep(0.1)
+        assert bucket.stats()["queue_depth"] == 1
+    waiter.join()
+    stats = bucket.stats()
+    assert (stats["queue_depth"], stats["max_queue_depth"]) == (0, 1)
+
+
+def test_callers_give_up_after_max_wait():
+    bucket = limiter(rate=1, burst=1, max_wait=0.1)
+    with bucket.slot():
+        pass
+    with pytest.raises(qsar.UpstreamBusy):
+        with bucket.slot():
+            pass
+    assert bucket.stats()["timeouts"] == 1
+
+
+def test_shared_bucket_and_slots_hold_across_workers(tmp_path):
+    first, second = limiter(tmp_path, burst=1, max_wait=0.1), limiter(tmp_path, burst=1, max_wait=0.1)
+    assert first.take_token() == 0
+    assert second.take_token() > 0   # the other "worker" already spent the burst
+
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with limiter(tmp_path, rate=0).slot():
+            holding.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(2)
+    try:
+        with pytest.raises(qsar.UpstreamBusy):
+            with limiter(tmp_path, rate=0, max_wait=0.1).slot():
+                pass
+    finally:
+        release.set()
+        thread.join()
+    with limiter(tmp_path, rate=0, max_wait=0.1).slot():
+        pass
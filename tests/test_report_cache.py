@@ -0,0 +1,155 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from conftest import qsar
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Answers every prompt; `answered_by` plays a fallback model taking over."""
+
+    def __init__(self):
+        self.model_name = "primary"
+        self.answered_by = "primary"
+        self.prompts = []
+
+    def _answer(self, prompt):
+        self.prompts.append(prompt)
+        self.model_name = self.answered_by
+        return f"informe: {prompt}"
+
+    def generate(self, prompt, stream=False):
+        text = self._answer(prompt)
+        return ([FakeResponse(text)] if stream else FakeResponse(text)), self.answered_by
+
+    async def generate_async(self, prompt, stream=False):
+        text = self._answer(prompt)
+
+        async def chunks():
+            yield FakeResponse(text)
+        return (chunks() if stream else FakeResponse(text)), self.answered_by
+
+
+@pytest.fixture
+def chat_env(monkeypatch, tmp_path):
+    model = FakeModel()
+    analyses = []
+
+    def analysis(query, options, executor=None):
+        analyses.append(query)
+        return {"cas": qsar.extract_cas(query), "stages": {"toolbox_data": "ok"}}
+
+    cache = qsar.LookupCache(
+        str(tmp_path / "llm.sqlite3"), memory_entries=16, disk_bytes=1 << 20, ttl={"llm": 60},
+    )
+    monkeypatch.setattr(qsar, "llm_cache", cache)
+    monkeypatch.setattr(qsar, "GEMINI_KEY", "test")
+    monkeypatch.setattr(qsar, "get_gemini_model", lambda: model)
+    monkeypatch.setattr(qsar, "run_toolbox_analysis", analysis)
+    monkeypatch.setattr(qsar, "build_llm_prompt", lambda query, results, language: f"{results['cas']}/{language}")
+    monkeypatch.setattr(qsar.lookup_cache, "refresh_toolbox_version", lambda: None)
+    return model, analyses, cache
+
+
+def ask(client, query, **extra):
+    return client.post("/api/chat", json={"query": query, **extra})
+
+
+def stream_events(response_text):
+    events = []
+    for block in response_text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_repeated_request_skips_analysis_and_model(client, chat_env):
+    model, analyses, _ = chat_env
+    first = ask(client, "Evalúa 1071-83-6")
+    second = ask(client, "  evalúa   1071-83-6 ")
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.get_json()["message"] == first.get_json()["message"]
+    assert second.get_json()["cas"] == "1071-83-6"
+    assert len(analyses) == 1 and len(model.prompts) == 1
+
+
+def test_same_prompt_from_other_wording_reuses_report(client, chat_env):
+    model, analyses, _ = chat_env
+    ask(client, "Evalúa 1071-83-6")
+    other = ask(client, "Perfil de 1071-83-6")
+    assert other.headers["X-Cache"] == "HIT"
+    assert len(analyses) == 2 and len(model.prompts) == 1
+
+
+def test_bypass_and_options_miss(client, chat_env):
+    model, _, _ = chat_env
+    ask(client, "Evalúa 1071-83-6")
+    assert ask(client, "Evalúa 1071-83-6", cache="bypass").headers["X-Cache"] == "BYPASS"
+    assert ask(client, "Evalúa 1071-83-6", language="en").headers["X-Cache"] == "MISS"
+    assert len(model.prompts) == 3
+
+
+def test_report_is_keyed_by_the_model_that_answered(client, chat_env):
+    model, analyses, cache = chat_env
+    model.answered_by = "fallback"
+    ask(client, "Evalúa 1071-83-6")
+    report_cache = qsar.ReportCache({}, "Evalúa 1071-83-6", {}, "es")
+    assert cache.lookup("llm", report_cache.request_key("fallback"))["message"] == "informe: 1071-83-6/es"
+    assert cache.lookup("llm", report_cache.request_key("primary")) is None
+    assert ask(client, "Evalúa 1071-83-6").headers["X-Cache"] == "HIT"
+    assert len(analyses) == 1
+
+
+def test_incomplete_analysis_is_not_stored(client, chat_env, monkeypatch):
+    model, _, _ = chat_env
+    monkeypatch.setattr(qsar, "run_toolbox_analysis", lambda query, options: {"cas": None, "degraded": True})
+    ask(client, "Evalúa algo")
+    assert ask(client, "Evalúa algo").headers["X-Cache"] == "MISS"
+    assert len(model.prompts) == 2
+
+
+def test_legacy_text_entry_is_a_miss(client, chat_env):
+    model, _, cache = chat_env
+    report_cache = qsar.ReportCache({}, "Evalúa 1071-83-6", {}, "es")
+    cache.store("llm", report_cache.request_key("primary"), "informe antiguo")
+    response = ask(client, "Evalúa 1071-83-6")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.get_json()["message"] == "informe: 1071-83-6/es"
+
+
+def test_stream_hit_sends_cached_context(client, chat_env):
+    model, analyses, _ = chat_env
+    ask(client, "Evalúa 1071-83-6", moleculeName="Bromacil")
+    events = stream_events(client.post(
+        "/api/chat/stream", json={"query": "Evalúa 1071-83-6", "moleculeName": "Bromacil"},
+    ).get_data(as_text=True))
+    assert [name for name, _ in events] == ["context", "token", "done"]
+    assert events[0][1]["cas"] == "1071-83-6"
+    assert events[1][1]["text"] == "informe: 1071-83-6/es"
+    assert events[2][1]["cache"] == "HIT"
+    assert len(analyses) == 1 and len(model.prompts) == 1
+
+
+def test_asgi_endpoints_share_the_cache(chat_env, monkeypatch):
+    import asgi
+
+    model, analyses, _ = chat_env
+
+    async def analysis(query, options):
+        return qsar.run_toolbox_analysis(query, options)
+
+    monkeypatch.setattr(asgi, "run_toolbox_analysis", analysis)
+    asgi_client = TestClient(asgi.app)
+    first = asgi_client.post("/api/chat/stream", json={"query": "Evalúa 1071-83-6"})
+    second = asgi_client.post("/api/chat", json={"query": "Evalúa 1071-83-6"})
+    assert stream_events(first.text)[-1][1]["cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["message"] == "informe: 1071-83-6/es"
+    assert len(analyses) == 1 and len(model.prompts) == 1
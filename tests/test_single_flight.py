@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import qsar
+
+
+def run_concurrently(flights, key, fn, callers=5):
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(flights.do, "pubchem", key, fn) for _ in range(callers)]
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_identical_concurrent_calls_share_one_request():
+    flights = qsar.SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(threading.current_thread())
+        time.sleep(0.1)
+        return {"cid": 962}
+
+    results = run_concurrently(flights, "pubchem:GET:water:{}", fetch)
+    assert results == [{"cid": 962}] * 5
+    assert len(calls) == 1
+    assert flights.stats()["pubchem"] == {"calls": 5, "deduplicated": 4, "in_flight": 0}
+
+
+def test_waiters_get_the_leaders_error():
+    flights = qsar.SingleFlight()
+
+    def fetch():
+        time.sleep(0.1)
+        raise ValueError("PubChem caído")
+
+    results = run_concurrently(flights, "k", fetch, callers=3)
+    assert all(isinstance(r, ValueError) for r in results)
+    with pytest.raises(KeyError):   # the failed flight is not remembered
+        flights.do("pubchem", "k", lambda: {}["x"])
+
+
+def test_calls_after_a_flight_lands_run_again():
+    flights = qsar.SingleFlight()
+    assert flights.do("toolbox", "k", lambda: 1) == 1
+    assert flights.do("toolbox", "k", lambda: 2) == 2
+
+
+def test_keys_ignore_payload_order():
+    make_key = qsar.SingleFlight.make_key
+    first = make_key("toolbox", "POST", "profiling/run", {"cas": "50-00-0", "profilers": ["a"]})
+    assert first == make_key("toolbox", "POST", "profiling/run", {"profilers": ["a"], "cas": "50-00-0"})
+    assert make_key("toolbox", "GET", "search", {"cas": "1"}) != make_key("toolbox", "POST", "search", {"cas": "1"})
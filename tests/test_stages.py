@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import qsar
+
+
+def sleeper(seconds, value="ok"):
+    def run():
+        time.sleep(seconds)
+        return value
+    return run
+
+
+def test_stage_statuses():
+    def fail():
+        raise RuntimeError("boom")
+
+    values, status = qsar.run_stages({"a": lambda: {"x": 1}, "b": lambda: None, "c": fail}, 5)
+    assert values == {"a": {"x": 1}, "b": None}
+    assert status == {"a": "ok", "b": "empty", "c": "error"}
+
+
+def test_slow_stage_times_out_without_holding_the_others():
+    started = time.monotonic()
+    values, status = qsar.run_stages({"fast": sleeper(0.01), "slow": sleeper(1)}, 0.2)
+    assert time.monotonic() - started < 0.8
+    assert status == {"fast": "ok", "slow": "timeout"}
+    assert "slow" not in values
+
+
+def test_deadline_covers_the_whole_call(monkeypatch):
+    # With one worker the second stage waits for the first; its queued time counts too
+    monkeypatch.setattr(qsar, "_analysis_executor", ThreadPoolExecutor(max_workers=1))
+    started = time.monotonic()
+    values, status = qsar.run_stages({"first": sleeper(0.15), "second": sleeper(0.15)}, 0.25)
+    assert time.monotonic() - started < 0.35
+    assert status == {"first": "ok", "second": "timeout"}
+
+
+def test_stages_beyond_the_worker_cap_wait_their_turn(monkeypatch):
+    monkeypatch.setattr(qsar, "ANALYSIS_WORKERS", 1)
+    running, peak = [], []
+
+    def stage():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.02)
+        running.pop()
+        return "ok"
+
+    values, status = qsar.run_stages({"a": stage, "b": stage, "c": stage}, 1)
+    assert status == {"a": "ok", "b": "ok", "c": "ok"}
+    assert max(peak) == 1
+
+
+def test_stage_still_queued_after_the_deadline_is_dropped(monkeypatch):
+    monkeypatch.setattr(qsar, "_analysis_executor", ThreadPoolExecutor(max_workers=1))
+    values, status = qsar.run_stages({"first": sleeper(0.5), "second": sleeper(0.01)}, 0.2)
+    assert status == {"first": "timeout", "second": "timeout"}
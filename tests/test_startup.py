@@ -0,0 +1,54 @@
+import subprocess
+
+from conftest import qsar
+
+
+class FakeGenai:
+    def __init__(self):
+        self.created = []
+
+    def GenerativeModel(self, model_name, system_instruction):
+        self.created.append(model_name)
+        return (model_name, system_instruction)
+
+
+def test_gemini_client_imports_outside_the_lock(monkeypatch):
+    module = FakeGenai()
+
+    def genai():
+        assert not qsar._gemini_lock.locked()
+        return module
+
+    monkeypatch.setattr(qsar, "genai", genai)
+    monkeypatch.setattr(qsar, "_gemini_clients", {})
+    first = qsar._gemini_client("model-a", "prompt")
+    assert qsar._gemini_client("model-a", "prompt") is first
+    assert module.created == ["model-a"]
+
+
+def test_import_time_report_uses_the_worker_environment(monkeypatch):
+    seen = {}
+
+    def run(args, **kwargs):
+        seen.update(kwargs)
+        stderr = "import time: self [us] | cumulative | imported package\nimport time:       10 |        30 | app\n"
+        return subprocess.CompletedProcess(args, 0, "", stderr)
+
+    monkeypatch.setattr(qsar.subprocess, "run", run)
+    report = qsar.import_time_report("app")
+    assert "env" not in seen
+    assert report["total_us"] == 30
+
+
+def test_admin_startup_measures_without_blocking_lazy_imports(client, monkeypatch):
+    def report(module):
+        assert not qsar._lazy_import_lock.locked()
+        return {"module": module}
+
+    monkeypatch.setattr(qsar, "import_time_report", report)
+    monkeypatch.setattr(qsar, "_import_time_cache", {})
+    plain = client.get("/api/admin/startup")
+    assert plain.status_code == 200
+    assert "importtime" not in plain.get_json()
+    measured = client.get("/api/admin/startup?importtime=1").get_json()
+    assert measured["importtime"] == {"module": "app"}
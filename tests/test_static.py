@@ -0,0 +1,72 @@
+import gzip
+import os
+
+import pytest
+
+from conftest import qsar
+
+SCRIPT = "console.log('QSAR LLM');\n" * 100
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    (tmp_path / "app.js").write_text(SCRIPT)
+    (tmp_path / "tiny.css").write_text("body{}")
+    monkeypatch.setattr(qsar, "STATIC_DIR", str(tmp_path))
+    monkeypatch.setattr(qsar, "_static_assets", {})
+    return tmp_path
+
+
+def test_compressed_variant_with_strong_etag(client, static_dir):
+    response = client.get("/static/app.js", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert gzip.decompress(response.data).decode() == SCRIPT
+    assert response.headers["ETag"].endswith('-gzip"')
+
+    plain = client.get("/static/app.js", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.get_data(as_text=True) == SCRIPT
+
+
+def test_current_copies_are_revalidated_with_304(client, static_dir):
+    etag = client.get("/static/app.js", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    cached = client.get("/static/app.js", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    (static_dir / "app.js").write_text(SCRIPT + "// v2\n")
+    os.utime(static_dir / "app.js", ns=(1, 1))
+    changed = client.get("/static/app.js", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_versioned_urls_are_immutable(client, static_dir):
+    version = client.get("/static/app.js").headers["ETag"].strip('"')
+    assert "immutable" in client.get(f"/static/app.js?v={version}").headers["Cache-Control"]
+    assert client.get("/static/app.js?v=stale").headers["Cache-Control"] == "no-cache"
+
+
+def test_small_files_are_not_compressed(client, static_dir):
+    response = client.get("/static/tiny.css", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.mimetype == "text/css"
+
+
+@pytest.mark.parametrize("path", ["/static/../app.py", "/static/%2e%2e/app.py", "/static/missing.js", "/.env"])
+def test_files_outside_static_are_never_served(client, static_dir, path):
+    assert client.get(path).status_code == 404
+
+
+def test_index_is_served(client):
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.mimetype == "text/html"
+
+
+def test_accept_encoding_parsing():
+    assert qsar.accepted_encodings("br;q=0, gzip;q=0.5, identity") == {"gzip", "identity"}
+    assert qsar.accepted_encodings("*") == set(qsar.STATIC_ENCODINGS)
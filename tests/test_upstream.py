@@ -0,0 +1,18 @@
+from conftest import qsar, upstream_client
+
+
+def test_requests_reuse_one_pooled_connection(upstream):
+    upstream.routes["/version"] = (200, {"version": "4.8"})
+    client = upstream_client(upstream.url)
+    for _ in range(3):
+        assert client.get("version").json() == {"version": "4.8"}
+    stats = client.stats()
+    assert (stats["requests"], stats["pool_misses"], stats["pool_hits"]) == (3, 1, 2)
+
+
+def test_each_worker_process_gets_its_own_session(upstream, monkeypatch):
+    client = upstream_client(upstream.url)
+    session = client.session
+    assert client.session is session
+    monkeypatch.setattr(qsar.os, "getpid", lambda: -1)   # as seen from a forked worker
+    assert client.session is not session
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from conftest import qsar
+
+
+@pytest.fixture
+def warmer(tmp_path, monkeypatch):
+    path = tmp_path / "watchlist.txt"
+    path.write_text("# portafolio\n1071-83-6, glifosato\n2921-88-2\n50-00-1\n1071-83-6\n")
+    calls, fetches = [], []
+    payload = {"test": tmp_path.name}   # keys of its own in the shared test lookup cache
+
+    def analysis(cas, options, executor=None):
+        calls.append((cas, options, executor))
+        qsar.lookup_cache.get_or_compute("category", cas, lambda: fetches.append(cas) or {"cas": cas}, payload)
+        return {"stages": {"toolbox_data": "ok", "profiling": "partial" if cas == "2921-88-2" else "ok"}}
+
+    monkeypatch.setattr(qsar, "run_toolbox_analysis", analysis)
+    monkeypatch.setattr(qsar.lookup_cache, "refresh_toolbox_version", lambda: None)
+    warmer = qsar.WatchlistWarmer(str(path), str(tmp_path / "state.sqlite3"), interval=3600,
+                                  concurrency=2, startup_delay=0)
+    warmer.calls, warmer.fetches, warmer.payload = calls, fetches, payload
+    return warmer
+
+
+def test_read_watchlist_normalizes_and_reports_invalid(warmer):
+    assert qsar.read_watchlist(warmer.path) == (["1071-83-6", "2921-88-2"], ["50-00-1"])
+
+
+def test_run_warms_every_substance_on_its_own_pool(warmer):
+    report = warmer.run()
+    assert report["substances"] == 2
+    assert (report["warm"], report["partial"]) == (1, 1)
+    assert {cas for cas, _, _ in warmer.calls} == {"1071-83-6", "2921-88-2"}
+    assert all(options == qsar.WATCHLIST_OPTIONS for _, options, _ in warmer.calls)
+    executors = {executor for _, _, executor in warmer.calls}
+    assert None not in executors and qsar._analysis_executor not in executors
+
+
+def test_recent_run_is_not_repeated_unless_forced(warmer):
+    warmer.run()
+    assert warmer.run() is None
+    assert warmer.run(force=True)["substances"] == 2
+    assert len(warmer.calls) == 4
+
+
+def test_coverage(warmer):
+    assert warmer.stats()["coverage"]["pending"] == 2
+    warmer.run()
+    stats = warmer.stats(details=True)
+    assert stats["coverage"]["warm"] == 1
+    assert stats["coverage"]["partial"] == 1
+    assert stats["coverage"]["ratio"] == 0.5
+    assert stats["last_run"]["progress"] == "2/2"
+    assert [d["state"] for d in stats["details"]] == ["warm", "partial"]
+
+
+def test_runs_refetch_cached_entries(warmer):
+    warmer.run()
+    warmer.run(force=True)
+    assert sorted(warmer.fetches) == ["1071-83-6", "1071-83-6", "2921-88-2", "2921-88-2"]
+
+    warmer.refresh = False
+    warmer.run(force=True)
+    assert len(warmer.fetches) == 4
+    assert warmer.stats()["coverage"]["warm"] == 1
+
+
+def test_coverage_follows_the_cached_entries(warmer):
+    warmer.run()
+    key = qsar.lookup_cache.make_key("category", "1071-83-6", warmer.payload)
+    db = qsar.lookup_cache._db()
+    db.execute("UPDATE entries SET expires = 1 WHERE key = ?", (key,))
+    db.commit()
+    details = warmer.stats(details=True)["details"]
+    assert [d["state"] for d in details] == ["stale", "partial"]
+    assert details[0]["expires"] is None and details[1]["expires"]
+
+    warmer.run(force=True)
+    assert warmer.stats()["coverage"]["warm"] == 1
+
+
+def test_recording_follows_stage_threads(monkeypatch):
+    monkeypatch.setattr(qsar.lookup_cache, "refresh_toolbox_version", lambda: None)
+    with qsar.lookup_cache.recording(refresh=True) as keys:
+        assert qsar.lookup_cache.refreshing
+        qsar.run_stages({"a": lambda: qsar.lookup_cache.store("category", "64-17-5", {"x": 1}, {"t": "stages"})}, 5)
+        assert qsar.lookup_cache.lookup("category", "64-17-5", {"t": "stages"}) is None
+    assert keys == [qsar.lookup_cache.make_key("category", "64-17-5", {"t": "stages"})]
+    assert not qsar.lookup_cache.refreshing
+    assert qsar.lookup_cache.lookup("category", "64-17-5", {"t": "stages"}) == {"x": 1}
+
+
+def test_summary_is_reused_between_status_calls(warmer, monkeypatch):
+    computed = []
+    stats = warmer.stats
+    monkeypatch.setattr(warmer, "stats", lambda details=False: computed.append(details) or stats(details))
+    first = warmer.summary()
+    assert warmer.summary() is first
+    assert computed == [False]
+    monkeypatch.setattr(qsar, "WATCHLIST_SUMMARY_TTL", -1)
+    warmer.summary()
+    assert computed == [False, False]
+
+
+def test_watchlist_file_is_reread_only_when_it_changes(warmer, monkeypatch):
+    reads = []
+    read = qsar.read_watchlist
+    monkeypatch.setattr(qsar, "read_watchlist", lambda path: reads.append(path) or read(path))
+    warmer.substances()
+    warmer.substances()
+    assert len(reads) == 1
+    with open(warmer.path, "a") as f:
+        f.write("64-17-5\n")
+    os.utime(warmer.path, (1, 1))
+    assert "64-17-5" in warmer.substances()[0]
+    assert len(reads) == 2